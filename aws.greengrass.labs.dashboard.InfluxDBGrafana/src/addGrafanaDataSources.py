@@ -1,10 +1,17 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: Apache-2.0
 
+import hashlib
 import json
 import logging
 import os
+import time
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import renderDashboard
 
 TIMEOUT = 10
 logging.basicConfig(level=logging.INFO)
@@ -23,6 +30,19 @@ DATA_SOURCE_JSONDATA_VERSION = "Flux"
 INFLUXDB_CONTAINER_PORT = 8086
 INFLUXDB_CERT_RELATIVE_PATH = "influxdb2_certs/influxdb.crt"
 INFLUXDB_KEY_RELATIVE_PATH = "influxdb2_certs/influxdb.key"
+# Content hashes of everything pushed to Grafana are kept here so that restarts can skip unchanged uploads
+PROVISIONING_STATE_FILE = "grafana_provisioning_state.json"
+# Grafana may still be starting up when this component runs, so poll its health endpoint with backoff
+GRAFANA_READY_RETRIES = 10
+GRAFANA_READY_INITIAL_BACKOFF = 1
+GRAFANA_READY_MAX_BACKOFF = 30
+# Transient failures on individual requests are retried by the pooled session itself
+HTTP_RETRIES = 3
+HTTP_RETRY_BACKOFF_FACTOR = 0.5
+HTTP_RETRY_STATUS_CODES = (502, 503, 504)
+# A create that succeeded behind a gateway error would be replayed as a duplicate, so only idempotent requests retry
+HTTP_RETRY_METHODS = frozenset(["GET", "PUT"])
+HTTP_POOL_SIZE = 4
 
 
 def create_influxdb_datasource_config(influxdb_parameters, cert, key) -> dict:
@@ -85,52 +105,213 @@ def create_influxdb_datasource_config(influxdb_parameters, cert, key) -> dict:
     return data
 
 
-def create_and_add_datasource_to_grafana(url, data, tls_verify):
+def content_hash(data) -> str:
     """
+    Compute a stable hash of a JSON-serializable object, independent of key ordering.
 
-    :param url: The Grafana URL to send requests to.
-    :param data: The datasource JSON to add.
-    :param tls_verify: Use TLS verify or not.
-    :return:
+    :param data: The JSON-serializable object to hash.
+    :return: The hex encoded SHA-256 digest.
     """
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
 
-    logging.info("Adding generated datasource to Grafana")
-    response = requests.post(url=url, headers=headers, data=json.dumps(data), verify=tls_verify)
-    if response.status_code != 200:
-        logging.error("Request to add datasource request to Grafana failed with status code {}! "
-                      "Check the aws.greengrass.labs.dashboard.Grafana log to investigate."
-                      .format(response.status_code))
-        exit(1)
 
+def load_provisioning_state(state_path) -> dict:
+    """
 
-def influxdb_datasource_exists(grafana_server_protocol, username, password, grafana_port,
-                               tls_verify):
+    :param state_path: The path of the provisioning state file.
+    :return: The previously stored content hashes, or an empty dict if there are none.
     """
+    try:
+        with open(state_path) as f:
+            state = json.load(f)
+        if isinstance(state, dict):
+            return state
+        logging.warning("Ignoring malformed Grafana provisioning state at {}".format(state_path))
+    except FileNotFoundError:
+        pass
+    except ValueError:
+        logging.warning("Ignoring unreadable Grafana provisioning state at {}".format(state_path))
+    return {}
 
-    :param grafana_server_protocol: HTTP or HTTPS
-    :param username: The retrieved Grafana username
-    :param password: The retrieved Grafana password
-    :param grafana_port: The Grafana port
-    :param tls_verify: Use TLS verify or not.
+
+def save_provisioning_state(state_path, state) -> None:
+    """
+    Atomically persist the provisioning state so an interrupted write never leaves a truncated file.
+
+    :param state_path: The path of the provisioning state file.
+    :param state: The content hashes to store.
     :return:
     """
-    url = '{}://{}:{}@localhost:{}/api/datasources/name/{}' \
-        .format(grafana_server_protocol, username, password, grafana_port, DATA_SOURCE_NAME)
-    response = requests.get(url=url, headers=headers, verify=tls_verify)
-    logging.info("Grafana response status code: {}".format(response.status_code))
-    if response.status_code == 200:
+    tmp_path = "{}.tmp".format(state_path)
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, state_path)
+
+
+def create_grafana_session(tls_verify) -> requests.Session:
+    """
+    Create a pooled HTTP session that retries transient failures. Credentials are attached once they have been
+    retrieved, so the session can already be used to wait for Grafana to start.
+
+    :param tls_verify: Use TLS verify or not.
+    :return: session: The configured requests session.
+    """
+    retry_options = {
+        "total": HTTP_RETRIES,
+        "backoff_factor": HTTP_RETRY_BACKOFF_FACTOR,
+        "status_forcelist": HTTP_RETRY_STATUS_CODES,
+    }
+    try:
+        retry = Retry(allowed_methods=HTTP_RETRY_METHODS, **retry_options)
+    except TypeError:
+        # urllib3 before 1.26 calls it method_whitelist
+        retry = Retry(method_whitelist=HTTP_RETRY_METHODS, **retry_options)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update(headers)
+    session.verify = tls_verify
+    return session
+
+
+class GrafanaProvisioner:
+    def __init__(self, session, grafana_server_protocol, grafana_port, state_path):
+        """
+
+        :param session: The pooled session used for every Grafana request.
+        :param grafana_server_protocol: HTTP or HTTPS
+        :param grafana_port: The Grafana port
+        :param state_path: The path of the provisioning state file.
+        """
+        self.session = session
+        self.base_url = "{}://localhost:{}".format(grafana_server_protocol, grafana_port)
+        self.state_path = state_path
+        self.state = load_provisioning_state(state_path)
+
+    def wait_until_ready(self, retries=GRAFANA_READY_RETRIES) -> None:
+        """
+        Poll the Grafana health endpoint with exponential backoff until it reports that it is up.
+
+        :param retries: The number of health checks to make before giving up.
+        :return:
+        """
+        backoff = GRAFANA_READY_INITIAL_BACKOFF
+        for attempt in range(retries):
+            try:
+                response = self.session.get(url="{}/api/health".format(self.base_url), timeout=TIMEOUT)
+                if response.status_code == 200:
+                    logging.info("Grafana is ready after {} health check(s)".format(attempt + 1))
+                    return
+                logging.info("Grafana health check returned status code {}".format(response.status_code))
+            except requests.exceptions.RequestException:
+                logging.info("Grafana is not reachable yet")
+            logging.info("Waiting {} seconds for Grafana to start...".format(backoff))
+            time.sleep(backoff)
+            backoff = min(backoff * 2, GRAFANA_READY_MAX_BACKOFF)
+        raise TimeoutError("Grafana did not become ready after {} health checks! "
+                           "Check the aws.greengrass.labs.dashboard.Grafana log to investigate.".format(retries))
+
+    def get_datasource(self, name=DATA_SOURCE_NAME):
+        """
+
+        :param name: The name of the datasource to look up.
+        :return: The datasource JSON, or None if it does not exist.
+        """
+        response = self.session.get(url="{}/api/datasources/name/{}".format(self.base_url, name), timeout=TIMEOUT)
+        if response.status_code == 200:
+            return response.json()
+        if response.status_code == 404:
+            return None
+        raise requests.HTTPError("Grafana returned status code {} while looking up datasource {}"
+                                 .format(response.status_code, name), response=response)
+
+    def upsert_datasource(self, config) -> dict:
+        """
+        Create the datasource, or update it in place when its content differs from what was last provisioned.
+
+        :param config: The datasource JSON to provision.
+        :return: datasource: The datasource as stored in Grafana.
+        """
+        config_hash = content_hash(config)
+        existing = self.get_datasource(config["name"])
+
+        if existing is not None and self.state.get("datasource") == config_hash:
+            logging.info("InfluxDB datasource is already up to date, skipping")
+            return existing
+
+        if existing is None:
+            logging.info("Adding generated datasource to Grafana")
+            response = self.session.post(url="{}/api/datasources".format(self.base_url),
+                                         data=json.dumps(config), timeout=TIMEOUT)
+        else:
+            logging.info("Updating changed datasource in Grafana")
+            response = self.session.put(url="{}/api/datasources/{}".format(self.base_url, existing["id"]),
+                                        data=json.dumps(config), timeout=TIMEOUT)
+        if response.status_code != 200:
+            raise requests.HTTPError("Request to provision datasource in Grafana failed with status code {}! "
+                                     "Check the aws.greengrass.labs.dashboard.Grafana log to investigate."
+                                     .format(response.status_code), response=response)
+
+        self.record("datasource", config_hash)
+        return response.json().get("datasource", existing or {})
+
+    def import_dashboard(self, dashboard) -> bool:
+        """
+        Import a dashboard unless the same rendered content has already been provisioned and is still present.
+
+        :param dashboard: The rendered dashboard JSON model to import.
+        :return: True if the dashboard was uploaded, False if it was unchanged.
+        """
+        dashboard_hash = content_hash(dashboard)
+        uid = dashboard.get("uid")
+        if uid and self.state.get("dashboard") == dashboard_hash:
+            response = self.session.get(url="{}/api/dashboards/uid/{}".format(self.base_url, uid), timeout=TIMEOUT)
+            if response.status_code == 200:
+                logging.info("Dashboard {} is already up to date, skipping".format(uid))
+                return False
+
+        response = self.session.post(url="{}/api/dashboards/db".format(self.base_url),
+                                     data=json.dumps({"dashboard": dashboard, "overwrite": True}), timeout=TIMEOUT)
+        if response.status_code != 200:
+            raise requests.HTTPError("Request to import dashboard into Grafana failed with status code {}! "
+                                     "Check the aws.greengrass.labs.dashboard.Grafana log to investigate."
+                                     .format(response.status_code), response=response)
+
+        self.record("dashboard", dashboard_hash)
+        logging.info("Dashboard {} successfully imported into Grafana!".format(uid))
         return True
-    elif response.status_code == 404:
-        logging.info("No InfluxDB data source exists in Grafana. Creating one now...")
-        return False
-    else:
-        logging.warning("Grafana has returned the response code {}. InfluxDB may not have been set up"
-                        " or configured correctly.".format(response.status_code))
-        return False
+
+    def record(self, key, value) -> None:
+        """
+
+        :param key: The provisioned resource.
+        :param value: The content hash that was provisioned.
+        :return:
+        """
+        self.state[key] = value
+        save_provisioning_state(self.state_path, self.state)
+
+
+def read_influxdb_certs(mount_path):
+    """
+
+    :param mount_path: The InfluxDB mount path.
+    :return: cert, key: The InfluxDB cert and key for HTTPS.
+    """
+    logging.info("Retrieving InfluxDB cert and key from mount path...")
+    with open(os.path.join(mount_path, INFLUXDB_CERT_RELATIVE_PATH)) as f:
+        cert = f.read()
+    with open(os.path.join(mount_path, INFLUXDB_KEY_RELATIVE_PATH)) as f:
+        key = f.read()
+    if len(cert) == 0 or len(key) == 0:
+        raise ValueError("Retrieved Grafana certs are empty!")
+    return cert, key
 
 
 def add_influxdb_datasource_to_grafana(mount_path, grafana_secrets, influxdb_parameters, grafana_port,
-                                       grafana_server_protocol, tls_verify):
+                                       grafana_server_protocol, tls_verify, work_path=".", dashboard=None,
+                                       provisioner=None):
     """
 
     :param mount_path: The InfluxDB mount path.
@@ -139,7 +320,10 @@ def add_influxdb_datasource_to_grafana(mount_path, grafana_secrets, influxdb_par
     :param grafana_port: The Grafana port
     :param grafana_server_protocol:  HTTP or HTTPS
     :param tls_verify: Use TLS verify or not.
-    :return:
+    :param work_path: The directory in which the provisioning state is kept.
+    :param dashboard: An optional exported dashboard JSON model to bind to the datasource and import.
+    :param provisioner: A GrafanaProvisioner that has already waited for Grafana to be ready.
+    :return: datasource: The datasource as stored in Grafana.
     """
 
     if not tls_verify:
@@ -147,34 +331,27 @@ def add_influxdb_datasource_to_grafana(mount_path, grafana_secrets, influxdb_par
         # Necessary to suppress warning for self-signed certs
         urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-    username = grafana_secrets["grafana_username"]
-    password = grafana_secrets["grafana_password"]
-
     try:
+        if provisioner is None:
+            provisioner = GrafanaProvisioner(create_grafana_session(tls_verify), grafana_server_protocol,
+                                             grafana_port, os.path.join(work_path, PROVISIONING_STATE_FILE))
+            provisioner.wait_until_ready()
+        provisioner.session.auth = (grafana_secrets["grafana_username"], grafana_secrets["grafana_password"])
 
-        # Check if the InfluxDB data source is already present
-        if not influxdb_datasource_exists(grafana_server_protocol, username, password, grafana_port, tls_verify):
-            logging.info("No InfluxDB data source found, creating a new one...")
-            cert = key = ""
-
-            # If using HTTPS, load in the cert and key
-            if influxdb_parameters['InfluxDBServerProtocol'] == HTTPS_SERVER_PROTOCOL:
-                logging.info("Retrieving InfluxDB cert and key from mount path...")
-                with open(os.path.join(mount_path, INFLUXDB_CERT_RELATIVE_PATH)) as f:
-                    cert = f.read()
-                with open(os.path.join(mount_path, INFLUXDB_KEY_RELATIVE_PATH)) as f:
-                    key = f.read()
-                if len(cert) == 0 or len(key) == 0:
-                    raise ValueError("Retrieved Grafana certs are empty!")
-
-            config = create_influxdb_datasource_config(influxdb_parameters, cert, key)
-            url = '{}://{}:{}@localhost:{}/api/datasources' \
-                .format(grafana_server_protocol, username, password, grafana_port)
-            create_and_add_datasource_to_grafana(url, config, tls_verify)
-            logging.info("InfluxDB datasource successfully added to Grafana!")
-        else:
-            logging.info("InfluxDB data source is already present, exiting...")
-            exit(0)
+        cert = key = ""
+        # If using HTTPS, load in the cert and key
+        if influxdb_parameters['InfluxDBServerProtocol'] == HTTPS_SERVER_PROTOCOL:
+            cert, key = read_influxdb_certs(mount_path)
+
+        config = create_influxdb_datasource_config(influxdb_parameters, cert, key)
+        datasource = provisioner.upsert_datasource(config)
+        logging.info("InfluxDB datasource successfully provisioned in Grafana!")
+
+        if dashboard is not None:
+            provisioner.import_dashboard(renderDashboard.render_dashboard(
+                dashboard, datasource.get("uid", DATA_SOURCE_NAME), influxdb_parameters['InfluxDBBucket'],
+                influxdb_parameters.get('InfluxDBDownsamplingBuckets')))
+        return datasource
     except Exception as e:
         logging.error('Exception occurred when adding InfluxDB datasource to Grafana.', exc_info=True)
         raise e
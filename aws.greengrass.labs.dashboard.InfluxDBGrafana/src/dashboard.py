@@ -1,8 +1,11 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: Apache-2.0
 
+import concurrent.futures
+import json
 import logging
 import argparse
+import os
 
 import retrieveInfluxDBParams
 import retrieveGrafanaSecrets
@@ -25,24 +28,65 @@ def parse_arguments() -> argparse.Namespace:
     parser.add_argument('--skip_tls_verify', type=str, required=True)
     parser.add_argument('--grafana_port', type=str, required=True)
     parser.add_argument('--grafana_server_protocol', type=str, required=True)
+    parser.add_argument('--work_path', type=str, default=".")
+    parser.add_argument('--dashboard_path', type=str, default="")
     return parser.parse_args()
 
 
+def load_dashboard(dashboard_path):
+    """
+    Load the dashboard JSON model to import, if one was configured.
+
+    :param dashboard_path: The path to the dashboard JSON model.
+    :return: The dashboard JSON, or None if no path was given.
+    """
+    if not dashboard_path:
+        return None
+    with open(dashboard_path) as f:
+        return json.load(f)
+
+
+def provision(args) -> None:
+    """
+    Retrieve the Grafana secrets and InfluxDB parameters while waiting for Grafana to start, then provision
+    the datasource and dashboard.
+
+    :param args: Parsed arguments
+    :return:
+    """
+    tls_verify = not (args.skip_tls_verify == 'true')
+    dashboard = load_dashboard(args.dashboard_path)
+    provisioner = addGrafanaDataSources.GrafanaProvisioner(
+        addGrafanaDataSources.create_grafana_session(tls_verify),
+        args.grafana_server_protocol,
+        args.grafana_port,
+        os.path.join(args.work_path, addGrafanaDataSources.PROVISIONING_STATE_FILE))
+
+    # None of these depend on each other, and each one spends most of its time waiting
+    with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+        secrets_future = executor.submit(retrieveGrafanaSecrets.retrieve_secret, args.grafana_secret_arn)
+        params_future = executor.submit(retrieveInfluxDBParams.retrieve_influxdb_params,
+                                        args.publish_topic, args.subscribe_topic)
+        ready_future = executor.submit(provisioner.wait_until_ready)
+        grafana_secrets = secrets_future.result()
+        influxdb_parameters = params_future.result()
+        ready_future.result()
+
+    addGrafanaDataSources.add_influxdb_datasource_to_grafana(
+        args.mount_path,
+        grafana_secrets,
+        influxdb_parameters,
+        args.grafana_port,
+        args.grafana_server_protocol,
+        tls_verify,
+        dashboard=dashboard,
+        provisioner=provisioner)
+
+
 if __name__ == "__main__":
 
     try:
-        args = parse_arguments()
-        tls_verify = not (args.skip_tls_verify == 'true')
-
-        grafana_secrets = retrieveGrafanaSecrets.retrieve_secret(args.grafana_secret_arn)
-        influxdb_parameters = retrieveInfluxDBParams.retrieve_influxdb_params(args.publish_topic, args.subscribe_topic)
-        addGrafanaDataSources.add_influxdb_datasource_to_grafana(
-            args.mount_path,
-            grafana_secrets,
-            influxdb_parameters,
-            args.grafana_port,
-            args.grafana_server_protocol,
-            tls_verify)
+        provision(parse_arguments())
     except Exception:
         logging.error('Exception occurred when setting up dashboard.', exc_info=True)
         exit(1)
@@ -0,0 +1,79 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import logging
+
+logging.basicConfig(level=logging.INFO)
+
+# The datasource input declared by dashboards exported from Grafana with "Export for sharing externally"
+DATASOURCE_INPUT = "DS_INFLUXDB"
+# The bucket name the bundled dashboard queries were written against
+DEFAULT_BUCKET = "greengrass-telemetry"
+# Only Grafana's manual import UI consumes these, the dashboard API rejects or ignores them
+EXPORT_ONLY_KEYS = ("__inputs", "__elements", "__requires")
+# Widest query range, in nanoseconds, served by the raw bucket and by each downsampled tier.
+# Anything wider than the last tier is served by the 1 day tier.
+RAW_MAX_RANGE_NS = 6 * 3600 * 10**9
+TIER_MAX_RANGES_NS = (("1m", 7 * 86400 * 10**9), ("1h", 90 * 86400 * 10**9))
+COARSEST_TIER = "1d"
+
+
+def substitute(value, replacements):
+    """
+    Recursively apply string replacements to every string inside a JSON value.
+
+    :param value: The JSON value to walk.
+    :param replacements: A list of (old, new) string pairs.
+    :return: A copy of the value with every replacement applied.
+    """
+    if isinstance(value, str):
+        for old, new in replacements:
+            value = value.replace(old, new)
+        return value
+    if isinstance(value, list):
+        return [substitute(v, replacements) for v in value]
+    if isinstance(value, dict):
+        return {k: substitute(v, replacements) for k, v in value.items()}
+    return value
+
+
+def tiered_bucket_expression(bucket, downsampling_buckets) -> str:
+    """
+    Build a Flux expression that picks the bucket to read from based on the width of the dashboard time range.
+
+    :param bucket: The raw InfluxDB bucket.
+    :param downsampling_buckets: The downsampled tier bucket names keyed by resolution.
+    :return: The Flux bucket expression.
+    """
+    span = "int(v: v.timeRangeStop) - int(v: v.timeRangeStart)"
+    expression = "if {} <= {} then {}".format(span, RAW_MAX_RANGE_NS, json.dumps(bucket))
+    for resolution, max_range in TIER_MAX_RANGES_NS:
+        expression += " else if {} <= {} then {}".format(span, max_range,
+                                                         json.dumps(downsampling_buckets[resolution]))
+    return expression + " else {}".format(json.dumps(downsampling_buckets[COARSEST_TIER]))
+
+
+def render_dashboard(dashboard, datasource_uid, bucket=DEFAULT_BUCKET, downsampling_buckets=None) -> dict:
+    """
+    Turn an exported dashboard into a model that can be sent to the Grafana dashboard API.
+
+    :param dashboard: The exported dashboard JSON model.
+    :param datasource_uid: The UID of the provisioned InfluxDB datasource to bind DS_INFLUXDB to.
+    :param bucket: The InfluxDB bucket the dashboard queries should read from.
+    :param downsampling_buckets: The downsampled tier buckets to read wide time ranges from, if any.
+    :return: rendered: The rendered dashboard JSON model.
+    """
+    rendered = {k: v for k, v in dashboard.items() if k not in EXPORT_ONLY_KEYS}
+    replacements = [("${{{}}}".format(DATASOURCE_INPUT), datasource_uid)]
+    if downsampling_buckets:
+        replacements.append(('from(bucket: {})'.format(json.dumps(DEFAULT_BUCKET)),
+                             'from(bucket: {})'.format(tiered_bucket_expression(bucket, downsampling_buckets))))
+    elif bucket != DEFAULT_BUCKET:
+        replacements.append(('from(bucket: {})'.format(json.dumps(DEFAULT_BUCKET)),
+                             'from(bucket: {})'.format(json.dumps(bucket))))
+    rendered = substitute(rendered, replacements)
+    # Grafana assigns its own numeric ID, the UID identifies the dashboard across imports
+    rendered["id"] = None
+    logging.info("Rendered dashboard {} for datasource {}".format(rendered.get("uid"), datasource_uid))
+    return rendered
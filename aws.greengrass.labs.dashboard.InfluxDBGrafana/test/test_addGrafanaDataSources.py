@@ -1,13 +1,14 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: Apache-2.0
 
+import json
 import pytest
 import sys
 import requests
-import src.addGrafanaDataSources as agds
 from unittest import mock
 
 sys.path.append("src")
+import src.addGrafanaDataSources as agds  # noqa: E402
 
 testInfluxDBParams = {
     'InfluxDBContainerName': 'greengrass_InfluxDB',
@@ -80,74 +81,190 @@ def test_create_http_influxdb_datasource_data():
     assert output == http_publish_json
 
 
-def test_add_valid_datasource_to_grafana(mocker):
-    testResp = requests.Response()
-    testResp.status_code = 200
-    mocker.patch('requests.post', return_value=testResp)
-    agds.create_and_add_datasource_to_grafana("https://test", "test", False)
+def make_response(status_code, body=None):
+    response = requests.Response()
+    response.status_code = status_code
+    if body is not None:
+        response._content = json.dumps(body).encode()
+    return response
 
 
-def test_add_invalid_datasource_to_grafana(mocker):
-    testResp = requests.Response()
-    testResp.status_code = 404
-    mocker.patch('requests.post', return_value=testResp)
-    with pytest.raises(SystemExit) as pytest_wrapped_e:
-        agds.create_and_add_datasource_to_grafana("https://test", "test", False)
-    assert pytest_wrapped_e.type == SystemExit
-    assert pytest_wrapped_e.value.code == 1
+def make_provisioner(tmp_path, session=None):
+    session = session or mock.Mock()
+    return agds.GrafanaProvisioner(session, "https", 3000, str(tmp_path / agds.PROVISIONING_STATE_FILE))
 
 
-def test_influxdb_datasource_exists(mocker):
-    testResp = requests.Response()
-    testResp.status_code = 200
-    mocker.patch('requests.get', return_value=testResp)
-    assert agds.influxdb_datasource_exists("https://test", "username", "password", "3000", False)
+def test_content_hash_ignores_key_order():
+    assert agds.content_hash({"a": 1, "b": 2}) == agds.content_hash({"b": 2, "a": 1})
+    assert agds.content_hash({"a": 1}) != agds.content_hash({"a": 2})
 
 
-def test_influxdb_datasource_does_not_exist(mocker):
-    testResp = requests.Response()
-    testResp.status_code = 404
-    mocker.patch('requests.get', return_value=testResp)
-    assert not agds.influxdb_datasource_exists("https://test", "username", "password", "3000", False)
+def test_provisioning_state_round_trip(tmp_path):
+    state_path = str(tmp_path / "state.json")
+    assert agds.load_provisioning_state(state_path) == {}
+    agds.save_provisioning_state(state_path, {"datasource": "abc"})
+    assert agds.load_provisioning_state(state_path) == {"datasource": "abc"}
 
 
-def test_influxdb_datasource_error(mocker):
-    testResp = requests.Response()
-    testResp.status_code = 400
-    mocker.patch('requests.get', return_value=testResp)
-    assert not agds.influxdb_datasource_exists("https://test", "username", "password", "3000", False)
+def test_malformed_provisioning_state(tmp_path):
+    state_path = tmp_path / "state.json"
+    state_path.write_text("not json")
+    assert agds.load_provisioning_state(str(state_path)) == {}
+    state_path.write_text("[]")
+    assert agds.load_provisioning_state(str(state_path)) == {}
 
 
-def test_add_existing_influxdb_datasource_to_grafana(mocker):
-    mocker.patch('src.addGrafanaDataSources.influxdb_datasource_exists', return_value=True)
-    with pytest.raises(SystemExit) as pytest_wrapped_e:
-        agds.add_influxdb_datasource_to_grafana("testPath", test_grafana_secrets, {}, 3000,
-                                                "https", False)
-    assert pytest_wrapped_e.type == SystemExit
-    assert pytest_wrapped_e.value.code == 0
+def test_create_grafana_session():
+    session = agds.create_grafana_session(False)
+    assert session.verify is False
+    assert session.headers['Content-Type'] == 'application/json'
+    adapter = session.get_adapter("https://localhost:3000")
+    assert adapter.max_retries.total == agds.HTTP_RETRIES
+    assert adapter.max_retries.is_retry("GET", 503) and adapter.max_retries.is_retry("PUT", 503)
+    assert not adapter.max_retries.is_retry("POST", 503)
 
 
-def test_add_new_influxdb_datasource_to_grafana(mocker):
+def test_wait_until_ready(tmp_path, mocker):
+    sleep = mocker.patch('time.sleep')
+    session = mock.Mock()
+    session.get.side_effect = [requests.exceptions.ConnectionError(), make_response(503), make_response(200)]
+    make_provisioner(tmp_path, session).wait_until_ready()
+    assert session.get.call_count == 3
+    assert [c.args[0] for c in sleep.call_args_list] == [1, 2]
+
+
+def test_wait_until_ready_times_out(tmp_path, mocker):
+    mocker.patch('time.sleep')
+    session = mock.Mock()
+    session.get.return_value = make_response(503)
+    with pytest.raises(TimeoutError):
+        make_provisioner(tmp_path, session).wait_until_ready(retries=3)
+    assert session.get.call_count == 3
+
+
+def test_get_datasource(tmp_path):
+    session = mock.Mock()
+    provisioner = make_provisioner(tmp_path, session)
+    session.get.return_value = make_response(200, {"id": 1})
+    assert provisioner.get_datasource() == {"id": 1}
+    session.get.return_value = make_response(404)
+    assert provisioner.get_datasource() is None
+    session.get.return_value = make_response(400)
+    with pytest.raises(requests.HTTPError):
+        provisioner.get_datasource()
+
+
+def test_upsert_creates_missing_datasource(tmp_path):
+    session = mock.Mock()
+    session.get.return_value = make_response(404)
+    session.post.return_value = make_response(200, {"datasource": {"id": 1, "uid": "abc"}})
+    provisioner = make_provisioner(tmp_path, session)
+
+    assert provisioner.upsert_datasource(http_publish_json) == {"id": 1, "uid": "abc"}
+    assert session.post.call_count == 1
+    assert provisioner.state["datasource"] == agds.content_hash(http_publish_json)
+    assert agds.load_provisioning_state(provisioner.state_path) == provisioner.state
+
+
+def test_upsert_skips_unchanged_datasource(tmp_path):
+    session = mock.Mock()
+    session.get.return_value = make_response(200, {"id": 1, "uid": "abc"})
+    provisioner = make_provisioner(tmp_path, session)
+    provisioner.state["datasource"] = agds.content_hash(http_publish_json)
+
+    assert provisioner.upsert_datasource(http_publish_json) == {"id": 1, "uid": "abc"}
+    assert not session.post.called
+    assert not session.put.called
+
+
+def test_upsert_updates_changed_datasource(tmp_path):
+    session = mock.Mock()
+    session.get.return_value = make_response(200, {"id": 7, "uid": "abc"})
+    session.put.return_value = make_response(200, {"datasource": {"id": 7, "uid": "abc"}})
+    provisioner = make_provisioner(tmp_path, session)
+    provisioner.state["datasource"] = "stale"
+
+    provisioner.upsert_datasource(http_publish_json)
+    assert session.put.call_args.kwargs["url"] == "https://localhost:3000/api/datasources/7"
+    assert not session.post.called
+
+
+def test_upsert_datasource_failure(tmp_path):
+    session = mock.Mock()
+    session.get.return_value = make_response(404)
+    session.post.return_value = make_response(500)
+    provisioner = make_provisioner(tmp_path, session)
+
+    with pytest.raises(requests.HTTPError):
+        provisioner.upsert_datasource(http_publish_json)
+    assert "datasource" not in provisioner.state
+
+
+def test_import_dashboard(tmp_path):
+    dashboard = {"uid": "abc", "title": "test"}
+    session = mock.Mock()
+    session.post.return_value = make_response(200, {"status": "success"})
+    provisioner = make_provisioner(tmp_path, session)
+
+    assert provisioner.import_dashboard(dashboard)
+    assert json.loads(session.post.call_args.kwargs["data"]) == {"dashboard": dashboard, "overwrite": True}
+
+    # Unchanged content that is still present in Grafana is not sent again
+    session.get.return_value = make_response(200)
+    assert not provisioner.import_dashboard(dashboard)
+    assert session.post.call_count == 1
+
+    # Unless it was deleted from Grafana in the meantime
+    session.get.return_value = make_response(404)
+    assert provisioner.import_dashboard(dashboard)
+    assert session.post.call_count == 2
+
+
+def test_import_dashboard_failure(tmp_path):
+    session = mock.Mock()
+    session.post.return_value = make_response(412)
+    with pytest.raises(requests.HTTPError):
+        make_provisioner(tmp_path, session).import_dashboard({"uid": "abc"})
+
+
+def test_add_new_influxdb_datasource_to_grafana(tmp_path, mocker):
     testInfluxDBParams['InfluxDBServerProtocol'] = 'https'
-    testResp = requests.Response()
-    testResp.status_code = 200
-    mocker.patch('requests.post', return_value=testResp)
-    mocker.patch('src.addGrafanaDataSources.influxdb_datasource_exists', return_value=False)
+    provisioner = make_provisioner(tmp_path)
+    provisioner.upsert_datasource = mock.Mock(return_value={"uid": "abc"})
+    provisioner.import_dashboard = mock.Mock()
 
     my_text = "mock text"
     mocked_open_function = mock.mock_open(read_data=my_text)
 
     with mock.patch("builtins.open", mocked_open_function):
-        agds.add_influxdb_datasource_to_grafana("testPath", test_grafana_secrets, testInfluxDBParams, 3000,
-                                                "https", False)
+        datasource = agds.add_influxdb_datasource_to_grafana("testPath", test_grafana_secrets, testInfluxDBParams,
+                                                             3000, "https", False, dashboard={"uid": "d"},
+                                                             provisioner=provisioner)
+
+    assert datasource == {"uid": "abc"}
+    assert provisioner.session.auth == ("username", "password")
+    config = provisioner.upsert_datasource.call_args.args[0]
+    assert config["secureJsonData"]["tlsClientCert"] == my_text
+    imported = provisioner.import_dashboard.call_args.args[0]
+    assert imported["uid"] == "d"
+    assert imported["id"] is None
+
+
+def test_add_influxdb_datasource_waits_for_grafana(tmp_path, mocker):
+    testInfluxDBParams['InfluxDBServerProtocol'] = 'http'
+    wait = mocker.patch('src.addGrafanaDataSources.GrafanaProvisioner.wait_until_ready')
+    upsert = mocker.patch('src.addGrafanaDataSources.GrafanaProvisioner.upsert_datasource', return_value={})
+
+    agds.add_influxdb_datasource_to_grafana("testPath", test_grafana_secrets, testInfluxDBParams, 3000, "http",
+                                            True, work_path=str(tmp_path))
+    assert wait.call_count == 1
+    assert upsert.call_count == 1
 
 
-def test_invalid_grafana_certs(mocker):
+def test_invalid_grafana_certs(tmp_path, mocker):
     testInfluxDBParams['InfluxDBServerProtocol'] = 'https'
-    testResp = requests.Response()
-    testResp.status_code = 200
-    mocker.patch('requests.post', return_value=testResp)
-    datasource_exists_mocker = mocker.patch('src.addGrafanaDataSources.influxdb_datasource_exists', return_value=False)
+    provisioner = make_provisioner(tmp_path)
+    provisioner.upsert_datasource = mock.Mock()
 
     my_text = ""
     mocked_open_function = mock.mock_open(read_data=my_text)
@@ -155,9 +272,9 @@ def test_invalid_grafana_certs(mocker):
     with mock.patch("builtins.open", mocked_open_function):
         with pytest.raises(ValueError, match='Retrieved Grafana certs are empty'):
             agds.add_influxdb_datasource_to_grafana("testPath", test_grafana_secrets, testInfluxDBParams, 3000, "https",
-                                                    False)
+                                                    False, provisioner=provisioner)
 
-    assert datasource_exists_mocker.call_count == 1
+    assert not provisioner.upsert_datasource.called
 
 
 def test_invalid_influxdb_server_protocol():
@@ -40,3 +40,56 @@ def test_parse_no_args(mocker):
     with pytest.raises(SystemExit) as pytest_wrapped_e:
         dashboard.parse_arguments()
     assert pytest_wrapped_e.type == SystemExit
+
+
+def test_load_dashboard(tmp_path):
+    import src.dashboard as dashboard
+
+    assert dashboard.load_dashboard("") is None
+    dashboard_path = tmp_path / "dashboard.json"
+    dashboard_path.write_text('{"uid": "abc"}')
+    assert dashboard.load_dashboard(str(dashboard_path)) == {"uid": "abc"}
+
+
+def test_provision(mocker):
+    import src.dashboard as dashboard
+
+    secrets = mocker.patch("retrieveGrafanaSecrets.retrieve_secret", return_value={"grafana_username": "u"})
+    params = mocker.patch("retrieveInfluxDBParams.retrieve_influxdb_params", return_value={"InfluxDBOrg": "o"})
+    wait = mocker.patch("addGrafanaDataSources.GrafanaProvisioner.wait_until_ready")
+    add = mocker.patch("addGrafanaDataSources.add_influxdb_datasource_to_grafana")
+
+    dashboard.provision(argparse.Namespace(
+        subscribe_topic="test/subscribe",
+        publish_topic="test/publish",
+        mount_path="test_path",
+        grafana_secret_arn="testarn",
+        grafana_port="3000",
+        grafana_server_protocol="https",
+        skip_tls_verify="true",
+        work_path=".",
+        dashboard_path=""
+    ))
+
+    secrets.assert_called_once_with("testarn")
+    params.assert_called_once_with("test/publish", "test/subscribe")
+    assert wait.call_count == 1
+    assert add.call_args.args[1] == {"grafana_username": "u"}
+    assert add.call_args.args[2] == {"InfluxDBOrg": "o"}
+    assert add.call_args.kwargs["dashboard"] is None
+
+
+def test_provision_propagates_failures(mocker):
+    import src.dashboard as dashboard
+
+    mocker.patch("retrieveGrafanaSecrets.retrieve_secret", side_effect=ValueError("test"))
+    mocker.patch("retrieveInfluxDBParams.retrieve_influxdb_params")
+    mocker.patch("addGrafanaDataSources.GrafanaProvisioner.wait_until_ready")
+    add = mocker.patch("addGrafanaDataSources.add_influxdb_datasource_to_grafana")
+
+    with pytest.raises(ValueError, match="test"):
+        dashboard.provision(argparse.Namespace(
+            grafana_secret_arn="testarn", publish_topic="p", subscribe_topic="s", skip_tls_verify="false",
+            grafana_server_protocol="https", grafana_port="3000", work_path=".", dashboard_path="",
+            mount_path="test_path"))
+    assert not add.called
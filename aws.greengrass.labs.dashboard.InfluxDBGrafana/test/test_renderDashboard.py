@@ -0,0 +1,69 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import os
+import sys
+
+import src.renderDashboard as rd
+
+sys.path.append("src/")
+
+BUNDLED_DASHBOARD = os.path.join(os.path.dirname(__file__), "..", "dashboards",
+                                 "greengrass-telemetry-dashboard-influxdb.json")
+
+test_dashboard = {
+    "__inputs": [{"name": "DS_INFLUXDB", "type": "datasource"}],
+    "__requires": [],
+    "id": 4,
+    "uid": "abc",
+    "panels": [
+        {
+            "datasource": {"type": "influxdb", "uid": "${DS_INFLUXDB}"},
+            "targets": [{"query": 'from(bucket: "greengrass-telemetry")\n  |> range(start: v.timeRangeStart)'}]
+        }
+    ]
+}
+
+
+def test_render_binds_datasource():
+    rendered = rd.render_dashboard(test_dashboard, "influx-uid")
+    assert rendered["panels"][0]["datasource"]["uid"] == "influx-uid"
+    assert rendered["panels"][0]["targets"][0]["query"] == test_dashboard["panels"][0]["targets"][0]["query"]
+    assert rendered["id"] is None
+    assert rendered["uid"] == "abc"
+    assert "__inputs" not in rendered and "__requires" not in rendered
+
+
+def test_render_rewrites_bucket():
+    rendered = rd.render_dashboard(test_dashboard, "influx-uid", "other-bucket")
+    assert rendered["panels"][0]["targets"][0]["query"].startswith('from(bucket: "other-bucket")')
+
+
+def test_render_reads_downsampled_tiers():
+    tiers = {"1m": "b-1m", "1h": "b-1h", "1d": "b-1d"}
+    rendered = rd.render_dashboard(test_dashboard, "influx-uid", "b", tiers)
+    query = rendered["panels"][0]["targets"][0]["query"]
+    assert query.startswith("from(bucket: if int(v: v.timeRangeStop) - int(v: v.timeRangeStart) <= ")
+    assert query.index('"b"') < query.index('"b-1m"') < query.index('"b-1h"') < query.index('"b-1d"')
+    assert "|> range(start: v.timeRangeStart)" in query
+
+
+def test_tiered_bucket_expression():
+    expression = rd.tiered_bucket_expression("b", {"1m": "b-1m", "1h": "b-1h", "1d": "b-1d"})
+    assert expression.endswith('else "b-1d"')
+    assert "<= {} then \"b\"".format(rd.RAW_MAX_RANGE_NS) in expression
+
+
+def test_render_does_not_modify_input():
+    original = json.dumps(test_dashboard, sort_keys=True)
+    rd.render_dashboard(test_dashboard, "influx-uid", "other-bucket")
+    assert json.dumps(test_dashboard, sort_keys=True) == original
+
+
+def test_render_bundled_dashboard():
+    with open(BUNDLED_DASHBOARD) as f:
+        dashboard = json.load(f)
+    rendered = json.dumps(rd.render_dashboard(dashboard, "influx-uid"))
+    assert "${DS_INFLUXDB}" not in rendered
+    assert "influx-uid" in rendered
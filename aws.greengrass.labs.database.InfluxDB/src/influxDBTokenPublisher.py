@@ -2,7 +2,6 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import concurrent.futures
-import time
 import json
 import subprocess
 import logging
@@ -16,12 +15,15 @@ from awsiot.greengrasscoreipc.model import (
     UnauthorizedError
 )
 from influxDBTokenStreamHandler import InfluxDBTokenStreamHandler
+import lifecycle
 
 logging.basicConfig(level=logging.INFO)
 TIMEOUT = 10
 # Influx commands need to be given the port of InfluxDB inside the container, which is always 8086 unless
 # overridden inside the InfluxDB config
 INFLUX_CONTAINER_PORT = 8086
+# Resolutions of the optional downsampling tiers, each stored in a "<bucket>-<resolution>" bucket
+DOWNSAMPLING_RESOLUTIONS = ("1m", "1h", "1d")
 
 
 def parse_arguments() -> Namespace:
@@ -47,9 +49,29 @@ def parse_arguments() -> Namespace:
     parser.add_argument("--influxdb_interface", type=str, required=True)
     parser.add_argument("--server_protocol", type=str, required=True)
     parser.add_argument("--skip_tls_verify", type=str, required=True)
+    parser.add_argument("--downsampling", type=str, default="false")
     return parser.parse_args()
 
 
+def get_downsampling_buckets(bucket, downsampling) -> dict:
+    """
+    Get the names of the downsampled tier buckets created next to the main bucket.
+
+    Parameters
+    ----------
+        bucket(str): The main InfluxDB bucket
+        downsampling(str): Whether downsampling tiers are enabled
+
+    Returns
+    -------
+        buckets(dict): The tier bucket names keyed by resolution, empty if downsampling is disabled.
+    """
+
+    if not bool(strtobool(downsampling)):
+        return {}
+    return {resolution: "{}-{}".format(bucket, resolution) for resolution in DOWNSAMPLING_RESOLUTIONS}
+
+
 def retrieve_influxDB_token_json(args) -> str:
     """
     Retrieve the created RW token from InfluxDB.
@@ -90,7 +112,7 @@ def retrieve_influxDB_token_json(args) -> str:
     return token_json
 
 
-def listen_to_token_requests(args, influxdb_token_json) -> None:
+def listen_to_token_requests(args, influxdb_token_json):
     """
     Setup a new IPC subscription over local pub/sub to listen to token requests and vend tokens.
 
@@ -101,7 +123,7 @@ def listen_to_token_requests(args, influxdb_token_json) -> None:
 
     Returns
     -------
-        None
+        operation(SubscribeToTopicOperation): the token request subscription, to close on shutdown
     """
 
     try:
@@ -113,6 +135,8 @@ def listen_to_token_requests(args, influxdb_token_json) -> None:
         influxdb_metadata['InfluxDBInterface'] = args.influxdb_interface
         influxdb_metadata['InfluxDBServerProtocol'] = args.server_protocol
         influxdb_metadata['InfluxDBSkipTLSVerify'] = args.skip_tls_verify
+        influxdb_metadata['InfluxDBDownsamplingBuckets'] = get_downsampling_buckets(args.influxdb_bucket,
+                                                                                    args.downsampling)
         influxdb_metadata_json = json.dumps(influxdb_metadata)
 
         logging.info('Successfully retrieved InfluxDB parameters!')
@@ -125,6 +149,7 @@ def listen_to_token_requests(args, influxdb_token_json) -> None:
         operation.activate(request)
         logging.info('Successfully subscribed to topic: {}'.format(args.subscribe_topic))
         logging.info("InfluxDB has been successfully set up; now listening to token requests...")
+        return operation
     except concurrent.futures.TimeoutError as e:
         logging.error('Timeout occurred while subscribing to topic: {}'.format(args.subscribe_topic), exc_info=True)
         raise e
@@ -140,10 +165,11 @@ if __name__ == "__main__":
     try:
         args = parse_arguments()
         influxdb_token_json = retrieve_influxDB_token_json(args)
-        listen_to_token_requests(args, influxdb_token_json)
-        # Keep the main thread alive, or the process will exit.
-        while True:
-            time.sleep(10)
+        operation = listen_to_token_requests(args, influxdb_token_json)
+        runner = lifecycle.Lifecycle()
+        runner.on_shutdown(operation.close)
+        # Block the main thread until Greengrass stops the component
+        runner.run()
     except InterruptedError:
         logging.error('Subscribe interrupted.', exc_info=True)
         exit(1)
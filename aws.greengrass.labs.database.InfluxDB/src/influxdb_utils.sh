@@ -54,6 +54,7 @@ create_token(){
   SERVER_PROTOCOL=$5
   SKIP_TLS_VERIFY=$6
   ACCESS=$7
+  DOWNSAMPLING=${8:-false}
 
   if [[ -z $CONTAINER_NAME || -z $BUCKET_NAME || -z $ORG_NAME ||  -z $SERVER_PROTOCOL ||  -z $SKIP_TLS_VERIFY || -z $ACCESS ]]; then
     echo 'Missing one or more arguments when trying to create the token!'
@@ -79,6 +80,14 @@ create_token(){
   if [ "$ACCESS" == "readonly" ]; then
     ACCESS_POLICY_ARGS=("--read-bucket" "${BUCKET_ID}")
     DESCRIPTION="greengrass_read"
+    if [ "$DOWNSAMPLING" == "true" ]; then
+      # Dashboards read the downsampled tiers for wide time ranges
+      HOST_ARGS=($(influx_host_args "$CONTAINER_NAME" "$SERVER_PROTOCOL" "$SKIP_TLS_VERIFY"))
+      for EVERY in 1m 1h 1d; do
+        TIER_BUCKET_ID=$(docker exec -t "$CONTAINER_NAME" influx bucket list --json --name "$BUCKET_NAME-$EVERY" "${HOST_ARGS[@]}" | python3 -c "import sys, json; print(json.load(sys.stdin)[0]['id'])")
+        ACCESS_POLICY_ARGS+=("--read-bucket" "${TIER_BUCKET_ID}")
+      done
+    fi
   elif [ "$ACCESS" == "readwrite" ]; then
     ACCESS_POLICY_ARGS=("--read-bucket" "${BUCKET_ID}" "--write-bucket" "${BUCKET_ID}")
     DESCRIPTION="greengrass_readwrite"
@@ -99,6 +108,131 @@ create_token(){
   echo "Successfully created InfluxDB token ${DESCRIPTION}"
 }
 
+influx_host_args(){
+  # Print the --host (and optional --skip-verify) arguments to reach InfluxDB from inside its container
+  CONTAINER_NAME=$1
+  SERVER_PROTOCOL=$2
+  SKIP_TLS_VERIFY=$3
+
+  echo "--host $SERVER_PROTOCOL://$CONTAINER_NAME:8086"
+  if [ "$SERVER_PROTOCOL" == "https" ] && [ "$SKIP_TLS_VERIFY" == "true" ]; then
+    echo "--skip-verify"
+  fi
+}
+
+ensure_bucket(){
+  CONTAINER_NAME=$1
+  BUCKET_NAME=$2
+  ORG_NAME=$3
+  RETENTION=$4
+  SERVER_PROTOCOL=$5
+  SKIP_TLS_VERIFY=$6
+
+  if [[ -z $CONTAINER_NAME || -z $BUCKET_NAME || -z $ORG_NAME || -z $RETENTION || -z $SERVER_PROTOCOL || -z $SKIP_TLS_VERIFY ]]; then
+    echo 'Missing one or more arguments when trying to create a bucket!'
+    exit 1
+  fi
+
+  HOST_ARGS=($(influx_host_args "$CONTAINER_NAME" "$SERVER_PROTOCOL" "$SKIP_TLS_VERIFY"))
+  if docker exec "$CONTAINER_NAME" influx bucket list --name "$BUCKET_NAME" --org "$ORG_NAME" "${HOST_ARGS[@]}" > /dev/null 2>&1; then
+    echo "Bucket $BUCKET_NAME already exists, skipping creation"
+  else
+    echo "Creating bucket $BUCKET_NAME with retention $RETENTION..."
+    docker exec "$CONTAINER_NAME" influx bucket create --name "$BUCKET_NAME" --org "$ORG_NAME" --retention "$RETENTION" "${HOST_ARGS[@]}" > /dev/null
+  fi
+}
+
+downsampling_task_flux(){
+  # Aggregate one tier into the next coarser one. Numeric metrics keep their mean, while
+  # string metrics such as ComponentStatus keep their last value since they cannot be averaged.
+  # The publisher's aggregates are in a field of their own, and stay apart by their statistic tag.
+  TASK_NAME=$1
+  SOURCE_BUCKET=$2
+  DESTINATION_BUCKET=$3
+  ORG_NAME=$4
+  EVERY=$5
+  OFFSET=$6
+
+  cat <<FLUX
+option task = {name: "$TASK_NAME", every: $EVERY, offset: $OFFSET}
+
+data = from(bucket: "$SOURCE_BUCKET")
+  |> range(start: -task.every)
+  |> filter(fn: (r) => r["_field"] == "V" or r["_field"] == "aggregate")
+
+data
+  |> filter(fn: (r) => r["NS"] != "ComponentStatus")
+  |> aggregateWindow(every: task.every, fn: mean, createEmpty: false)
+  |> to(bucket: "$DESTINATION_BUCKET", org: "$ORG_NAME")
+
+data
+  |> filter(fn: (r) => r["NS"] == "ComponentStatus")
+  |> aggregateWindow(every: task.every, fn: last, createEmpty: false)
+  |> to(bucket: "$DESTINATION_BUCKET", org: "$ORG_NAME")
+FLUX
+}
+
+ensure_downsampling_task(){
+  CONTAINER_NAME=$1
+  TASK_NAME=$2
+  SOURCE_BUCKET=$3
+  DESTINATION_BUCKET=$4
+  ORG_NAME=$5
+  EVERY=$6
+  OFFSET=$7
+  SERVER_PROTOCOL=$8
+  SKIP_TLS_VERIFY=$9
+
+  if [[ -z $CONTAINER_NAME || -z $TASK_NAME || -z $SOURCE_BUCKET || -z $DESTINATION_BUCKET || -z $ORG_NAME || -z $EVERY || -z $OFFSET || -z $SERVER_PROTOCOL || -z $SKIP_TLS_VERIFY ]]; then
+    echo 'Missing one or more arguments when trying to create a downsampling task!'
+    exit 1
+  fi
+
+  HOST_ARGS=($(influx_host_args "$CONTAINER_NAME" "$SERVER_PROTOCOL" "$SKIP_TLS_VERIFY"))
+  TASK_EXISTS=$(docker exec "$CONTAINER_NAME" influx task list --json --org "$ORG_NAME" "${HOST_ARGS[@]}" | python3 -c "import sys, json; print(any(t['name'] == sys.argv[1] for t in json.load(sys.stdin)))" "$TASK_NAME")
+  if [ "$TASK_EXISTS" == "True" ]; then
+    echo "Downsampling task $TASK_NAME already exists, skipping creation"
+  else
+    echo "Creating downsampling task $TASK_NAME from $SOURCE_BUCKET to $DESTINATION_BUCKET every $EVERY, offset $OFFSET..."
+    docker exec "$CONTAINER_NAME" influx task create --org "$ORG_NAME" "${HOST_ARGS[@]}" \
+      "$(downsampling_task_flux "$TASK_NAME" "$SOURCE_BUCKET" "$DESTINATION_BUCKET" "$ORG_NAME" "$EVERY" "$OFFSET")" > /dev/null
+  fi
+}
+
+create_downsampling_tiers(){
+  # Idempotently create the 1m, 1h and 1d tier buckets and the tasks that fill them.
+  # Each tier is aggregated from the previous one, so every task only reads a small window.
+  CONTAINER_NAME=$1
+  BUCKET_NAME=$2
+  ORG_NAME=$3
+  SERVER_PROTOCOL=$4
+  SKIP_TLS_VERIFY=$5
+  RETENTION_1M=$6
+  RETENTION_1H=$7
+  RETENTION_1D=$8
+
+  if [[ -z $CONTAINER_NAME || -z $BUCKET_NAME || -z $ORG_NAME || -z $SERVER_PROTOCOL || -z $SKIP_TLS_VERIFY || -z $RETENTION_1M || -z $RETENTION_1H || -z $RETENTION_1D ]]; then
+    echo 'Missing one or more arguments when trying to create downsampling tiers!'
+    exit 1
+  fi
+
+  # A tier runs offset after the end of its window. Each offset is larger than the one of the tier it reads from,
+  # plus time for that task to finish writing, so a coarse tier never runs before its last window is in its source.
+  SOURCE_BUCKET="$BUCKET_NAME"
+  for TIER in "1m:10s:$RETENTION_1M" "1h:1m:$RETENTION_1H" "1d:5m:$RETENTION_1D"; do
+    EVERY="${TIER%%:*}"
+    TIER="${TIER#*:}"
+    OFFSET="${TIER%%:*}"
+    RETENTION="${TIER#*:}"
+    TIER_BUCKET="$BUCKET_NAME-$EVERY"
+    ensure_bucket "$CONTAINER_NAME" "$TIER_BUCKET" "$ORG_NAME" "$RETENTION" "$SERVER_PROTOCOL" "$SKIP_TLS_VERIFY"
+    ensure_downsampling_task "$CONTAINER_NAME" "$TIER_BUCKET-downsample" "$SOURCE_BUCKET" "$TIER_BUCKET" "$ORG_NAME" "$EVERY" "$OFFSET" "$SERVER_PROTOCOL" "$SKIP_TLS_VERIFY"
+    SOURCE_BUCKET="$TIER_BUCKET"
+  done
+
+  echo "Successfully set up downsampling tiers for $BUCKET_NAME"
+}
+
 validate_password(){
   INFLUXDB_PASSWORD=$1
   if [[ ${#INFLUXDB_PASSWORD} -ge 16 && "$INFLUXDB_PASSWORD" == *[A-Z]* && "$INFLUXDB_PASSWORD" == *[a-z]* && "$INFLUXDB_PASSWORD" == *[0-9]* && "$INFLUXDB_PASSWORD" == *[#$@%+*\&!^]* ]]; then
@@ -145,6 +279,10 @@ provision_influxdb(){
   INFLUXDB_MOUNT_PATH=$9
   INFLUXDB_INTERFACE=${10}
   SKIP_TLS_VERIFY=${11}
+  DOWNSAMPLING=${12:-false}
+  RETENTION_1M=${13:-30d}
+  RETENTION_1H=${14:-365d}
+  RETENTION_1D=${15:-0}
 
   if [[ -z $CONTAINER_NAME \
     || -z $BUCKET_NAME \
@@ -212,10 +350,16 @@ provision_influxdb(){
       docker exec -t $CONTAINER_NAME influx setup --host "https://$CONTAINER_NAME:8086" "${SKIP_TLS_VERIFY_ARG:+$SKIP_TLS_VERIFY_ARG}" --force --username $INFLUXDB_USERNAME --password $INFLUXDB_PASSWORD --org $ORG_NAME --bucket $BUCKET_NAME
     fi
 
-    create_token "$CONTAINER_NAME" "$INFLUXDB_PORT" "$BUCKET_NAME" "$ORG_NAME" "$SERVER_PROTOCOL" "$SKIP_TLS_VERIFY" "readonly"
+    if [ "$DOWNSAMPLING" == "true" ]; then
+      create_downsampling_tiers "$CONTAINER_NAME" "$BUCKET_NAME" "$ORG_NAME" "$SERVER_PROTOCOL" "$SKIP_TLS_VERIFY" "$RETENTION_1M" "$RETENTION_1H" "$RETENTION_1D"
+    fi
+    create_token "$CONTAINER_NAME" "$INFLUXDB_PORT" "$BUCKET_NAME" "$ORG_NAME" "$SERVER_PROTOCOL" "$SKIP_TLS_VERIFY" "readonly" "$DOWNSAMPLING"
     create_token "$CONTAINER_NAME" "$INFLUXDB_PORT" "$BUCKET_NAME" "$ORG_NAME" "$SERVER_PROTOCOL" "$SKIP_TLS_VERIFY" "readwrite"
   else
     # Reuse auth
     echo "Reusing existing InfluxDB setup..."
+    if [ "$DOWNSAMPLING" == "true" ]; then
+      create_downsampling_tiers "$CONTAINER_NAME" "$BUCKET_NAME" "$ORG_NAME" "$SERVER_PROTOCOL" "$SKIP_TLS_VERIFY" "$RETENTION_1M" "$RETENTION_1H" "$RETENTION_1D"
+    fi
   fi
 }
@@ -19,6 +19,10 @@ BRIDGE_NETWORK_NAME=${11}
 INFLUXDB_MOUNT_PATH=${12}
 INFLUXDB_INTERFACE=${13}
 SKIP_TLS_VERIFY=${14}
+DOWNSAMPLING=${15:-false}
+DOWNSAMPLING_RETENTION_1M=${16:-30d}
+DOWNSAMPLING_RETENTION_1H=${17:-365d}
+DOWNSAMPLING_RETENTION_1D=${18:-0}
 
 if [[ -z $AUTO_PROVISION \
   || -z $CONTAINER_NAME \
@@ -45,7 +49,8 @@ fi
 child_pid=""
 if [ "$AUTO_PROVISION" == "true" ]; then
   echo "Using InfluxDB in auto-provisioning mode..."
-  provision_influxdb $CONTAINER_NAME $BUCKET_NAME $ORG_NAME $ARTIFACT_PATH $SECRET_ARN $INFLUXDB_PORT $SERVER_PROTOCOL $BRIDGE_NETWORK_NAME $INFLUXDB_MOUNT_PATH $INFLUXDB_INTERFACE $SKIP_TLS_VERIFY
+  provision_influxdb $CONTAINER_NAME $BUCKET_NAME $ORG_NAME $ARTIFACT_PATH $SECRET_ARN $INFLUXDB_PORT $SERVER_PROTOCOL $BRIDGE_NETWORK_NAME $INFLUXDB_MOUNT_PATH $INFLUXDB_INTERFACE $SKIP_TLS_VERIFY \
+    $DOWNSAMPLING $DOWNSAMPLING_RETENTION_1M $DOWNSAMPLING_RETENTION_1H $DOWNSAMPLING_RETENTION_1D
 
   python3 -u "$ARTIFACT_PATH/influxDBTokenPublisher.py" \
     --subscribe_topic $TOKEN_REQUEST_TOPIC \
@@ -56,7 +61,8 @@ if [ "$AUTO_PROVISION" == "true" ]; then
     --influxdb_port $INFLUXDB_PORT \
     --influxdb_interface $INFLUXDB_INTERFACE \
     --server_protocol $SERVER_PROTOCOL \
-    --skip_tls_verify $SKIP_TLS_VERIFY &
+    --skip_tls_verify $SKIP_TLS_VERIFY \
+    --downsampling $DOWNSAMPLING &
 
   child_pid="$!"
 else
@@ -21,7 +21,8 @@ def test_parse_valid_args(mocker):
             influxdb_port="testport",
             influxdb_interface="testinterface",
             server_protocol="testprotocol",
-            skip_tls_verify="testskipverify"
+            skip_tls_verify="testskipverify",
+            downsampling="true"
             )
     )
     import src.influxDBTokenPublisher as publisher
@@ -36,6 +37,7 @@ def test_parse_valid_args(mocker):
     assert args.influxdb_interface == "testinterface"
     assert args.server_protocol == "testprotocol"
     assert args.skip_tls_verify == "testskipverify"
+    assert args.downsampling == "true"
 
     assert mock_parse_args.call_count == 1
 
@@ -152,7 +154,8 @@ def test_listen_to_token_requests(mocker):
         influxdb_port="testport",
         influxdb_interface="testinterface",
         server_protocol="https",
-        skip_tls_verify="true"
+        skip_tls_verify="true",
+        downsampling="false"
         )
     test_influxdb_rw_token = "testToken"
     mock_ipc_client = mocker.patch("awsiot.greengrasscoreipc.connect")
@@ -162,6 +165,39 @@ def test_listen_to_token_requests(mocker):
     assert mock_ipc_client.call_count == 2
 
 
+def test_listen_to_token_requests_with_downsampling(mocker):
+    testArgs = argparse.Namespace(
+        subscribe_topic="test/subscribe",
+        publish_topic="test/publish",
+        influxdb_container_name="test_containername",
+        influxdb_org="testorg",
+        influxdb_bucket="testbucket",
+        influxdb_port="testport",
+        influxdb_interface="testinterface",
+        server_protocol="https",
+        skip_tls_verify="true",
+        downsampling="true"
+        )
+    mocker.patch("awsiot.greengrasscoreipc.connect")
+
+    import src.influxDBTokenPublisher as publisher
+    handler = mocker.patch("src.influxDBTokenPublisher.InfluxDBTokenStreamHandler")
+    publisher.listen_to_token_requests(testArgs, "testToken")
+    metadata = json.loads(handler.call_args.args[0])
+    assert metadata['InfluxDBDownsamplingBuckets']["1h"] == "testbucket-1h"
+
+
+def test_get_downsampling_buckets():
+    import src.influxDBTokenPublisher as publisher
+
+    assert publisher.get_downsampling_buckets("testbucket", "false") == {}
+    assert publisher.get_downsampling_buckets("testbucket", "true") == {
+        "1m": "testbucket-1m",
+        "1h": "testbucket-1h",
+        "1d": "testbucket-1d"
+    }
+
+
 def test_no_ipc_connection(mocker):
 
     testArgs = argparse.Namespace(
@@ -173,7 +209,8 @@ def test_no_ipc_connection(mocker):
         influxdb_port="testport",
         influxdb_interface="testinterface",
         server_protocol="https",
-        skip_tls_verify="true"
+        skip_tls_verify="true",
+        downsampling="false"
     )
     test_influxdb_rw_token = "testToken"
     mocker.patch("awsiot.greengrasscoreipc.connect", side_effect=TimeoutError("test"))
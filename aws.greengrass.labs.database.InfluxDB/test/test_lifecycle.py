@@ -0,0 +1,29 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import signal
+import sys
+import threading
+
+sys.path.append("src/")
+
+import src.lifecycle as lifecycle  # noqa: E402
+
+
+def test_run_blocks_until_sigterm_then_closes(mocker):
+    handlers = {s: signal.getsignal(s) for s in (signal.SIGTERM, signal.SIGINT)}
+    try:
+        runner = lifecycle.Lifecycle()
+        operation = mocker.Mock()
+        runner.on_shutdown(operation.close)
+        reset = threading.Event()
+        runner.every(0.01, reset.set)
+        threading.Timer(0.05, os.kill, (os.getpid(), signal.SIGTERM)).start()
+
+        assert runner.run(timeout=5)
+        operation.close.assert_called_once()
+        assert reset.is_set()
+    finally:
+        for s, handler in handlers.items():
+            signal.signal(s, handler)
@@ -0,0 +1,215 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import threading
+import time
+
+import metricFilter
+import metrics
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover - exercised on devices without NumPy
+    numpy = None
+
+# The statistics written per series and window, each point tagged with its statistic and keeping the series' name.
+# They are floats in a field of their own, since raw points of an integer series are written as integers to V.
+STATISTICS = ("min", "max", "mean", "last", "count")
+STATISTIC_TAG = "statistic"
+AGGREGATE_FIELD = "aggregate"
+
+points_aggregated = metrics.REGISTRY.counter(
+    "publisher_points_aggregated_total", "Points folded into aggregates instead of being written"
+)
+
+
+def series_key(point):
+    return (point["N"], point["NS"], point.get("thing_name", ""))
+
+
+def is_numeric(value):
+    # bool is an int, but a flag has no meaningful mean
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class _Window:
+    """The accumulators of one window, one slot per series in order of first appearance."""
+
+    def __init__(self):
+        self.index = {}
+        # The last point seen of each series, for the tags of its aggregates
+        self.templates = []
+
+    def slots(self, keys, points):
+        slots = []
+        for key, point in zip(keys, points):
+            slot = self.index.get(key)
+            if slot is None:
+                slot = self.index[key] = len(self.templates)
+                self.templates.append(point)
+            else:
+                self.templates[slot] = point
+            slots.append(slot)
+        return slots
+
+
+class _PythonWindow(_Window):
+    def __init__(self):
+        super().__init__()
+        self.mins, self.maxs, self.sums, self.lasts, self.counts = [], [], [], [], []
+
+    def add(self, keys, points, values):
+        for slot, value in zip(self.slots(keys, points), values):
+            if slot == len(self.counts):
+                self.mins.append(value)
+                self.maxs.append(value)
+                self.sums.append(0.0)
+                self.lasts.append(value)
+                self.counts.append(0)
+            elif value < self.mins[slot]:
+                self.mins[slot] = value
+            elif value > self.maxs[slot]:
+                self.maxs[slot] = value
+            self.sums[slot] += value
+            self.lasts[slot] = value
+            self.counts[slot] += 1
+
+    def statistics(self):
+        for slot in range(len(self.counts)):
+            count = self.counts[slot]
+            yield slot, (self.mins[slot], self.maxs[slot], self.sums[slot] / count, self.lasts[slot], count)
+
+
+class _NumpyWindow(_Window):
+    def __init__(self):
+        super().__init__()
+        self.mins = numpy.empty(0)
+        self.maxs = numpy.empty(0)
+        self.sums = numpy.empty(0)
+        self.lasts = numpy.empty(0)
+        self.counts = numpy.empty(0, dtype=numpy.int64)
+
+    def _grow(self, size):
+        grow = size - len(self.counts)
+        if grow > 0:
+            self.mins = numpy.concatenate((self.mins, numpy.full(grow, numpy.inf)))
+            self.maxs = numpy.concatenate((self.maxs, numpy.full(grow, -numpy.inf)))
+            self.sums = numpy.concatenate((self.sums, numpy.zeros(grow)))
+            self.lasts = numpy.concatenate((self.lasts, numpy.zeros(grow)))
+            self.counts = numpy.concatenate((self.counts, numpy.zeros(grow, dtype=numpy.int64)))
+
+    def add(self, keys, points, values):
+        slots = numpy.array(self.slots(keys, points), dtype=numpy.intp)
+        values = numpy.array(values, dtype=numpy.float64)
+        self._grow(len(self.templates))
+        numpy.minimum.at(self.mins, slots, values)
+        numpy.maximum.at(self.maxs, slots, values)
+        numpy.add.at(self.sums, slots, values)
+        numpy.add.at(self.counts, slots, 1)
+        # The last occurrence of each slot in the batch, since assigning to repeated indices keeps no defined order
+        unique, first_from_end = numpy.unique(slots[::-1], return_index=True)
+        self.lasts[unique] = values[len(values) - 1 - first_from_end]
+
+    def statistics(self):
+        means = self.sums / numpy.maximum(self.counts, 1)
+        for slot in range(len(self.counts)):
+            yield slot, (
+                float(self.mins[slot]),
+                float(self.maxs[slot]),
+                float(means[slot]),
+                float(self.lasts[slot]),
+                int(self.counts[slot]),
+            )
+
+
+class Aggregator:
+    def __init__(self, interval, passthrough=None, use_numpy=None):
+        """
+        Fold numeric telemetry points into per-series windows and emit their min, max, mean, last and count
+        every interval instead of the raw points.
+
+        Parameters
+        ----------
+            interval(float): Seconds per window
+            passthrough(list): "NS/N" patterns of the points to write raw instead
+            use_numpy(bool): Whether to accumulate with NumPy; by default, whenever it is installed
+        """
+        self.interval = interval
+        self.passthrough = metricFilter.compile_patterns(passthrough)
+        if use_numpy is None:
+            use_numpy = numpy is not None
+        self._window_type = _NumpyWindow if use_numpy else _PythonWindow
+        self._window = self._window_type()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build an aggregator from the Aggregation component configuration.
+
+        Parameters
+        ----------
+            config(dict or str): The configuration, or its JSON
+
+        Returns
+        -------
+            aggregator(Aggregator): The aggregator, or None if points are written raw
+        """
+        if isinstance(config, str):
+            config = json.loads(config) if config.strip() else {}
+        config = config or {}
+        interval = float(config.get("Interval", 0))
+        if interval <= 0:
+            return None
+        return cls(interval, config.get("Passthrough"))
+
+    def add(self, telemetry):
+        """
+        Add a batch of telemetry points to the current window.
+
+        Parameters
+        ----------
+            telemetry(list): The telemetry points, in the NucleusEmitter format
+
+        Returns
+        -------
+            raw(list): The points to write as they are: those matching a passthrough pattern, and non-numeric ones
+        """
+        raw, points = [], []
+        for point in telemetry:
+            if not is_numeric(point["V"]) or (
+                self.passthrough is not None and self.passthrough.match("{}/{}".format(point["NS"], point["N"]))
+            ):
+                raw.append(point)
+            else:
+                points.append(point)
+        if points:
+            keys = [series_key(p) for p in points]
+            with self._lock:
+                self._window.add(keys, points, [p["V"] for p in points])
+            points_aggregated.inc(len(points))
+        return raw
+
+    def flush(self, ts_ms=None):
+        """
+        Close the current window and start a new one.
+
+        Parameters
+        ----------
+            ts_ms(int): The timestamp of the aggregates, by default now
+
+        Returns
+        -------
+            aggregates(list): One point per series and statistic, named N and tagged with the statistic
+        """
+        if ts_ms is None:
+            ts_ms = int(time.time() * 1000)
+        with self._lock:
+            window, self._window = self._window, self._window_type()
+        aggregates = []
+        for slot, values in window.statistics():
+            template = window.templates[slot]
+            for statistic, value in zip(STATISTICS, values):
+                aggregates.append(dict(template, V=float(value), TS=ts_ms, **{STATISTIC_TAG: statistic}))
+        return aggregates
@@ -0,0 +1,123 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import collections
+import threading
+
+import metrics
+
+# The MqttClient relay stamps a message as "#<source>:<sequence>\n" followed by the original payload
+MARKER = b"#"
+SEPARATOR = b"\n"
+DEFAULT_WINDOW = 4096
+DEFAULT_MAX_SOURCES = 1024
+
+duplicates = metrics.REGISTRY.counter("publisher_duplicates_total", "Relayed messages dropped as already written")
+
+
+def parse(payload):
+    """
+    Split the idempotency key the MqttClient relay stamps a message with from its payload.
+
+    Parameters
+    ----------
+        payload(bytes): The message as received
+
+    Returns
+    -------
+        key(tuple): The source, sequence number and original payload, or None, None and the payload if unstamped
+    """
+    if not payload.startswith(MARKER):
+        return None, None, payload
+    end = payload.find(SEPARATOR)
+    if end < 0:
+        return None, None, payload
+    source, colon, sequence = payload[1:end].rpartition(b":")
+    if not colon:
+        return None, None, payload
+    try:
+        return source.decode(), int(sequence, 36), payload[end + 1:]
+    except ValueError:
+        return None, None, payload
+
+
+class SlidingWindow:
+    __slots__ = ("size", "top", "bitmap")
+
+    def __init__(self, size=DEFAULT_WINDOW):
+        """
+        The sequence numbers seen from one source: the highest one, and a bitmap of the size before it.
+
+        Parameters
+        ----------
+            size(int): How many sequence numbers below the highest are remembered
+        """
+        self.size = size
+        self.top = -1
+        self.bitmap = 0
+
+    def seen(self, sequence):
+        """
+        Return whether a sequence number was seen before, recording it if not. Numbers older than the window
+        count as seen, since they can no longer be told apart from duplicates.
+        """
+        if sequence > self.top:
+            shift = sequence - self.top
+            self.bitmap = ((self.bitmap << shift) | 1) & ((1 << self.size) - 1) if shift < self.size else 1
+            self.top = sequence
+            return False
+        offset = self.top - sequence
+        if offset >= self.size:
+            return True
+        bit = 1 << offset
+        if self.bitmap & bit:
+            return True
+        self.bitmap |= bit
+        return False
+
+
+class Deduplicator:
+    def __init__(self, window=DEFAULT_WINDOW, max_sources=DEFAULT_MAX_SOURCES):
+        """
+        Drop relayed messages the remote broker redelivered under QoS 1, so their telemetry is not written twice.
+
+        Parameters
+        ----------
+            window(int): Sequence numbers remembered per source
+            max_sources(int): Sources remembered before the least recently seen is forgotten
+        """
+        self.window = window
+        self.max_sources = max_sources
+        self._sources = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def is_duplicate(self, source, sequence):
+        with self._lock:
+            window = self._sources.get(source)
+            if window is None:
+                window = self._sources[source] = SlidingWindow(self.window)
+                if len(self._sources) > self.max_sources:
+                    self._sources.popitem(last=False)
+            else:
+                self._sources.move_to_end(source)
+            duplicate = window.seen(sequence)
+        if duplicate:
+            duplicates.inc()
+        return duplicate
+
+    def accept(self, payload):
+        """
+        Check a message against the ones seen before.
+
+        Parameters
+        ----------
+            payload(bytes): The message as received
+
+        Returns
+        -------
+            payload(bytes): The original payload, or None if the message is a duplicate. Unstamped messages pass.
+        """
+        source, sequence, body = parse(payload)
+        if source is not None and self.is_duplicate(source, sequence):
+            return None
+        return body
@@ -0,0 +1,346 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import collections
+import json
+import logging
+import threading
+import time
+import zlib
+
+import awsiot.greengrasscoreipc.client as client
+from awsiot.greengrasscoreipc.model import SubscriptionResponseMessage
+
+import dedup
+import metrics
+
+messages_in = metrics.REGISTRY.counter("publisher_gateway_messages_in_total", "Gateway telemetry messages received")
+dropped = metrics.REGISTRY.counter(
+    "publisher_gateway_dropped_total", "Gateway telemetry batches dropped because their thing had too many pending"
+)
+deferred = metrics.REGISTRY.counter(
+    "publisher_gateway_deferred_total", "Times a thing's pending telemetry waited for its rate limit"
+)
+pending = metrics.REGISTRY.gauge("publisher_gateway_pending", "Gateway telemetry batches waiting to be written")
+things = metrics.REGISTRY.gauge("publisher_gateway_things", "Things with gateway telemetry waiting to be written")
+queue_wait_seconds = metrics.REGISTRY.histogram(
+    "publisher_gateway_queue_wait_seconds", "Time gateway telemetry waited to be written"
+)
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        """
+        Limit a thing to rate points per second on average, after a burst of up to burst points.
+
+        Parameters
+        ----------
+            rate(float): Points per second
+            burst(float): The most points written at once
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def delay(self, now):
+        """
+        Return how many seconds until the bucket allows a write, 0 if it does now.
+        A write may be larger than the bucket, in which case it leaves the bucket in debt.
+        """
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, points):
+        self.tokens -= points
+
+    def full(self, now):
+        """Return whether the bucket has refilled, which makes it the same as a new bucket."""
+        return self.rate <= 0 or self.tokens + (now - self.updated) * self.rate >= self.burst
+
+
+class _Shard:
+    """
+    Writes the telemetry of the things hashed to it from one worker thread. Every round takes at most one
+    pending batch from each thing whose rate limit allows it, in round-robin order, and writes them together.
+    """
+
+    def __init__(self, name, write, rate, burst, max_pending):
+        self.write = write
+        self.rate = rate
+        self.burst = burst
+        self.max_pending = max_pending
+        # thing_name -> deque of (queued at, points); the order things are served in
+        self.queues = collections.OrderedDict()
+        # thing_name -> TokenBucket, least recently used first
+        self.buckets = collections.OrderedDict()
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def submit(self, thing_name, points):
+        with self.condition:
+            queue = self.queues.get(thing_name)
+            if queue is None:
+                queue = self.queues[thing_name] = collections.deque()
+                things.inc()
+            if len(queue) >= self.max_pending:
+                # The oldest batch of this thing gives way; other things are unaffected
+                queue.popleft()
+                dropped.inc()
+                pending.dec()
+            queue.append((time.monotonic(), points))
+            pending.inc()
+            self.condition.notify()
+
+    def _take_round(self):
+        """
+        Return the batches of the next round, waiting until there is one, or None once stopped and drained.
+        Rate limits are ignored when stopping, so everything pending is written.
+        """
+        with self.condition:
+            while True:
+                if not self.queues:
+                    if self.stopped:
+                        return None
+                    self.condition.wait()
+                    continue
+                now = time.monotonic()
+                batches = []
+                wait = None
+                for thing_name in list(self.queues):
+                    bucket = self.buckets.get(thing_name)
+                    if bucket is None:
+                        bucket = self.buckets[thing_name] = TokenBucket(self.rate, self.burst)
+                    else:
+                        self.buckets.move_to_end(thing_name)
+                    delay = 0 if self.stopped or self.rate <= 0 else bucket.delay(now)
+                    if delay > 0:
+                        deferred.inc()
+                        wait = delay if wait is None else min(wait, delay)
+                        continue
+                    queue = self.queues[thing_name]
+                    queued, points = queue.popleft()
+                    bucket.take(len(points))
+                    batches.append((queued, points))
+                    pending.dec()
+                    if queue:
+                        self.queues.move_to_end(thing_name)
+                    else:
+                        del self.queues[thing_name]
+                        things.dec()
+                self._evict_idle_buckets(now)
+                if batches:
+                    return batches
+                self.condition.wait(wait)
+
+    def _evict_idle_buckets(self, now):
+        """
+        Forget the buckets of things with nothing pending once they have refilled, so the buckets of things that
+        stopped sending do not accumulate. The things served this round were moved to the end, so the sweep stops
+        at the first bucket still in use or still refilling.
+        """
+        while self.buckets:
+            thing_name, bucket = next(iter(self.buckets.items()))
+            if thing_name in self.queues or not bucket.full(now):
+                return
+            del self.buckets[thing_name]
+
+    def _run(self):
+        while True:
+            batches = self._take_round()
+            if batches is None:
+                return
+            now = time.monotonic()
+            telemetry = []
+            for queued, points in batches:
+                queue_wait_seconds.observe(now - queued)
+                telemetry.extend(points)
+            try:
+                self.write(telemetry)
+            except Exception:
+                logging.error("Failed to write gateway telemetry to InfluxDB.", exc_info=True)
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+
+
+class Gateway:
+    def __init__(self, topic, workers=4, points_per_second=1000, burst=5000, max_pending=16, deduplicate=True):
+        """
+        Write telemetry relayed from many things, received on a wildcard topic, through one InfluxDB client.
+        Things are sharded across the workers by thing_name, so the batches of one thing are written in order.
+
+        Parameters
+        ----------
+            topic(str): The topic to subscribe to, such as gateway/+/greengrass/telemetry
+            workers(int): The number of worker threads
+            points_per_second(float): The average points per second written for any one thing, 0 for no limit
+            burst(float): The most points written at once for any one thing
+            max_pending(int): The most batches of one thing waiting to be written, before its oldest are dropped
+            deduplicate(bool): Whether to drop messages the MqttClient relay stamped with a key already seen
+        """
+        self.topic = topic
+        self.deduplicator = dedup.Deduplicator() if deduplicate else None
+        self.workers = max(int(workers), 1)
+        self.points_per_second = float(points_per_second)
+        self.burst = float(burst)
+        self.max_pending = max(int(max_pending), 1)
+        self.shards = []
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build a gateway from the Gateway component configuration.
+
+        Parameters
+        ----------
+            config(dict or str): The configuration, or its JSON
+
+        Returns
+        -------
+            gateway(Gateway): The gateway, or None if gateway mode is off
+        """
+        if isinstance(config, str):
+            config = json.loads(config) if config.strip() else {}
+        config = config or {}
+        if not config.get("Topic"):
+            return None
+        return cls(
+            config["Topic"],
+            config.get("Workers", 4),
+            config.get("PointsPerSecond", 1000),
+            config.get("Burst", 5000),
+            config.get("MaxPendingBatches", 16),
+            config.get("Deduplicate", True),
+        )
+
+    def start(self, write):
+        """
+        Start the workers.
+
+        Parameters
+        ----------
+            write(function): Writes a list of telemetry points, from any worker thread
+
+        Returns
+        -------
+            gateway(Gateway): This gateway
+        """
+        self.shards = [
+            _Shard("gateway-{}".format(i), write, self.points_per_second, self.burst, self.max_pending)
+            for i in range(self.workers)
+        ]
+        for shard in self.shards:
+            shard.thread.start()
+        return self
+
+    def shard(self, thing_name):
+        # crc32 rather than hash(), which is salted per process
+        return self.shards[zlib.crc32(thing_name.encode()) % len(self.shards)]
+
+    def submit(self, telemetry):
+        """
+        Queue telemetry points for writing, grouped by their thing_name.
+
+        Parameters
+        ----------
+            telemetry(list): The telemetry points, in the NucleusEmitter format
+
+        Returns
+        -------
+            None
+        """
+        by_thing = collections.OrderedDict()
+        for point in telemetry:
+            by_thing.setdefault(point.get("thing_name", ""), []).append(point)
+        for thing_name, points in by_thing.items():
+            self.shard(thing_name).submit(thing_name, points)
+
+    def stop(self, timeout=10):
+        """
+        Write everything pending and stop the workers.
+
+        Parameters
+        ----------
+            timeout(float): Seconds to wait for each worker
+
+        Returns
+        -------
+            None
+        """
+        for shard in self.shards:
+            shard.stop()
+        for shard in self.shards:
+            shard.thread.join(timeout)
+
+    def stream_handler(self):
+        return GatewayStreamHandler(self)
+
+
+class GatewayStreamHandler(client.SubscribeToTopicStreamHandler):
+    def __init__(self, gateway):
+        super().__init__()
+        self.gateway = gateway
+
+    def on_stream_event(self, event: SubscriptionResponseMessage) -> None:
+        """
+        When we receive a message over IPC on the gateway topic, queue its telemetry for the workers.
+        Unlike the single-thing handler, a bad message from one thing is logged and skipped rather than fatal.
+        A message the relay stamped with an idempotency key is only written the first time it arrives.
+
+        Parameters
+        ----------
+            event(SubscriptionResponseMessage): The received IPC message
+
+        Returns
+        -------
+            None
+        """
+        messages_in.inc()
+        try:
+            payload = event.binary_message.message
+            if self.gateway.deduplicator is not None:
+                payload = self.gateway.deduplicator.accept(payload)
+                if payload is None:
+                    return
+            telemetry = json.loads(str(payload, "utf-8"))
+            if not isinstance(telemetry, list):
+                raise ValueError("Gateway telemetry must be a list of points!")
+            self.gateway.submit(telemetry)
+        except Exception:
+            logging.error("Received invalid gateway telemetry.", exc_info=True)
+
+    def on_stream_error(self, error: Exception) -> bool:
+        """
+        Log stream errors but keep the stream open.
+
+        Parameters
+        ----------
+            error(Exception): The exception we see as a result of the stream error.
+
+        Returns
+        -------
+            False(bool): Return False to keep the stream open.
+        """
+        logging.error("Received a stream error.", exc_info=True)
+        return False
+
+    def on_stream_closed(self) -> None:
+        """
+        Handle the stream closing.
+
+        Parameters
+        ----------
+            None
+
+        Returns
+        -------
+            None
+        """
+        logging.info("Subscribe to gateway telemetry topic stream closed.")
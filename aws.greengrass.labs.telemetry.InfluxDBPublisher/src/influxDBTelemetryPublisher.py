@@ -2,6 +2,7 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import concurrent.futures
+import os
 import time
 import logging
 import argparse
@@ -14,12 +15,20 @@ from awsiot.greengrasscoreipc.model import (
     SubscribeToTopicRequest,
     UnauthorizedError,
 )
+import aggregation
+import gateway
+import lifecycle
+import logutil
+import metricFilter
+import metrics
+import profiler
 import streamHandlers
 
 logging.basicConfig(level=logging.INFO)
 
 # Fixed topic for Greengrass local telemetry
 telemetry_topic = "injected/greengrass/telemetry"
+component_name = "aws.greengrass.labs.telemetry.InfluxDBPublisher"
 TIMEOUT = 10
 
 influxdb_parameters = {}
@@ -41,6 +50,12 @@ def parse_arguments() -> argparse.Namespace:
     parser = argparse.ArgumentParser()
     parser.add_argument("--subscribe_topic", type=str, required=True)
     parser.add_argument("--publish_topic", type=str, required=True)
+    parser.add_argument("--metrics_port", type=int, default=0)
+    parser.add_argument("--self_telemetry_interval", type=float, default=0)
+    parser.add_argument("--log_format", choices=["text", "json"], default="text")
+    parser.add_argument("--metric_filter", type=str, default="")
+    parser.add_argument("--aggregation", type=str, default="")
+    parser.add_argument("--gateway", type=str, default="")
     return parser.parse_args()
 
 
@@ -176,61 +191,104 @@ def retrieve_influxdb_params(publish_topic, subscribe_topic) -> str:
     return handler.influxdb_parameters
 
 
-def relay_telemetry(influxdb_parameters) -> None:
+def relay_telemetry(influxdb_parameters, metric_filter=None, aggregator=None, telemetry_gateway=None):
     """
     Relay Greengrass system telemetry from Greengrass to InfluxDB.
 
     Parameters
     ----------
        influxdb_paremeters(str): the retrieved parameters needed to connect to InfluxDB
+       metric_filter(MetricFilter): the filter to apply before writing, or None to write every point
+       aggregator(Aggregator): the aggregator to write windowed statistics through, or None to write raw points
+       telemetry_gateway(Gateway): the gateway to write the telemetry of many things through, or None to relay
+           this core's telemetry
 
     Returns
     -------
-        None
+        handler(TelemetryStreamHandler): the handler writing the relayed telemetry
+        telemetry_operation(SubscribeToTopicOperation): the telemetry subscription, to close on shutdown
     """
 
     # Now we can subscribe to Greengrass Local Telemetry and relay it to InfluxDB using our retrieved credentials
     telemetry_subscriber_client = awsiot.greengrasscoreipc.connect()
-    handler = streamHandlers.TelemetryStreamHandler(influxdb_parameters)
-    telemetry_operation = telemetry_subscriber_client.new_subscribe_to_topic(handler)
+    if telemetry_gateway is None:
+        topic = telemetry_topic
+        handler = streamHandlers.TelemetryStreamHandler(influxdb_parameters, metric_filter, aggregator)
+        stream_handler = handler
+    else:
+        topic = telemetry_gateway.topic
+        # The workers share one client, with a pooled connection each
+        handler = streamHandlers.TelemetryStreamHandler(
+            influxdb_parameters, metric_filter, aggregator, connection_pool_maxsize=telemetry_gateway.workers
+        )
+        stream_handler = telemetry_gateway.start(handler.write_telemetry).stream_handler()
+    telemetry_operation = telemetry_subscriber_client.new_subscribe_to_topic(stream_handler)
     try:
         request = SubscribeToTopicRequest()
-        request.topic = telemetry_topic
+        request.topic = topic
         future = telemetry_operation.activate(request)
         future.result(TIMEOUT)
-        logging.info("Successfully subscribed to topic: {}".format(telemetry_topic))
+        logging.info("Successfully subscribed to topic: {}".format(topic))
         logging.info("Relaying telemetry to InfluxDB...")
     except concurrent.futures.TimeoutError as e:
         logging.error(
-            "Timeout occurred while subscribing to topic: {}".format(telemetry_topic),
+            "Timeout occurred while subscribing to topic: {}".format(topic),
             exc_info=True,
         )
         raise e
     except UnauthorizedError as e:
         logging.error(
-            "Unauthorized error while subscribing to topic: {}".format(telemetry_topic),
+            "Unauthorized error while subscribing to topic: {}".format(topic),
             exc_info=True,
         )
         raise e
     except Exception as e:
         logging.error(
-            "Exception while subscribing to topic: {}".format(telemetry_topic),
+            "Exception while subscribing to topic: {}".format(topic),
             exc_info=True,
         )
         telemetry_operation.close()
         raise e
+    return handler, telemetry_operation
 
 
 if __name__ == "__main__":
     try:
         args = parse_arguments()
+        logutil.configure(json_format=args.log_format == "json")
         publish_topic = args.publish_topic
         subscribe_topic = args.subscribe_topic
+        if args.metrics_port:
+            metrics.serve(args.metrics_port)
         influxdb_parameters = retrieve_influxdb_params(publish_topic, subscribe_topic)
-        relay_telemetry(influxdb_parameters)
-        # Keep the main thread alive, or the process will exit.
-        while True:
-            time.sleep(10)
+        runner = lifecycle.Lifecycle()
+        runner.on_shutdown(logutil.flush)
+        aggregator = aggregation.Aggregator.from_config(args.aggregation)
+        telemetry_gateway = gateway.Gateway.from_config(args.gateway)
+        handler, telemetry_operation = relay_telemetry(
+            influxdb_parameters, metricFilter.MetricFilter.from_config(args.metric_filter), aggregator, telemetry_gateway
+        )
+        runner.on_shutdown(handler.close)
+        if aggregator is not None:
+            runner.every(aggregator.interval, handler.flush_aggregates)
+            # Runs before the client is closed, so the last partial window is not lost
+            runner.on_shutdown(handler.flush_aggregates)
+        if telemetry_gateway is not None:
+            # Runs once the subscription is closed and before the last aggregates, writing what is still pending
+            runner.on_shutdown(telemetry_gateway.stop)
+        profiler.ProfilerControl(component_name).listen_v1(awsiot.greengrasscoreipc.connect(), TIMEOUT)
+        if args.self_telemetry_interval > 0:
+            # The publisher writes its own metrics straight to InfluxDB rather than over IPC
+            reporter = metrics.TelemetryReporter(
+                handler.write_telemetry,
+                component_name,
+                os.environ.get("AWS_IOT_THING_NAME", ""),
+                args.self_telemetry_interval,
+            ).start()
+            runner.on_shutdown(reporter.report)
+        runner.on_shutdown(telemetry_operation.close)
+        # Block the main thread until Greengrass stops the component
+        runner.run()
     except InterruptedError:
         logging.error("Subscribe interrupted.", exc_info=True)
         exit(1)
@@ -0,0 +1,107 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import heapq
+import itertools
+import logging
+import signal
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+
+class Scheduler:
+    """
+    Runs callbacks at given times from a single daemon thread, which sleeps until the next one is due instead
+    of waking up periodically to check.
+    """
+
+    def __init__(self):
+        # (due, sequence, interval, callback); the sequence keeps callbacks due at the same time in order
+        self._heap: List[Tuple[float, int, Optional[float], Callable[[], None]]] = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+
+    def call_later(self, delay: float, callback: Callable[[], None]):
+        self._push(time.monotonic() + delay, None, callback)
+
+    def every(self, interval: float, callback: Callable[[], None], run_now: bool = False):
+        """Run a callback every interval seconds, first after one interval or right away with run_now."""
+        self._push(time.monotonic() + (0 if run_now else interval), interval, callback)
+
+    def _push(self, due: float, interval: Optional[float], callback: Callable[[], None]):
+        with self._condition:
+            heapq.heappush(self._heap, (due, next(self._sequence), interval, callback))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="scheduler", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopped and (not self._heap or self._heap[0][0] > time.monotonic()):
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._condition.wait(timeout)
+                if self._stopped:
+                    return
+                due, _, interval, callback = heapq.heappop(self._heap)
+                if interval is not None:
+                    # Scheduled from the previous due time, so a slow callback does not make the period drift
+                    heapq.heappush(self._heap, (due + interval, next(self._sequence), interval, callback))
+            try:
+                callback()
+            except Exception:
+                logging.error("scheduled task failed", exc_info=True)
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+
+class Lifecycle:
+    """
+    Keeps a component's main thread blocked until SIGTERM or SIGINT, then runs the shutdown hooks in the
+    reverse order they were added, so what was started last is stopped first.
+    """
+
+    def __init__(self):
+        self.stopping = threading.Event()
+        self.scheduler = Scheduler()
+        self._hooks: List[Tuple[str, Callable[[], None]]] = []
+
+    def on_shutdown(self, callback: Callable[[], None], name: str = "") -> Callable[[], None]:
+        self._hooks.append((name or getattr(callback, "__name__", repr(callback)), callback))
+        return callback
+
+    def every(self, interval: float, callback: Callable[[], None], run_now: bool = False):
+        self.scheduler.every(interval, callback, run_now)
+
+    def call_later(self, delay: float, callback: Callable[[], None]):
+        self.scheduler.call_later(delay, callback)
+
+    def shutdown(self, *_):
+        self.stopping.set()
+
+    def install_signal_handlers(self, signals=(signal.SIGTERM, signal.SIGINT)):
+        for s in signals:
+            signal.signal(s, self.shutdown)
+
+    def run(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until shutdown is requested or the timeout passes, then shut down. Only the main thread can
+        install the signal handlers, so run() must be called from it. Returns whether shutdown was requested.
+        """
+        self.install_signal_handlers()
+        requested = self.stopping.wait(timeout)
+        logging.info("shutting down")
+        self.scheduler.stop()
+        for name, callback in reversed(self._hooks):
+            try:
+                callback()
+            except Exception:
+                logging.error(f"shutdown hook {name} failed", exc_info=True)
+        return requested
@@ -0,0 +1,122 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import fnmatch
+import json
+import re
+
+import metrics
+
+# The tags createPoints writes
+DEFAULT_TAGS = ("NS", "U", "A", "thing_name")
+# Names seen on a device are few, but a misbehaving sender must not grow the cache without bound
+MAX_CACHE_SIZE = 10000
+
+points_dropped = metrics.REGISTRY.counter("publisher_points_dropped_total", "Points dropped by the metric filter")
+
+
+def compile_patterns(patterns):
+    """
+    Compile shell-style "NS/N" patterns, such as "ComponentCpuUsage/*", into one regular expression.
+
+    Parameters
+    ----------
+        patterns(list): The patterns
+
+    Returns
+    -------
+        pattern(re.Pattern): A pattern matching any of them, or None if there are none
+    """
+    if not patterns:
+        return None
+    return re.compile("|".join("(?:{})".format(fnmatch.translate(p)) for p in patterns))
+
+
+class MetricFilter:
+    def __init__(self, allow=None, deny=None, rename=None, tags=DEFAULT_TAGS):
+        """
+        Decide, rename and project telemetry points before they are converted to InfluxDB Points.
+
+        Parameters
+        ----------
+            allow(list): "NS/N" patterns to keep; every point is kept if empty
+            deny(list): "NS/N" patterns to drop, even if allowed
+            rename(dict): "NS/N" to the measurement name to write instead of N
+            tags(list): the tags to write, out of NS, U, A and thing_name
+        """
+        self.allow = compile_patterns(allow)
+        self.deny = compile_patterns(deny)
+        self.rename = dict(rename or {})
+        self.tags = tuple(tags)
+        self.dropped_tags = tuple(t for t in DEFAULT_TAGS if t not in self.tags)
+        # (NS, N) -> the name to write, or None to drop the point
+        self._decisions = {}
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build a filter from the MetricFilter component configuration.
+
+        Parameters
+        ----------
+            config(dict or str): The configuration, or its JSON
+
+        Returns
+        -------
+            metric_filter(MetricFilter): The filter, or None if the configuration does not filter anything
+        """
+        if isinstance(config, str):
+            config = json.loads(config) if config.strip() else {}
+        config = config or {}
+        allow, deny, rename = config.get("Allow"), config.get("Deny"), config.get("Rename")
+        tags = config.get("Tags") or DEFAULT_TAGS
+        if not allow and not deny and not rename and tuple(tags) == DEFAULT_TAGS:
+            return None
+        return cls(allow, deny, rename, tags)
+
+    def decide(self, namespace, name):
+        """
+        Return the measurement name a point should be written as, or None if it is dropped.
+        Decisions are cached per (NS, N), so patterns are only matched the first time a metric is seen.
+        """
+        key = (namespace, name)
+        try:
+            return self._decisions[key]
+        except KeyError:
+            pass
+        path = "{}/{}".format(namespace, name)
+        if (self.allow is not None and not self.allow.match(path)) or (self.deny is not None and self.deny.match(path)):
+            decision = None
+        else:
+            decision = self.rename.get(path, name)
+        if len(self._decisions) >= MAX_CACHE_SIZE:
+            self._decisions.clear()
+        self._decisions[key] = decision
+        return decision
+
+    def apply(self, telemetry):
+        """
+        Filter, rename and project a batch of telemetry points.
+
+        Parameters
+        ----------
+            telemetry(list): The telemetry points, in the NucleusEmitter format
+
+        Returns
+        -------
+            filtered(list): The points to write; renamed or projected points are copies
+        """
+        filtered = []
+        for point in telemetry:
+            name = self.decide(point["NS"], point["N"])
+            if name is None:
+                continue
+            if name != point["N"] or self.dropped_tags:
+                point = dict(point, N=name)
+                for tag in self.dropped_tags:
+                    point.pop(tag, None)
+            filtered.append(point)
+        dropped = len(telemetry) - len(filtered)
+        if dropped:
+            points_dropped.inc(dropped)
+        return filtered
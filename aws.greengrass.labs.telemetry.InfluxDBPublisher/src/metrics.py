@@ -0,0 +1,295 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import bisect
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Seconds, from a fast IPC publish up to a slow greengrass-cli call or InfluxDB write
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _format_labels(labels: Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A monotonically increasing count. inc() only holds the metric's own lock for the addition."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Labels = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def samples(self) -> List[Tuple[str, Labels, float]]:
+        return [(self.name, (), self._value)]
+
+
+class Gauge:
+    """A value that goes up and down, or is read from a callback such as a queue's qsize when collected."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Labels = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._value = 0
+        self._function: Optional[Callable[[], float]] = None
+        self._lock = threading.Lock()
+
+    def set(self, value: float):
+        self._value = value
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1):
+        self.inc(-amount)
+
+    def set_function(self, function: Callable[[], float]):
+        self._function = function
+
+    @property
+    def value(self) -> float:
+        if self._function is not None:
+            return self._function()
+        return self._value
+
+    def samples(self) -> List[Tuple[str, Labels, float]]:
+        return [(self.name, (), self.value)]
+
+
+class Histogram:
+    """Counts observations into fixed buckets, for durations such as encode time or write latency."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Labels = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        # One slot per bucket plus the +Inf bucket; counts are per bucket and made cumulative when collected
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+            self._count += 1
+
+    def time(self) -> "_Timer":
+        """Observe the duration of a with block, in seconds."""
+        return _Timer(self)
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def sum(self) -> float:
+        return self._sum
+
+    def samples(self) -> List[Tuple[str, Labels, float]]:
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        samples = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            samples.append((self.name + "_bucket", (("le", _format_value(bound)),), cumulative))
+        samples.append((self.name + "_sum", (), total))
+        samples.append((self.name + "_count", (), count))
+        return samples
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+        return False
+
+
+class Registry:
+    """The metrics of a process. Asking for a metric that already exists returns the existing one."""
+
+    def __init__(self):
+        self._metrics: Dict[Tuple[str, Labels], object] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, documentation: str, labels: Dict[str, str], **kwargs):
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            metric = self._metrics.get(key)
+            if metric is None:
+                metric = self._metrics[key] = cls(name, documentation, key[1], **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name: str, documentation: str, **labels: str) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labels)
+
+    def gauge(self, name: str, documentation: str, **labels: str) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labels)
+
+    def histogram(
+        self, name: str, documentation: str, buckets: Sequence[float] = DEFAULT_BUCKETS, **labels: str
+    ) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labels, buckets=buckets)
+
+    def metrics(self) -> List:
+        with self._lock:
+            return list(self._metrics.values())
+
+    def render_prometheus(self) -> str:
+        """The metrics in the Prometheus text exposition format."""
+        lines = []
+        documented = set()
+        for metric in sorted(self.metrics(), key=lambda m: (m.name, m.labels)):
+            if metric.name not in documented:
+                documented.add(metric.name)
+                lines.append(f"# HELP {metric.name} {metric.documentation}")
+                lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, extra, value in metric.samples():
+                lines.append(f"{name}{_format_labels(metric.labels, extra)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def to_telemetry(self, namespace: str, thing_name: str, ts_ms: Optional[int] = None) -> List[Dict]:
+        """
+        The metrics as NucleusEmitter style points, so they can travel the telemetry pipeline into InfluxDB.
+        Labels are appended to the point name, and histograms are reported as their _count and _sum. Values are
+        always floats, so a metric never changes the type of its InfluxDB field.
+        """
+        if ts_ms is None:
+            ts_ms = int(time.time() * 1000)
+        points = []
+        for metric in self.metrics():
+            suffix = "".join(f".{v}" for _, v in metric.labels)
+            if isinstance(metric, Histogram):
+                values = [("_count", metric.count, "Count"), ("_sum", metric.sum, "Seconds")]
+            else:
+                values = [("", metric.value, "Count")]
+            for name_suffix, value, unit in values:
+                points.append(
+                    {
+                        "NS": namespace,
+                        "N": metric.name + name_suffix + suffix,
+                        "U": unit,
+                        "A": "Sum" if metric.kind != "gauge" else "Average",
+                        "V": float(value),
+                        "TS": ts_ms,
+                        "thing_name": thing_name,
+                    }
+                )
+        return points
+
+
+REGISTRY = Registry()
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def serve(port: int, registry: Registry = REGISTRY, host: str = "127.0.0.1") -> HTTPServer:
+    """Serve the registry on http://host:port/metrics from a daemon thread. Port 0 picks a free port."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Scrapes are too frequent to log
+            pass
+
+    server = _ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logging.info(f"serving metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+class TelemetryReporter:
+    """Periodically hands the registry as telemetry points to publish, e.g. over IPC or as an InfluxDB write."""
+
+    def __init__(
+        self,
+        publish: Callable[[List[Dict]], None],
+        namespace: str,
+        thing_name: str,
+        interval: float = 60,
+        registry: Registry = REGISTRY,
+    ):
+        self.publish = publish
+        self.namespace = namespace
+        self.thing_name = thing_name
+        self.interval = interval
+        self.registry = registry
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics-telemetry", daemon=True)
+
+    def start(self) -> "TelemetryReporter":
+        self._thread.start()
+        return self
+
+    def report(self):
+        try:
+            self.publish(self.registry.to_telemetry(self.namespace, self.thing_name))
+        except Exception as e:
+            logging.warning(f"failed to publish self-telemetry: {e}")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.report()
+
+    def stop(self):
+        self._stop.set()
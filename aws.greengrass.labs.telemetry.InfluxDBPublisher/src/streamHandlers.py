@@ -10,6 +10,18 @@ from distutils.util import strtobool
 import awsiot.greengrasscoreipc.client as client
 from awsiot.greengrasscoreipc.model import SubscriptionResponseMessage
 
+import aggregation
+import metricFilter
+import metrics
+
+messages_in = metrics.REGISTRY.counter("publisher_messages_in_total", "Telemetry messages received")
+points_written = metrics.REGISTRY.counter("publisher_points_written_total", "Points written to InfluxDB")
+write_errors = metrics.REGISTRY.counter("publisher_write_errors_total", "Telemetry messages that failed to write")
+in_flight = metrics.REGISTRY.gauge("publisher_in_flight", "Telemetry messages being written")
+decode_seconds = metrics.REGISTRY.histogram("publisher_decode_seconds", "Time to decode a telemetry message")
+encode_seconds = metrics.REGISTRY.histogram("publisher_encode_seconds", "Time to convert telemetry into points")
+write_seconds = metrics.REGISTRY.histogram("publisher_write_seconds", "Time an InfluxDB write took")
+
 
 class InfluxDBDataStreamHandler(client.SubscribeToTopicStreamHandler):
     def __init__(self):
@@ -67,9 +79,11 @@ class InfluxDBDataStreamHandler(client.SubscribeToTopicStreamHandler):
 
 
 class TelemetryStreamHandler(client.SubscribeToTopicStreamHandler):
-    def __init__(self, influxdb_parameters):
+    def __init__(self, influxdb_parameters, metric_filter=None, aggregator=None, connection_pool_maxsize=None):
         super().__init__()
         self.influxdb_parameters = influxdb_parameters
+        self.metric_filter = metric_filter
+        self.aggregator = aggregator
 
         skip_tls_verify = bool(
             strtobool(self.influxdb_parameters["InfluxDBSkipTLSVerify"])
@@ -81,6 +95,10 @@ class TelemetryStreamHandler(client.SubscribeToTopicStreamHandler):
             urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
         ssl_verify = not skip_tls_verify
 
+        client_options = {}
+        if connection_pool_maxsize:
+            # One connection per thread writing through this handler, such as the gateway workers
+            client_options["connection_pool_maxsize"] = connection_pool_maxsize
         self.influxDBclient = influxdb_client.InfluxDBClient(
             url="{}://{}:{}".format(
                 self.influxdb_parameters["InfluxDBServerProtocol"],
@@ -90,6 +108,7 @@ class TelemetryStreamHandler(client.SubscribeToTopicStreamHandler):
             token=self.influxdb_parameters["InfluxDBToken"],
             org=self.influxdb_parameters["InfluxDBOrg"],
             verify_ssl=ssl_verify,
+            **client_options
         )
         self.write_client = self.influxDBclient.write_api(
             write_options=influxdb_client.client.write_api.SYNCHRONOUS
@@ -114,22 +133,81 @@ class TelemetryStreamHandler(client.SubscribeToTopicStreamHandler):
         -------
             None
         """
+        messages_in.inc()
+        in_flight.inc()
         try:
             if event is None:
                 raise ValueError("Received telemetry event was None!")
-            message = str(event.binary_message.message, "utf-8")
-            jsonString = json.loads(message)
+            with decode_seconds.time():
+                message = str(event.binary_message.message, "utf-8")
+                jsonString = json.loads(message)
             if len(jsonString) == 0:
                 raise ValueError("Retrieved telemetry is empty!")
-            parsedPoints = self.createPoints(jsonString)
+            self.write_telemetry(jsonString)
+        except Exception:
+            write_errors.inc()
+            logging.error("Received an error while writing to InfluxDB.", exc_info=True)
+            exit(1)
+        finally:
+            in_flight.dec()
+
+    def write_telemetry(self, telemetry) -> None:
+        """
+        Filter telemetry points and write the rest to InfluxDB, or add them to the aggregation window.
+
+        Parameters
+        ----------
+            telemetry(list): The telemetry points, in the NucleusEmitter format
+
+        Returns
+        -------
+            None
+        """
+        if self.metric_filter is not None:
+            # Dropped points are never encoded
+            telemetry = self.metric_filter.apply(telemetry)
+        if self.aggregator is not None:
+            telemetry = self.aggregator.add(telemetry)
+        self.write_points(telemetry)
+
+    def flush_aggregates(self) -> None:
+        """
+        Write the aggregates of the current window and start a new one.
+
+        Parameters
+        ----------
+            None
+
+        Returns
+        -------
+            None
+        """
+        if self.aggregator is not None:
+            self.write_points(self.aggregator.flush())
+
+    def write_points(self, telemetry) -> None:
+        """
+        Convert telemetry points to InfluxDB Points and write them to the configured bucket.
+
+        Parameters
+        ----------
+            telemetry(list): The telemetry points, in the NucleusEmitter format
+
+        Returns
+        -------
+            None
+        """
+        if not telemetry:
+            return
+        with encode_seconds.time():
+            parsedPoints = self.createPoints(telemetry)
+        with write_seconds.time():
             self.write_client.write(
                 bucket=self.influxdb_parameters["InfluxDBBucket"],
                 org=self.influxdb_parameters["InfluxDBOrg"],
                 record=parsedPoints,
             )
-        except Exception:
-            logging.error("Received an error while writing to InfluxDB.", exc_info=True)
-            exit(1)
+        points_written.inc(len(parsedPoints))
 
     def on_stream_error(self, error: Exception) -> bool:
         """
@@ -160,6 +238,22 @@ class TelemetryStreamHandler(client.SubscribeToTopicStreamHandler):
         """
         logging.info("Subscribe to Greengrass telemetry topic stream closed.")
 
+    def close(self) -> None:
+        """
+        Close the InfluxDB client once no more telemetry will be written.
+
+        Parameters
+        ----------
+            None
+
+        Returns
+        -------
+            None
+        """
+        self.write_client.close()
+        self.influxDBclient.close()
+        logging.info("Closed the InfluxDB client.")
+
     def createPoints(self, jsonString):
         """
         Helper function to create an array of InfluxDB Points to publish to InfluxDB
@@ -174,15 +268,16 @@ class TelemetryStreamHandler(client.SubscribeToTopicStreamHandler):
         """
         points = []
         for metric in jsonString:
+            p = influxdb_client.Point(metric["N"])
+            # Tags projected away by the metric filter are missing from the point
+            for tag in metricFilter.DEFAULT_TAGS:
+                if tag in metric:
+                    p.tag(tag, metric[tag])
+            field = "V"
+            if aggregation.STATISTIC_TAG in metric:
+                p.tag(aggregation.STATISTIC_TAG, metric[aggregation.STATISTIC_TAG])
+                field = aggregation.AGGREGATE_FIELD
             # Must convert to UTC for InfluxDB
-            p = (
-                influxdb_client.Point(metric["N"])
-                .tag("NS", metric["NS"])
-                .tag("U", metric["U"])
-                .tag("A", metric["A"])
-                .tag("thing_name", metric["thing_name"])
-                .field("V", metric["V"])
-                .time(datetime.fromtimestamp(metric["TS"] / 1000.0, tz=timezone.utc))
-            )
+            p.field(field, metric["V"]).time(datetime.fromtimestamp(metric["TS"] / 1000.0, tz=timezone.utc))
             points.append(p)
         return points
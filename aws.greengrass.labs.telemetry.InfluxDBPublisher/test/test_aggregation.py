@@ -0,0 +1,63 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import sys
+
+import pytest
+
+sys.path.append("src/")
+
+import src.aggregation as aggregation  # noqa: E402
+
+
+def point(name, value, thing_name="thing_name", namespace="SystemMetrics"):
+    return {"A": "Average", "N": name, "NS": namespace, "TS": 1627597331445, "U": "Percent", "V": value,
+            "thing_name": thing_name}
+
+
+def by_name(points):
+    return {"{}/{}_{}".format(p["thing_name"], p["N"], p["statistic"]): p["V"] for p in points}
+
+
+@pytest.mark.parametrize("use_numpy", [False, True])
+def test_window_statistics(use_numpy):
+    aggregator = aggregation.Aggregator(60, use_numpy=use_numpy)
+    assert aggregator.add([point("CpuUsage", 10), point("CpuUsage", 30), point("CpuUsage", 5, "other")]) == []
+    assert aggregator.add([point("CpuUsage", 20)]) == []
+
+    aggregates = aggregator.flush(ts_ms=1000)
+
+    assert by_name(aggregates) == {
+        "thing_name/CpuUsage_min": 10.0,
+        "thing_name/CpuUsage_max": 30.0,
+        "thing_name/CpuUsage_mean": 20.0,
+        "thing_name/CpuUsage_last": 20.0,
+        "thing_name/CpuUsage_count": 3.0,
+        "other/CpuUsage_min": 5.0,
+        "other/CpuUsage_max": 5.0,
+        "other/CpuUsage_mean": 5.0,
+        "other/CpuUsage_last": 5.0,
+        "other/CpuUsage_count": 1.0,
+    }
+    assert all(p["TS"] == 1000 and p["NS"] == "SystemMetrics" for p in aggregates)
+    # The series keeps its name and tags, so queries on the raw N and U still find it
+    assert all(p["N"] == "CpuUsage" and p["U"] == "Percent" for p in aggregates)
+    assert aggregator.flush() == []
+
+
+@pytest.mark.parametrize("use_numpy", [False, True])
+def test_passthrough_and_non_numeric_points_stay_raw(use_numpy):
+    aggregator = aggregation.Aggregator(60, passthrough=["SystemMetrics/TotalNumberOfFDs"], use_numpy=use_numpy)
+    raw = [point("TotalNumberOfFDs", 7316), point("State", "RUNNING"), point("Broken", True)]
+
+    assert aggregator.add(raw + [point("CpuUsage", 1)]) == raw
+    assert [(p["N"], p["statistic"]) for p in aggregator.flush()] == [("CpuUsage", s) for s in aggregation.STATISTICS]
+
+
+def test_from_config():
+    assert aggregation.Aggregator.from_config("") is None
+    assert aggregation.Aggregator.from_config('{"Interval": 0}') is None
+
+    aggregator = aggregation.Aggregator.from_config('{"Interval": 30, "Passthrough": ["SystemMetrics/*"]}')
+    assert aggregator.interval == 30
+    assert aggregator.add([point("CpuUsage", 1)]) == [point("CpuUsage", 1)]
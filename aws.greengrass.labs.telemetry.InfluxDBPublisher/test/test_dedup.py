@@ -0,0 +1,33 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import sys
+
+sys.path.append("src/")
+
+import src.dedup as dedup  # noqa: E402
+
+
+def test_parse_stamped_and_unstamped_messages():
+    assert dedup.parse(b'#thing.abc:9ix\n[{"N": "CpuUsage"}]') == ("thing.abc", 12345, b'[{"N": "CpuUsage"}]')
+    for payload in (b'[{"N": "CpuUsage"}]', b"#no newline", b"#nocolon\n[]", b"#thing:zz!\n[]"):
+        assert dedup.parse(payload) == (None, None, payload)
+
+
+def test_window_accepts_reordered_messages_once():
+    window = dedup.SlidingWindow(8)
+    assert [window.seen(s) for s in (0, 2, 1, 2, 0, 3)] == [False, False, False, True, True, False]
+    window.seen(20)
+    # Older than the window
+    assert window.seen(12)
+    assert not window.seen(13)
+
+
+def test_deduplicator_bounds_its_sources():
+    deduplicator = dedup.Deduplicator(max_sources=2)
+    assert deduplicator.accept(b"#a:0\nx") == b"x"
+    assert deduplicator.accept(b"#a:0\nx") is None
+    for source in ("b", "c"):
+        deduplicator.is_duplicate(source, 0)
+    # "a" was forgotten
+    assert deduplicator.accept(b"#a:0\nx") == b"x"
@@ -0,0 +1,122 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import sys
+import threading
+
+from awsiot.greengrasscoreipc.model import BinaryMessage, SubscriptionResponseMessage
+
+sys.path.append("src/")
+
+import src.gateway as gateway  # noqa: E402
+
+
+def batch(thing_name, size=1):
+    return [{"N": "CpuUsage", "NS": "SystemMetrics", "V": float(i), "thing_name": thing_name} for i in range(size)]
+
+
+def test_things_are_served_in_turn():
+    shard = gateway._Shard("test", None, rate=0, burst=0, max_pending=16)
+    for _ in range(3):
+        shard.submit("noisy", batch("noisy"))
+    shard.submit("quiet", batch("quiet"))
+
+    rounds = [[p[0]["thing_name"] for _, p in shard._take_round()] for _ in range(3)]
+    assert rounds == [["noisy", "quiet"], ["noisy"], ["noisy"]]
+
+
+def test_rate_limit_defers_a_thing_without_blocking_others():
+    shard = gateway._Shard("test", None, rate=0.001, burst=10, max_pending=16)
+    shard.submit("noisy", batch("noisy", 50))
+    shard.submit("noisy", batch("noisy", 50))
+    shard.submit("quiet", batch("quiet"))
+
+    assert [p[0]["thing_name"] for _, p in shard._take_round()] == ["noisy", "quiet"]
+    before = gateway.deferred.value
+    shard.stop()
+    # Once stopping, what is pending is written regardless of the limit
+    assert [p[0]["thing_name"] for _, p in shard._take_round()] == ["noisy"]
+    assert shard._take_round() is None
+    assert gateway.deferred.value == before
+
+
+def test_idle_buckets_are_forgotten_once_refilled(mocker):
+    now = mocker.patch("src.gateway.time.monotonic", return_value=100.0)
+    shard = gateway._Shard("test", None, rate=10, burst=10, max_pending=16)
+    for i in range(100):
+        shard.submit("thing-{}".format(i), batch("thing-{}".format(i), 5))
+    shard._take_round()
+    assert len(shard.buckets) == 100
+
+    # Half a second refills the 5 points taken, except for the thing that sent more than its burst
+    now.return_value = 100.5
+    shard.submit("busy", batch("busy", 20))
+    shard._take_round()
+    assert list(shard.buckets) == ["busy"]
+
+    now.return_value = 101.0
+    shard.submit("quiet", batch("quiet"))
+    shard._take_round()
+    assert list(shard.buckets) == ["busy", "quiet"]
+    now.return_value = 103.0
+    shard.submit("quiet", batch("quiet"))
+    shard._take_round()
+    assert list(shard.buckets) == ["quiet"]
+
+
+def test_oldest_batches_of_a_thing_are_dropped():
+    shard = gateway._Shard("test", None, rate=0, burst=0, max_pending=2)
+    before = gateway.dropped.value
+    for i in range(3):
+        shard.submit("noisy", [{"V": i, "thing_name": "noisy"}])
+
+    assert gateway.dropped.value == before + 1
+    assert [p[0]["V"] for _, p in shard.queues["noisy"]] == [1, 2]
+
+
+def test_gateway_writes_every_thing_and_drains_on_stop():
+    written = []
+    lock = threading.Lock()
+
+    def write(telemetry):
+        with lock:
+            written.extend(telemetry)
+
+    telemetry_gateway = gateway.Gateway("gateway/+/greengrass/telemetry", workers=3).start(write)
+    handler = telemetry_gateway.stream_handler()
+    for i in range(10):
+        message = BinaryMessage(message=json.dumps(batch("thing-{}".format(i), 5)).encode())
+        handler.on_stream_event(SubscriptionResponseMessage(binary_message=message))
+    telemetry_gateway.stop()
+
+    assert len(written) == 50
+    assert telemetry_gateway.shard("thing-1") is telemetry_gateway.shard("thing-1")
+
+
+def test_invalid_messages_are_skipped():
+    telemetry_gateway = gateway.Gateway("t", workers=1)
+    handler = telemetry_gateway.stream_handler()
+    handler.on_stream_event(SubscriptionResponseMessage(binary_message=BinaryMessage(message=b"{}")))
+
+
+def test_from_config():
+    assert gateway.Gateway.from_config("") is None
+    assert gateway.Gateway.from_config('{"Topic": ""}') is None
+
+    telemetry_gateway = gateway.Gateway.from_config('{"Topic": "gateway/#", "Workers": 2, "PointsPerSecond": 10}')
+    assert telemetry_gateway.topic == "gateway/#"
+    assert telemetry_gateway.workers == 2
+    assert telemetry_gateway.points_per_second == 10
+
+
+def test_redelivered_messages_are_written_once():
+    written = []
+    telemetry_gateway = gateway.Gateway("t", workers=1).start(written.extend)
+    handler = telemetry_gateway.stream_handler()
+    stamped = b"#thing.1:a\n" + json.dumps(batch("thing", 2)).encode()
+    for message in (stamped, stamped, json.dumps(batch("thing", 1)).encode()):
+        handler.on_stream_event(SubscriptionResponseMessage(binary_message=BinaryMessage(message=message)))
+    telemetry_gateway.stop()
+
+    assert len(written) == 3
@@ -0,0 +1,46 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import logging
+import sys
+
+sys.path.append("src/")
+
+import src.logutil as logutil  # noqa: E402
+
+
+def make_record(lineno=1):
+    return logging.LogRecord("test", logging.INFO, "file.py", lineno, "written %s", ("points",), None)
+
+
+def test_rate_limit_filter_per_call_site():
+    log_filter = logutil.RateLimitFilter(per_second=0.001, burst=1)
+    assert log_filter.filter(make_record())
+    assert not log_filter.filter(make_record())
+    assert log_filter.filter(make_record(lineno=2))
+
+
+def test_sample_filter_annotates_sampled_records():
+    log_filter = logutil.SampleFilter(every=2)
+    assert [log_filter.filter(make_record()) for _ in range(3)] == [True, False, True]
+    record = make_record()
+    log_filter.filter(record)
+    log_filter.filter(record)
+    assert record.getMessage() == "written points (sampled 2)"
+
+
+def test_configure_json_through_queue(capsys):
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    try:
+        logutil.configure(json_format=True)
+        logging.getLogger("publisher").warning("write failed for %s", "bucket", extra={"bucket": "b"})
+        logutil.flush()
+        entry = json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+        assert entry["message"] == "write failed for bucket"
+        assert entry["bucket"] == "b"
+    finally:
+        logutil.flush()
+        root.handlers = handlers
+        root.setLevel(level)
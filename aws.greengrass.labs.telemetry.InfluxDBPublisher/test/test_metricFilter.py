@@ -0,0 +1,58 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import sys
+
+sys.path.append("src/")
+
+import src.metricFilter as metricFilter  # noqa: E402
+
+
+def point(namespace, name):
+    return {"A": "Average", "N": name, "NS": namespace, "TS": 1627597331445, "U": "Percent", "V": 1.0, "thing_name": "t"}
+
+
+telemetry = [
+    point("SystemMetrics", "CpuUsage"),
+    point("SystemMetrics", "TotalNumberOfFDs"),
+    point("GreengrassComponents", "NumberOfComponentsRunning"),
+]
+
+
+def test_allow_and_deny():
+    metric_filter = metricFilter.MetricFilter(allow=["SystemMetrics/*"], deny=["*/TotalNumberOfFDs"])
+    before = metricFilter.points_dropped.value
+
+    filtered = metric_filter.apply(telemetry)
+
+    assert [p["N"] for p in filtered] == ["CpuUsage"]
+    assert filtered[0] is telemetry[0]
+    assert metricFilter.points_dropped.value == before + 2
+
+
+def test_rename_and_project_tags():
+    metric_filter = metricFilter.MetricFilter(rename={"SystemMetrics/CpuUsage": "cpu"}, tags=["NS", "thing_name"])
+
+    filtered = metric_filter.apply(telemetry)
+
+    assert [p["N"] for p in filtered] == ["cpu", "TotalNumberOfFDs", "NumberOfComponentsRunning"]
+    assert set(filtered[0]) == {"N", "NS", "TS", "V", "thing_name"}
+    assert telemetry[0]["N"] == "CpuUsage" and "U" in telemetry[0]
+
+
+def test_decisions_are_cached():
+    metric_filter = metricFilter.MetricFilter(deny=["SystemMetrics/CpuUsage"])
+    metric_filter.apply(telemetry)
+    metric_filter.deny = None
+
+    assert metric_filter.decide("SystemMetrics", "CpuUsage") is None
+    assert metric_filter.decide("SystemMetrics", "TotalNumberOfFDs") == "TotalNumberOfFDs"
+
+
+def test_from_config():
+    assert metricFilter.MetricFilter.from_config("") is None
+    assert metricFilter.MetricFilter.from_config('{"Allow": [], "Deny": [], "Rename": {}}') is None
+
+    metric_filter = metricFilter.MetricFilter.from_config('{"Deny": ["GreengrassComponents/*"], "Tags": ["NS"]}')
+    assert [p["N"] for p in metric_filter.apply(telemetry)] == ["CpuUsage", "TotalNumberOfFDs"]
+    assert metric_filter.tags == ("NS",)
@@ -0,0 +1,78 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import sys
+import urllib.request
+
+import pytest
+
+sys.path.append("src/")
+
+import src.metrics as metrics  # noqa: E402
+
+
+def test_counter_gauge_and_histogram():
+    registry = metrics.Registry()
+    registry.counter("written_total", "Written").inc(3)
+    gauge = registry.gauge("in_flight", "In flight")
+    gauge.inc()
+    gauge.set_function(lambda: 2)
+    histogram = registry.histogram("write_seconds", "Writes", buckets=(0.1, 1.0))
+    histogram.observe(0.05)
+    with histogram.time():
+        pass
+
+    text = registry.render_prometheus()
+    assert "written_total 3" in text
+    assert "in_flight 2" in text
+    assert 'write_seconds_bucket{le="0.1"} 2' in text
+    assert 'write_seconds_bucket{le="+Inf"} 2' in text
+    assert "write_seconds_count 2" in text
+
+
+def test_labels_and_type_conflicts():
+    registry = metrics.Registry()
+    registry.counter("relayed_total", "Relayed", topic="a").inc()
+    assert registry.counter("relayed_total", "Relayed", topic="a").value == 1
+    with pytest.raises(ValueError):
+        registry.histogram("relayed_total", "Relayed", topic="a")
+    assert 'relayed_total{topic="a"} 1' in registry.render_prometheus()
+
+
+def test_to_telemetry_points_are_floats():
+    registry = metrics.Registry()
+    registry.counter("written_total", "Written").inc()
+    registry.histogram("write_seconds", "Writes").observe(1)
+    points = registry.to_telemetry("ns", "thing", ts_ms=5)
+    assert sorted(p["N"] for p in points) == ["write_seconds_count", "write_seconds_sum", "written_total"]
+    assert all(isinstance(p["V"], float) and p["thing_name"] == "thing" for p in points)
+
+
+def test_serve_and_not_found():
+    registry = metrics.Registry()
+    registry.counter("served_total", "Served").inc()
+    server = metrics.serve(0, registry)
+    base = "http://127.0.0.1:{}".format(server.server_address[1])
+    try:
+        assert "served_total 1" in urllib.request.urlopen(base + "/metrics", timeout=5).read().decode()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(base + "/other", timeout=5)
+    finally:
+        server.shutdown()
+
+
+def test_reporter_start_report_and_stop():
+    registry = metrics.Registry()
+    registry.counter("reported_total", "Reported").inc()
+    published = []
+    reporter = metrics.TelemetryReporter(published.append, "ns", "thing", interval=0.01, registry=registry).start()
+    reporter.report()
+    reporter.stop()
+    assert published[0][0]["N"] == "reported_total"
+
+
+def test_reporter_logs_publish_errors():
+    def fail(points):
+        raise RuntimeError("write failed")
+
+    metrics.TelemetryReporter(fail, "ns", "thing", registry=metrics.Registry()).report()
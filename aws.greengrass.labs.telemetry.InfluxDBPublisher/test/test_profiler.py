@@ -0,0 +1,68 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import sys
+import time
+from concurrent.futures import Future
+
+from awsiot.greengrasscoreipc.model import JsonMessage, SubscriptionResponseMessage
+
+sys.path.append("src/")
+
+import src.profiler as profiler  # noqa: E402
+
+
+def test_sampler_writes_profile(tmp_path):
+    sampler = profiler.StackSampler(str(tmp_path), "publisher", interval_ms=1, duration=0.02).start()
+    sampler.join(5)
+    assert sampler.samples > 0
+    assert open(sampler.path).read().splitlines()[0].startswith("MainThread;")
+
+
+def test_listen_v1(tmp_path, mocker):
+    ipc_client = mocker.Mock()
+    ipc_client.new_get_configuration.return_value.get_response.return_value.result.return_value.value = {
+        "Enabled": "false"
+    }
+    control = profiler.ProfilerControl("aws.greengrass.labs.telemetry.InfluxDBPublisher", str(tmp_path))
+    control.listen_v1(ipc_client, timeout=1)
+
+    request = ipc_client.new_subscribe_to_topic.return_value.activate.call_args.args[0]
+    assert request.topic == "greengrass/profiler/aws.greengrass.labs.telemetry.InfluxDBPublisher"
+    control_handler = ipc_client.new_subscribe_to_topic.call_args.args[0]
+    control_handler.on_stream_event(
+        SubscriptionResponseMessage(json_message=JsonMessage(message={"action": "start", "durationSeconds": 5}))
+    )
+    assert control.sampler.running
+
+    ipc_client.new_get_configuration.return_value.get_response.return_value.result.return_value.value = {
+        "Enabled": "false"
+    }
+    configuration_handler = ipc_client.new_subscribe_to_configuration_update.call_args.args[0]
+    configuration_handler.on_stream_event(None)
+    control.sampler.join(5)
+    assert not control.sampler.running
+
+
+def test_listen_v1_reloads_off_the_callback_thread(tmp_path, mocker):
+    ipc_client = mocker.Mock()
+    get_response = ipc_client.new_get_configuration.return_value.get_response
+    get_response.return_value.result.return_value.value = {"Enabled": "false"}
+    control = profiler.ProfilerControl("aws.greengrass.labs.telemetry.InfluxDBPublisher", str(tmp_path))
+    control.listen_v1(ipc_client, timeout=5)
+
+    # Like the V1 client, the response to GetConfiguration only arrives once the stream callback has returned
+    response = Future()
+    get_response.return_value = response
+    configuration_handler = ipc_client.new_subscribe_to_configuration_update.call_args.args[0]
+    configuration_handler.on_stream_event(None)
+    assert control.sampler is None
+    response.set_result(mocker.Mock(value={"Enabled": "true", "DurationSeconds": 5}))
+
+    for _ in range(500):
+        if control.sampler is not None:
+            break
+        time.sleep(0.01)
+    assert control.sampler.running
+    control.stop()
+    control.sampler.join(5)
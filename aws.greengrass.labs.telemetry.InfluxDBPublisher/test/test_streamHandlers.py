@@ -5,16 +5,17 @@ import sys
 import pytest
 import json
 from unittest.mock import patch, ANY
-import src.streamHandlers as streamHandler
 
-from awsiot.greengrasscoreipc.model import (
+sys.path.append("src/")
+
+import src.streamHandlers as streamHandler  # noqa: E402
+
+from awsiot.greengrasscoreipc.model import (  # noqa: E402
     JsonMessage,
     BinaryMessage,
     SubscriptionResponseMessage,
 )
 
-sys.path.append("src/")
-
 testparams = {
     "InfluxDBContainerName": "greengrass_InfluxDB",
     "InfluxDBOrg": "greengrass",
@@ -110,3 +111,97 @@ def test_empty_telemetry_received():
     with pytest.raises(SystemExit) as pytest_wrapped_e:
         handler.on_stream_event(response_message)
         assert pytest_wrapped_e.type == SystemExit
+
+
+@patch("influxdb_client.InfluxDBClient")
+def test_write_telemetry_counts_points(InfluxDBClient):
+    handler = streamHandler.TelemetryStreamHandler(testparams)
+    before = streamHandler.points_written.value
+    telemetry = [
+        {
+            "A": "Sum",
+            "N": "publisher_messages_in_total",
+            "NS": "aws.greengrass.labs.telemetry.InfluxDBPublisher",
+            "TS": 1627597331445,
+            "U": "Count",
+            "V": 3.0,
+            "thing_name": "thing_name",
+        }
+    ]
+    handler.write_telemetry(telemetry)
+
+    handler.write_client.write.assert_called_once()
+    assert streamHandler.points_written.value == before + 1
+
+
+@patch("influxdb_client.InfluxDBClient")
+def test_write_telemetry_filters_before_encoding(InfluxDBClient, mocker):
+    import src.metricFilter as metricFilter
+
+    handler = streamHandler.TelemetryStreamHandler(testparams, metricFilter.MetricFilter(deny=["SystemMetrics/*"]))
+    createPoints = mocker.spy(handler, "createPoints")
+    telemetry = [
+        {
+            "A": "Average",
+            "N": "CpuUsage",
+            "NS": "SystemMetrics",
+            "TS": 1627597331445,
+            "U": "Percent",
+            "V": 26.21981271562346,
+            "thing_name": "thing_name",
+        }
+    ]
+    handler.write_telemetry(telemetry)
+
+    createPoints.assert_not_called()
+    handler.write_client.write.assert_not_called()
+
+
+def test_createPoints_writes_projected_tags():
+    telemetry = [{"N": "CpuUsage", "NS": "SystemMetrics", "TS": 1627597331445, "V": 1.5, "thing_name": "thing_name"}]
+
+    points = streamHandler.TelemetryStreamHandler.createPoints(None, telemetry)
+
+    assert points[0].to_line_protocol() == "CpuUsage,NS=SystemMetrics,thing_name=thing_name V=1.5 1627597331445000000"
+
+
+def test_createPoints_tags_aggregates_with_their_statistic():
+    telemetry = [{"N": "CpuUsage", "NS": "SystemMetrics", "TS": 1627597331445, "V": 1.5, "statistic": "mean"}]
+
+    points = streamHandler.TelemetryStreamHandler.createPoints(None, telemetry)
+
+    assert points[0].to_line_protocol() == "CpuUsage,NS=SystemMetrics,statistic=mean aggregate=1.5 1627597331445000000"
+
+
+def test_createPoints_writes_aggregates_apart_from_integer_series():
+    telemetry = [
+        {"N": "TotalNumberOfFDs", "NS": "SystemMetrics", "TS": 1627597331445, "V": 7},
+        {"N": "TotalNumberOfFDs", "NS": "SystemMetrics", "TS": 1627597331445, "V": 7.0, "statistic": "last"},
+    ]
+
+    points = streamHandler.TelemetryStreamHandler.createPoints(None, telemetry)
+
+    assert [p.to_line_protocol().split(" ")[1] for p in points] == ["V=7i", "aggregate=7"]
+
+
+@patch("influxdb_client.InfluxDBClient")
+def test_write_telemetry_aggregates_until_flushed(InfluxDBClient):
+    import src.aggregation as aggregation
+
+    handler = streamHandler.TelemetryStreamHandler(testparams, aggregator=aggregation.Aggregator(60))
+    telemetry = [
+        {
+            "A": "Average",
+            "N": "CpuUsage",
+            "NS": "SystemMetrics",
+            "TS": 1627597331445,
+            "U": "Percent",
+            "V": 26.21981271562346,
+            "thing_name": "thing_name",
+        }
+    ]
+    handler.write_telemetry(telemetry)
+    handler.write_client.write.assert_not_called()
+
+    handler.flush_aggregates()
+    assert len(handler.write_client.write.call_args[1]["record"]) == len(aggregation.STATISTICS)
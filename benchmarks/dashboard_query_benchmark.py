@@ -0,0 +1,267 @@
+"""
+Measure how the Flux queries of the bundled Grafana dashboard scale with the amount of stored telemetry.
+
+For every combination of --components and --days, synthetic telemetry shaped like the TelemetryInjector
+output is converted with the InfluxDBPublisher's own createPoints and loaded into a dedicated bucket of a
+local InfluxDB. Every panel and variable query of the dashboard is then run over each of --ranges, reporting
+the client-side latency and the memory InfluxDB allocated for the query (from the Flux query profiler).
+
+Example:
+    python3 benchmarks/dashboard_query_benchmark.py --url http://localhost:8086 --token <all-access token> \\
+        --org greengrass --components 10,50 --days 1,7 --ranges 1h,1d,7d
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PUBLISHER_SRC = os.path.join(REPO_ROOT, "aws.greengrass.labs.telemetry.InfluxDBPublisher", "src")
+DASHBOARD_SRC = os.path.join(REPO_ROOT, "aws.greengrass.labs.dashboard.InfluxDBGrafana", "src")
+DASHBOARD_PATH = os.path.join(
+    REPO_ROOT,
+    "aws.greengrass.labs.dashboard.InfluxDBGrafana",
+    "dashboards",
+    "greengrass-telemetry-dashboard-influxdb.json",
+)
+sys.path[:0] = [PUBLISHER_SRC, DASHBOARD_SRC]
+
+from influxdb_client.client.query_api import QueryOptions  # noqa: E402
+from influxdb_client.client.write_api import SYNCHRONOUS  # noqa: E402
+
+import renderDashboard  # noqa: E402
+import streamHandlers  # noqa: E402
+
+# The metrics the NucleusEmitter publishes, as (N, U, A); extra metrics are synthetic
+SYSTEM_METRICS = [
+    ("CpuUsage", "Percent", "Average"),
+    ("SystemMemUsage", "Megabytes", "Count"),
+    ("TotalNumberOfFDs", "Count", "Count"),
+]
+COMPONENT_STATES = ["RUNNING", "FINISHED", "BROKEN", "ERRORED"]
+WRITE_BATCH_SIZE = 5000
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_duration(value: str) -> int:
+    """Parse a duration such as 15m or 7d into seconds."""
+    return int(value[:-1]) * DURATION_UNITS[value[-1]]
+
+
+def parse_int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",")]
+
+
+def synthetic_batch(
+    thing_name: str, ts_ms: int, metrics: int, components: int, rng: random.Random
+) -> List[Dict]:
+    """
+    Build one telemetry batch as the TelemetryInjector publishes it: the NucleusEmitter
+    system metrics followed by one ComponentStatus point per component.
+    """
+    batch = []
+    for i in range(metrics):
+        if i < len(SYSTEM_METRICS):
+            name, unit, aggregation = SYSTEM_METRICS[i]
+        else:
+            name, unit, aggregation = f"SyntheticMetric{i}", "Count", "Average"
+        batch.append(
+            {"NS": "SystemMetrics", "N": name, "U": unit, "A": aggregation, "V": rng.uniform(0, 100), "TS": ts_ms}
+        )
+    for i in range(components):
+        # Components are mostly healthy, with the occasional state change
+        state = COMPONENT_STATES[0] if rng.random() < 0.98 else rng.choice(COMPONENT_STATES)
+        batch.append(
+            {"NS": "ComponentStatus", "N": f"com.example.Component{i}", "U": "None", "A": "None", "V": state, "TS": ts_ms}
+        )
+    for point in batch:
+        point["thing_name"] = thing_name
+    return batch
+
+
+def synthetic_telemetry(
+    things: int, metrics: int, components: int, days: int, interval: int, end: datetime, seed: int = 0
+) -> Iterator[List[Dict]]:
+    """Yield one batch per thing and emit interval, covering the given number of days up to end."""
+    rng = random.Random(seed)
+    end_ms = int(end.timestamp() * 1000)
+    start_ms = end_ms - days * 86400 * 1000
+    for ts_ms in range(start_ms, end_ms, interval * 1000):
+        for t in range(things):
+            yield synthetic_batch(f"thing-{t}", ts_ms, metrics, components, rng)
+
+
+def extract_queries(dashboard: Dict) -> List[Tuple[str, str]]:
+    """Return (name, query) for every panel target and query variable in a dashboard, including nested panels."""
+    queries = []
+
+    def walk(panels):
+        for panel in panels:
+            for target in panel.get("targets", []):
+                if target.get("query"):
+                    queries.append((f"{panel.get('title', panel.get('id'))} [{target.get('refId', 'A')}]",
+                                    target["query"]))
+            walk(panel.get("panels", []))
+
+    walk(dashboard.get("panels", []))
+    for variable in dashboard.get("templating", {}).get("list", []):
+        query = variable.get("query")
+        if isinstance(query, dict):
+            query = query.get("query")
+        if variable.get("type") == "query" and query:
+            queries.append((f"${variable['name']}", query))
+    return queries
+
+
+def bind_query(query: str, start: datetime, stop: datetime, variables: Dict[str, str]) -> str:
+    """Define the time range Grafana would provide in `v` and substitute dashboard variables."""
+    for name, value in variables.items():
+        query = query.replace(f"${{{name}}}", value).replace(f"${name}", value)
+    window = max(int((stop - start).total_seconds() // 1000), 1)
+    prelude = (
+        f"option v = {{timeRangeStart: {start.strftime('%Y-%m-%dT%H:%M:%SZ')}, "
+        f"timeRangeStop: {stop.strftime('%Y-%m-%dT%H:%M:%SZ')}, windowPeriod: {window}s}}\n\n"
+    )
+    return prelude + query
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+def load_dataset(client, handler, org: str, bucket: str, batches: Iterator[List[Dict]]) -> Tuple[int, float]:
+    """Write the batches through createPoints in large writes, returning (points, seconds)."""
+    write_api = client.write_api(write_options=SYNCHRONOUS)
+    started = time.perf_counter()
+    pending = []
+    written = 0
+    for batch in batches:
+        pending.extend(handler.createPoints(batch))
+        if len(pending) >= WRITE_BATCH_SIZE:
+            write_api.write(bucket=bucket, org=org, record=pending)
+            written += len(pending)
+            pending = []
+    if pending:
+        write_api.write(bucket=bucket, org=org, record=pending)
+        written += len(pending)
+    return written, time.perf_counter() - started
+
+
+def run_query(client, org: str, flux: str, repeat: int) -> Dict:
+    """Run a query several times, returning its rows, latencies and the largest allocation InfluxDB reported."""
+    profiles = []
+    query_api = client.query_api(
+        query_options=QueryOptions(profilers=["query"], profiler_callback=lambda record: profiles.append(record))
+    )
+    latencies = []
+    rows = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        tables = query_api.query(flux, org=org)
+        latencies.append((time.perf_counter() - started) * 1000)
+        rows = sum(len(table.records) for table in tables)
+    max_allocated = max((p.values.get("MaxAllocated") or 0 for p in profiles), default=0)
+    return {
+        "rows": rows,
+        "latency_ms_p50": statistics.median(latencies),
+        "latency_ms_p95": percentile(latencies, 95),
+        "max_allocated_bytes": max_allocated,
+    }
+
+
+def influxdb_parameters(args, bucket: str) -> Dict[str, str]:
+    """The parameters the InfluxDBPublisher would receive from the token handshake."""
+    protocol, address = args.url.split("://", 1)
+    interface, port = address.rsplit(":", 1)
+    return {
+        "InfluxDBServerProtocol": protocol,
+        "InfluxDBInterface": interface,
+        "InfluxDBPort": port,
+        "InfluxDBToken": args.token,
+        "InfluxDBOrg": args.org,
+        "InfluxDBBucket": bucket,
+        "InfluxDBSkipTLSVerify": args.skip_tls_verify,
+    }
+
+
+def benchmark(args) -> List[Dict]:
+    with open(args.dashboard_path) as f:
+        dashboard = json.load(f)
+    ranges = args.ranges.split(",")
+    end = datetime.now(tz=timezone.utc).replace(microsecond=0)
+    results = []
+
+    for components in parse_int_list(args.components):
+        for days in parse_int_list(args.days):
+            bucket = f"{args.bucket_prefix}-{components}c-{days}d"
+            handler = streamHandlers.TelemetryStreamHandler(influxdb_parameters(args, bucket))
+            client = handler.influxDBclient
+            buckets_api = client.buckets_api()
+            existing = buckets_api.find_bucket_by_name(bucket)
+            if existing:
+                buckets_api.delete_bucket(existing)
+            created = buckets_api.create_bucket(bucket_name=bucket, org=args.org)
+
+            batches = synthetic_telemetry(args.things, args.metrics, components, days, args.interval, end, args.seed)
+            points, seconds = load_dataset(client, handler, args.org, bucket, batches)
+            print(f"loaded {points} points into {bucket} in {seconds:.1f}s", file=sys.stderr)
+
+            rendered = renderDashboard.render_dashboard(dashboard, "benchmark", bucket)
+            for name, query in extract_queries(rendered):
+                for r in ranges:
+                    flux = bind_query(query, end - timedelta(seconds=parse_duration(r)), end, {"device": "thing-0"})
+                    result = run_query(client, args.org, flux, args.repeat)
+                    result.update({"query": name, "range": r, "components": components, "days": days})
+                    results.append(result)
+
+            if not args.keep:
+                buckets_api.delete_bucket(created)
+            client.close()
+    return results
+
+
+def print_report(results: List[Dict]) -> None:
+    header = f"{'components':>10} {'days':>5} {'range':>6} {'rows':>8} {'p50 ms':>9} {'p95 ms':>9} {'max alloc':>12}  query"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['components']:>10} {r['days']:>5} {r['range']:>6} {r['rows']:>8} {r['latency_ms_p50']:>9.1f} "
+            f"{r['latency_ms_p95']:>9.1f} {r['max_allocated_bytes']:>12}  {r['query']}"
+        )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the Grafana dashboard Flux queries")
+    parser.add_argument("--url", default="http://localhost:8086", help="The InfluxDB URL")
+    parser.add_argument("--token", required=True, help="A token allowed to create and delete buckets")
+    parser.add_argument("--org", default="greengrass")
+    parser.add_argument("--skip_tls_verify", default="true")
+    parser.add_argument("--bucket_prefix", default="query-benchmark")
+    parser.add_argument("--dashboard_path", default=DASHBOARD_PATH)
+    parser.add_argument("--components", default="10", help="Comma separated component counts to sweep")
+    parser.add_argument("--days", default="1", help="Comma separated days of retained telemetry to sweep")
+    parser.add_argument("--things", type=int, default=1, help="The number of distinct thing_names")
+    parser.add_argument("--metrics", type=int, default=len(SYSTEM_METRICS), help="System metrics per batch")
+    parser.add_argument("--interval", type=int, default=60, help="Seconds between telemetry batches")
+    parser.add_argument("--ranges", default="15m,1h,6h,1d", help="Comma separated dashboard time ranges")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per query and range")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="Keep the benchmark buckets afterwards")
+    parser.add_argument("--json_output", help="Also write the results as JSON to this path")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = benchmark(args)
+    print_report(results)
+    if args.json_output:
+        with open(args.json_output, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,385 @@
+"""
+An in-process stand-in for the Greengrass IPC pub/sub service, for wiring several components together in one
+process without a nucleus.
+
+FakeIPCBroker routes published messages to subscriptions by topic, with the `+` and `#` wildcards. Every
+subscription owns a bounded queue drained by its own delivery thread, which applies the configured delivery
+latency and, when the queue is full, either blocks the publisher or drops the message. Two clients sit on top:
+
+* FakeGreengrassCoreIPCClientV2 mirrors GreengrassCoreIPCClientV2.subscribe_to_topic/publish_to_topic. Like the
+  real client, callbacks are handed to a thread pool executor by default, or run on the delivery thread (the
+  event loop thread of the real client) when created with executor=None.
+* connect(broker) returns a fake of the client awsiot.greengrasscoreipc.connect() returns, with the
+  new_subscribe_to_topic(handler)/new_publish_to_topic() operations. Its callbacks run on the delivery thread.
+
+Every subscriber receives its own decoded copy of a message, as it would from the nucleus, so components that
+modify the telemetry they receive do not affect each other.
+
+Example:
+    broker = FakeIPCBroker(delivery_latency=0.001, queue_size=100, overflow=OVERFLOW_DROP)
+    client = FakeGreengrassCoreIPCClientV2(broker, name="injector")
+    inject.relay_telemetry(client, "thing", "injected/greengrass/telemetry")
+"""
+import concurrent.futures
+import json
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from awsiot.greengrasscoreipc.model import (
+    BinaryMessage,
+    JsonMessage,
+    MessageContext,
+    PublishMessage,
+    PublishToTopicRequest,
+    PublishToTopicResponse,
+    SubscribeToTopicRequest,
+    SubscribeToTopicResponse,
+    SubscriptionResponseMessage,
+)
+
+OVERFLOW_BLOCK = "block"
+OVERFLOW_DROP = "drop"
+
+_CLOSE = object()
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    """Whether a topic matches a subscription filter with MQTT style `+` and `#` wildcards."""
+    filter_levels = topic_filter.split("/")
+    topic_levels = topic.split("/")
+    for i, level in enumerate(filter_levels):
+        if level == "#":
+            return True
+        if i >= len(topic_levels):
+            return False
+        if level != "+" and level != topic_levels[i]:
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+def decode_message(topic: str, publish_message: PublishMessage) -> SubscriptionResponseMessage:
+    """Build the message a subscriber receives for a published message, with the topic in its context."""
+    context = MessageContext(topic=topic)
+    if publish_message.binary_message is not None:
+        payload = publish_message.binary_message.message
+        if isinstance(payload, str):
+            payload = payload.encode()
+        return SubscriptionResponseMessage(binary_message=BinaryMessage(message=payload, context=context))
+    if publish_message.json_message is not None:
+        # A serialization round trip gives every subscriber an independent copy, as IPC would
+        message = json.loads(json.dumps(publish_message.json_message.message))
+        return SubscriptionResponseMessage(json_message=JsonMessage(message=message, context=context))
+    raise ValueError("publish_message must have a binary_message or a json_message")
+
+
+def _completed(result) -> concurrent.futures.Future:
+    future = concurrent.futures.Future()
+    future.set_result(result)
+    return future
+
+
+class Subscription:
+    """One subscription on the broker, with its own bounded queue and delivery thread."""
+
+    def __init__(
+        self,
+        broker: "FakeIPCBroker",
+        topic_filter: str,
+        on_stream_event: Callable,
+        on_stream_error: Optional[Callable] = None,
+        on_stream_closed: Optional[Callable] = None,
+        executor: Optional[concurrent.futures.Executor] = None,
+        name: str = "",
+    ):
+        self.broker = broker
+        self.topic_filter = topic_filter
+        self.on_stream_event = on_stream_event
+        self.on_stream_error = on_stream_error
+        self.on_stream_closed = on_stream_closed
+        self.executor = executor
+        self.name = name
+        self.queue = queue.Queue(maxsize=broker.queue_size)
+        self.closed = False
+
+        self.lock = threading.Lock()
+        self.delivered = 0
+        self.dropped = 0
+        self.errors = 0
+        self.max_depth = 0
+        # Seconds from publish until the callback returned, and spent in the callback itself
+        self.latencies: List[float] = []
+        self.service_times: List[float] = []
+
+        self.thread = threading.Thread(target=self._deliver, name=f"fake-ipc-{name or topic_filter}", daemon=True)
+        self.thread.start()
+
+    def offer(self, topic: str, publish_message: PublishMessage, published_at: float) -> bool:
+        """Queue a message for delivery, returning False if it was dropped because the queue is full."""
+        item = (topic, publish_message, published_at)
+        if self.broker.overflow == OVERFLOW_DROP:
+            try:
+                self.queue.put_nowait(item)
+            except queue.Full:
+                with self.lock:
+                    self.dropped += 1
+                return False
+        else:
+            self.queue.put(item, timeout=self.broker.publish_timeout)
+        with self.lock:
+            self.max_depth = max(self.max_depth, self.queue.qsize())
+        return True
+
+    def _deliver(self):
+        while True:
+            item = self.queue.get()
+            if item is _CLOSE:
+                break
+            topic, publish_message, published_at = item
+            # Latency is measured from the publish, so a backlog does not add it again per message
+            delay = published_at + self.broker.delivery_latency - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            event = decode_message(topic, publish_message)
+            if self.executor is not None:
+                self.executor.submit(self._handle, event, published_at)
+            else:
+                self._handle(event, published_at)
+        if self.on_stream_closed is not None:
+            self.on_stream_closed()
+
+    def _handle(self, event: SubscriptionResponseMessage, published_at: float):
+        started = time.monotonic()
+        try:
+            self.on_stream_event(event)
+        except Exception as e:
+            with self.lock:
+                self.errors += 1
+            # As with a stream handler, returning True from on_stream_error closes the stream
+            if self.on_stream_error is not None and self.on_stream_error(e):
+                self.close()
+        finally:
+            finished = time.monotonic()
+            with self.lock:
+                self.delivered += 1
+                self.latencies.append(finished - published_at)
+                self.service_times.append(finished - started)
+            self.broker._done()
+
+    def close(self):
+        """Stop delivering to this subscription; messages already queued are still delivered first."""
+        if self.closed:
+            return
+        self.closed = True
+        self.broker._unsubscribe(self)
+        self.queue.put(_CLOSE)
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return {
+                "name": self.name,
+                "topic": self.topic_filter,
+                "delivered": self.delivered,
+                "dropped": self.dropped,
+                "errors": self.errors,
+                "max_depth": self.max_depth,
+                "latencies": list(self.latencies),
+                "service_times": list(self.service_times),
+            }
+
+
+class FakeIPCBroker:
+    """
+    Routes messages between the fake clients.
+
+    :param delivery_latency: seconds between a publish and the earliest delivery of the message
+    :param queue_size: messages each subscription may have waiting before overflow applies
+    :param overflow: OVERFLOW_BLOCK to block the publisher until there is room, or OVERFLOW_DROP to drop the message
+    :param publish_timeout: seconds a blocked publisher waits before queue.Full is raised, None to wait forever
+    """
+
+    def __init__(
+        self,
+        delivery_latency: float = 0.0,
+        queue_size: int = 1000,
+        overflow: str = OVERFLOW_BLOCK,
+        publish_timeout: Optional[float] = None,
+    ):
+        if overflow not in (OVERFLOW_BLOCK, OVERFLOW_DROP):
+            raise ValueError(f"unknown overflow policy: {overflow}")
+        self.delivery_latency = delivery_latency
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.publish_timeout = publish_timeout
+        self.subscriptions: List[Subscription] = []
+        self.published = 0
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        self.pending = 0
+
+    def subscribe(self, topic_filter: str, on_stream_event: Callable, **kwargs) -> Subscription:
+        subscription = Subscription(self, topic_filter, on_stream_event, **kwargs)
+        with self.lock:
+            self.subscriptions.append(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription: Subscription):
+        with self.lock:
+            if subscription in self.subscriptions:
+                self.subscriptions.remove(subscription)
+
+    def publish(self, topic: str, publish_message: PublishMessage) -> int:
+        """Publish a message, returning the number of subscriptions it was queued for."""
+        published_at = time.monotonic()
+        with self.lock:
+            self.published += 1
+            targets = [s for s in self.subscriptions if topic_matches(s.topic_filter, topic)]
+            self.pending += len(targets)
+        queued = 0
+        for subscription in targets:
+            if subscription.offer(topic, publish_message, published_at):
+                queued += 1
+            else:
+                self._done()
+        return queued
+
+    def _done(self):
+        with self.lock:
+            self.pending -= 1
+            if self.pending == 0:
+                self.idle.notify_all()
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every published message has been handled, including messages those handlers published."""
+        with self.lock:
+            return self.idle.wait_for(lambda: self.pending == 0, timeout)
+
+    def close(self):
+        for subscription in list(self.subscriptions):
+            subscription.close()
+
+    def stats(self) -> List[Dict]:
+        with self.lock:
+            subscriptions = list(self.subscriptions)
+        return [s.stats() for s in subscriptions]
+
+
+class FakeSubscribeOperation:
+    """The fake of the operation GreengrassCoreIPCClientV2.subscribe_to_topic returns."""
+
+    def __init__(self, subscription: Optional[Subscription] = None):
+        self.subscription = subscription
+
+    def close(self) -> concurrent.futures.Future:
+        if self.subscription is not None:
+            self.subscription.close()
+        return _completed(None)
+
+
+class FakeGreengrassCoreIPCClientV2:
+    """
+    A fake GreengrassCoreIPCClientV2 on a FakeIPCBroker.
+
+    :param broker: the broker to publish to and subscribe on
+    :param executor: the executor callbacks run on; True creates a thread pool like the real client,
+        None runs them on the subscription's delivery thread
+    :param name: a label for the subscriptions of this client in the broker stats
+    """
+
+    def __init__(self, broker: FakeIPCBroker, executor=True, name: str = ""):
+        if executor is True:
+            executor = concurrent.futures.ThreadPoolExecutor()
+        self.broker = broker
+        self.executor = executor
+        self.name = name
+
+    def subscribe_to_topic(
+        self,
+        *,
+        topic: str,
+        receive_mode=None,
+        on_stream_event: Optional[Callable] = None,
+        on_stream_error: Optional[Callable] = None,
+        on_stream_closed: Optional[Callable] = None,
+    ):
+        subscription = self.broker.subscribe(
+            topic,
+            on_stream_event,
+            on_stream_error=on_stream_error,
+            on_stream_closed=on_stream_closed,
+            executor=self.executor,
+            name=self.name,
+        )
+        return SubscribeToTopicResponse(topic_name=topic), FakeSubscribeOperation(subscription)
+
+    def publish_to_topic(self, *, topic: str, publish_message: PublishMessage) -> PublishToTopicResponse:
+        self.broker.publish(topic, publish_message)
+        return PublishToTopicResponse()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+
+
+class FakeSubscribeToTopicOperation:
+    """The fake of the operation GreengrassCoreIPCClient.new_subscribe_to_topic returns."""
+
+    def __init__(self, client: "FakeGreengrassCoreIPCClient", stream_handler):
+        self.client = client
+        self.stream_handler = stream_handler
+        self.subscription: Optional[Subscription] = None
+
+    def activate(self, request: SubscribeToTopicRequest) -> concurrent.futures.Future:
+        self.subscription = self.client.broker.subscribe(
+            request.topic,
+            self.stream_handler.on_stream_event,
+            on_stream_error=self.stream_handler.on_stream_error,
+            on_stream_closed=self.stream_handler.on_stream_closed,
+            name=self.client.name,
+        )
+        return _completed(None)
+
+    def get_response(self) -> concurrent.futures.Future:
+        return _completed(SubscribeToTopicResponse(topic_name=self.subscription.topic_filter))
+
+    def close(self) -> concurrent.futures.Future:
+        if self.subscription is not None:
+            self.subscription.close()
+        return _completed(None)
+
+
+class FakePublishToTopicOperation:
+    """The fake of the operation GreengrassCoreIPCClient.new_publish_to_topic returns."""
+
+    def __init__(self, client: "FakeGreengrassCoreIPCClient"):
+        self.client = client
+
+    def activate(self, request: PublishToTopicRequest) -> concurrent.futures.Future:
+        self.client.broker.publish(request.topic, request.publish_message)
+        return _completed(None)
+
+    def get_response(self) -> concurrent.futures.Future:
+        return _completed(PublishToTopicResponse())
+
+    def close(self) -> concurrent.futures.Future:
+        return _completed(None)
+
+
+class FakeGreengrassCoreIPCClient:
+    """A fake of the client awsiot.greengrasscoreipc.connect() returns, on a FakeIPCBroker."""
+
+    def __init__(self, broker: FakeIPCBroker, name: str = ""):
+        self.broker = broker
+        self.name = name
+
+    def new_subscribe_to_topic(self, stream_handler) -> FakeSubscribeToTopicOperation:
+        return FakeSubscribeToTopicOperation(self, stream_handler)
+
+    def new_publish_to_topic(self) -> FakePublishToTopicOperation:
+        return FakePublishToTopicOperation(self)
+
+
+def connect(broker: FakeIPCBroker, name: str = "") -> FakeGreengrassCoreIPCClient:
+    """The fake of awsiot.greengrasscoreipc.connect(); patch it in with a lambda binding the broker."""
+    return FakeGreengrassCoreIPCClient(broker, name)
@@ -0,0 +1,212 @@
+"""
+Benchmark the latency of alarms relayed by the MqttClient while bulk telemetry saturates the uplink.
+
+A simulated link sends one message at a time at a fixed bandwidth and acknowledges each a round trip later, like
+an MQTT connection over a slow TCP link. A bulk producer offers more than the link can carry while an alarm
+producer publishes small messages. With a single lane (every route at the same priority, as the relay worked before
+lanes) an alarm queues behind the whole bulk backlog; with an alarm lane it only waits for the bulk lane's window.
+
+Example:
+    python3 benchmarks/lanes_benchmark.py --bandwidth_kbps 100 --bulk_kb 20 --bulk_rate 10 --seconds 10
+"""
+import argparse
+import collections
+import concurrent.futures
+import os
+import statistics
+import sys
+import threading
+import time
+from typing import Deque, Dict, List, Optional, Tuple
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARKS_DIR)
+sys.path[:0] = [os.path.join(REPO_ROOT, "com.offline.MqttClient")]
+
+import lanes  # noqa: E402
+
+
+class SimulatedLink:
+    """Sends publishes in order at `bandwidth` bytes per second and acknowledges each `rtt` seconds later."""
+
+    def __init__(self, bandwidth: float, rtt: float):
+        self.bandwidth = bandwidth
+        self.rtt = rtt
+        self._wire: Deque[Tuple[int, concurrent.futures.Future]] = collections.deque()
+        self._acks: Deque[Tuple[float, concurrent.futures.Future]] = collections.deque()
+        self._condition = threading.Condition()
+        self._stopped = False
+        self.sent_bytes = 0
+        threading.Thread(target=self._send, name="link-send", daemon=True).start()
+        threading.Thread(target=self._acknowledge, name="link-ack", daemon=True).start()
+
+    def publish(self, topic: str, payload: bytes) -> concurrent.futures.Future:
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        with self._condition:
+            self._wire.append((len(payload), future))
+            self._condition.notify_all()
+        return future
+
+    def _send(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._wire or self._stopped)
+                if self._stopped:
+                    return
+                size, future = self._wire.popleft()
+            time.sleep(size / self.bandwidth)
+            with self._condition:
+                self.sent_bytes += size
+                self._acks.append((time.monotonic() + self.rtt, future))
+                self._condition.notify_all()
+
+    def _acknowledge(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._acks or self._stopped)
+                if self._stopped:
+                    return
+                due, future = self._acks.popleft()
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            future.set_result(None)
+
+    def close(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+
+
+def percentiles_ms(seconds: List[float]) -> Dict[str, Optional[float]]:
+    if not seconds:
+        return {"p50_ms": None, "p99_ms": None, "max_ms": None}
+    ordered = sorted(seconds)
+    return {
+        "p50_ms": statistics.median(ordered) * 1000,
+        "p99_ms": ordered[int(0.99 * (len(ordered) - 1))] * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def run(
+    mode: str,
+    bandwidth: float,
+    rtt: float,
+    bulk_size: int,
+    bulk_rate: float,
+    alarm_rate: float,
+    seconds: float,
+    bulk_window: int = 1,
+) -> Dict:
+    """
+    Offer bulk and alarm messages for `seconds` and report the alarms' latency from being relayed to being
+    acknowledged. In "single" mode both go through one lane; in "lanes" mode alarms have the high lane.
+    """
+    link = SimulatedLink(bandwidth, rtt)
+    if mode == "single":
+        # One lane with a window as deep as the bulk traffic needs, which is how the relay behaved before lanes
+        relay_lanes = lanes.Lanes(link.publish, {"normal": {"InFlight": 64, "QueueSize": 100000}})
+        alarm_lane, bulk_lane = "normal", "normal"
+    else:
+        relay_lanes = lanes.Lanes(link.publish, {"low": {"InFlight": bulk_window, "QueueSize": 100000}})
+        alarm_lane, bulk_lane = "high", "low"
+    relay_lanes.start()
+
+    alarm_latencies: List[float] = []
+    bulk_done: List[float] = []
+    lock = threading.Lock()
+
+    def alarm_done(submitted: float):
+        def done(error, _):
+            with lock:
+                alarm_latencies.append(time.monotonic() - submitted)
+
+        return done
+
+    def bulk_acked(error, _):
+        with lock:
+            bulk_done.append(time.monotonic())
+
+    bulk_payload = b"b" * bulk_size
+    events = sorted(
+        [(i / bulk_rate, "bulk") for i in range(int(seconds * bulk_rate))]
+        + [(i / alarm_rate, "alarm") for i in range(int(seconds * alarm_rate))]
+    )
+    started = time.monotonic()
+    for at, kind in events:
+        delay = started + at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        if kind == "bulk":
+            relay_lanes.submit(bulk_lane, "bulk", bulk_payload, bulk_acked)
+        else:
+            relay_lanes.submit(alarm_lane, "alarm", b"a" * 200, alarm_done(time.monotonic()))
+    # Alarms still waiting behind the backlog count at the latency they have reached when the run ends
+    ended = time.monotonic()
+    with lock:
+        alarms_acked = len(alarm_latencies)
+        waiting = int(seconds * alarm_rate) - alarms_acked
+        latencies = list(alarm_latencies)
+    relay_lanes.stop(0)
+    link.close()
+
+    result = {
+        "mode": mode,
+        "offered_kbps": bulk_size * bulk_rate / 1000,
+        "link_kbps": bandwidth / 1000,
+        "alarms": alarms_acked,
+        "alarms_waiting": waiting,
+        "bulk_kbps": len(bulk_done) * bulk_size / (ended - started) / 1000,
+    }
+    result.update(percentiles_ms(latencies))
+    return result
+
+
+def print_report(results: List[Dict]) -> None:
+    header = (
+        f"{'mode':>7} {'link kB/s':>9} {'bulk kB/s':>9} {'alarms':>7} {'waiting':>8} "
+        f"{'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}"
+    )
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        latencies = " ".join(
+            f"{r[k]:>8.1f}" if r[k] is not None else f"{'-':>8}" for k in ("p50_ms", "p99_ms", "max_ms")
+        )
+        print(
+            f"{r['mode']:>7} {r['link_kbps']:>9.1f} {r['bulk_kbps']:>9.1f} {r['alarms']:>7} "
+            f"{r['alarms_waiting']:>8} {latencies}"
+        )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark alarm latency in the MqttClient's priority lanes")
+    parser.add_argument("--bandwidth_kbps", type=float, default=100, help="Link bandwidth in kB per second")
+    parser.add_argument("--rtt_ms", type=float, default=50, help="Round trip time of the link")
+    parser.add_argument("--bulk_kb", type=float, default=20, help="Size of a bulk telemetry message")
+    parser.add_argument("--bulk_rate", type=float, default=10, help="Bulk messages offered per second")
+    parser.add_argument("--alarm_rate", type=float, default=5, help="Alarm messages per second")
+    parser.add_argument("--bulk_window", type=int, default=1, help="In-flight window of the bulk lane")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--modes", nargs="+", choices=["single", "lanes"], default=["single", "lanes"])
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    print_report(
+        [
+            run(
+                mode,
+                args.bandwidth_kbps * 1000,
+                args.rtt_ms / 1000,
+                int(args.bulk_kb * 1000),
+                args.bulk_rate,
+                args.alarm_rate,
+                args.seconds,
+                args.bulk_window,
+            )
+            for mode in args.modes
+        ]
+    )
@@ -0,0 +1,334 @@
+"""
+Run the TelemetryInjector, Alarm, MqttClient relay and InfluxDBPublisher together in one process on the fake IPC
+broker, and report the throughput and per-hop latency of the telemetry pipeline.
+
+A source publishes batches shaped like the NucleusEmitter output (from com.offline.LoadGenerator) on the local
+telemetry topic at --rate. The injector adds the component states, read through a stubbed greengrass-cli that
+takes --cli_latency_ms, and republishes them for the alarm, the publisher and the relay. InfluxDB writes and
+remote MQTT publishes are recorded in memory and take --write_latency_ms and --remote_latency_ms, unless
+--influxdb_url points the publisher at a real InfluxDB.
+
+Example:
+    python3 benchmarks/pipeline_benchmark.py --rate 50 --seconds 10 --components 20 --cli_latency_ms 300
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+from unittest import mock
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARKS_DIR)
+sys.path[:0] = [
+    BENCHMARKS_DIR,
+    os.path.join(REPO_ROOT, "com.offline.TelemetryInjector"),
+    os.path.join(REPO_ROOT, "com.offline.Alarm"),
+    os.path.join(REPO_ROOT, "com.offline.MqttClient"),
+    os.path.join(REPO_ROOT, "com.offline.LoadGenerator"),
+    os.path.join(REPO_ROOT, "aws.greengrass.labs.telemetry.InfluxDBPublisher", "src"),
+]
+
+import awsiot.greengrasscoreipc  # noqa: E402
+from awsiot.greengrasscoreipc.model import BinaryMessage, PublishMessage  # noqa: E402
+
+import alarm  # noqa: E402
+import client  # noqa: E402
+import fake_ipc  # noqa: E402
+import health  # noqa: E402
+import hooks  # noqa: E402
+import influxDBTelemetryPublisher  # noqa: E402
+import inject  # noqa: E402
+import lanes  # noqa: E402
+import loadgen  # noqa: E402
+import router  # noqa: E402
+import routes  # noqa: E402
+import streamHandlers  # noqa: E402
+
+SOURCE_TOPIC = inject.telemetry_topic
+INJECTED_TOPIC = "injected/greengrass/telemetry"
+STATUS_TOPIC = alarm.telemetry_topic
+REMOTE_TOPIC = "remote/greengrass/telemetry"
+THING_NAME = "pipeline-benchmark"
+
+
+class RecordingWriteApi:
+    """Stands in for the synchronous InfluxDB write API, recording when each write finished."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.writes = []
+        self.lock = threading.Lock()
+
+    def write(self, bucket, org, record):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.writes.append((time.time(), [p.to_line_protocol() for p in record]))
+
+
+class RecordingInfluxDBClient:
+    """Replaces influxdb_client.InfluxDBClient in the publisher, handing out a shared RecordingWriteApi."""
+
+    def __init__(self, write_api: RecordingWriteApi):
+        self.write_api_instance = write_api
+
+    def __call__(self, **kwargs):
+        return self
+
+    def write_api(self, write_options=None):
+        return self.write_api_instance
+
+
+class RecordingMqttConnection:
+    """Stands in for the relay's remote awscrt.mqtt.Connection, completing each publish after a latency."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.publishes = []
+        self.lock = threading.Lock()
+
+    def publish(self, topic, payload, qos):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.publishes.append((time.time(), topic, payload))
+            packet_id = len(self.publishes)
+        future = concurrent.futures.Future()
+        future.set_result({"packet_id": packet_id})
+        return future, packet_id
+
+
+def component_states(components: int, broken: int) -> List[Dict[str, str]]:
+    """What greengrass-cli would report: the first `broken` components BROKEN and the rest RUNNING."""
+    return [
+        {"name": f"com.offline.bench.Component{i}", "state": "BROKEN" if i < broken else "RUNNING"}
+        for i in range(components)
+    ]
+
+
+def stub_cli(states: List[Dict[str, str]], latency: float):
+    def get_all_components_states():
+        if latency:
+            time.sleep(latency)
+        return [dict(s) for s in states]
+
+    return get_all_components_states
+
+
+def probe_seqs_from_points(lines: List[str]) -> List[int]:
+    """The probe sequence numbers in a write, from the line protocol of its points."""
+    seqs = []
+    for line in lines:
+        if line.startswith(f"{loadgen.PROBE_NAME},") and f"NS={loadgen.PROBE_NAMESPACE}" in line:
+            # The value field is an integer, written as V=<seq>i
+            seqs.append(int(line.split(" ")[1].split("=")[1].rstrip("i")))
+    return seqs
+
+
+def probe_seqs_from_payload(payload: bytes) -> List[int]:
+    return [
+        int(p["V"]) for p in json.loads(payload)
+        if p.get("NS") == loadgen.PROBE_NAMESPACE and p.get("N") == loadgen.PROBE_NAME
+    ]
+
+
+def percentiles_ms(seconds: List[float]) -> Dict[str, Optional[float]]:
+    if not seconds:
+        return {"p50_ms": None, "p95_ms": None, "max_ms": None}
+    ordered = sorted(seconds)
+    return {
+        "p50_ms": statistics.median(ordered) * 1000,
+        "p95_ms": ordered[int(0.95 * (len(ordered) - 1))] * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def end_to_end(emitted: Dict[int, float], arrivals: Dict[int, float]) -> Dict:
+    latencies = [arrivals[s] - emitted[s] for s in emitted if s in arrivals]
+    result = {"delivered": len(latencies), "sent": len(emitted)}
+    result.update(percentiles_ms(latencies))
+    return result
+
+
+def influxdb_parameters(args) -> Dict[str, str]:
+    protocol, address = (args.influxdb_url or "http://localhost:8086").split("://", 1)
+    interface, port = address.rsplit(":", 1)
+    return {
+        "InfluxDBServerProtocol": protocol,
+        "InfluxDBInterface": interface,
+        "InfluxDBPort": port,
+        "InfluxDBToken": args.influxdb_token or "benchmark",
+        "InfluxDBOrg": args.influxdb_org,
+        "InfluxDBBucket": args.influxdb_bucket,
+        "InfluxDBSkipTLSVerify": "true",
+    }
+
+
+def run_pipeline(args) -> Dict:
+    broker = fake_ipc.FakeIPCBroker(
+        delivery_latency=args.ipc_latency_ms / 1000, queue_size=args.queue_size, overflow=args.overflow
+    )
+    executor = True if args.callbacks == "executor" else None
+    write_api = RecordingWriteApi(args.write_latency_ms / 1000)
+    remote = RecordingMqttConnection(args.remote_latency_ms / 1000)
+    states = component_states(args.components, args.broken_components)
+
+    patches = [
+        mock.patch.object(health, "get_all_components_states", stub_cli(states, args.cli_latency_ms / 1000)),
+        mock.patch.object(awsiot.greengrasscoreipc, "connect", lambda: fake_ipc.connect(broker, "publisher")),
+        mock.patch.object(alarm, "already_alarmed", set()),
+    ]
+    if not args.influxdb_url:
+        patches.append(mock.patch.object(streamHandlers.influxdb_client, "InfluxDBClient",
+                                         RecordingInfluxDBClient(write_api)))
+    merged_before, dropped_before = inject.merged.value, inject.dropped.value
+    injector_client = fake_ipc.FakeGreengrassCoreIPCClientV2(broker, executor, name="injector")
+    alarm_client = fake_ipc.FakeGreengrassCoreIPCClientV2(broker, executor, name="alarm")
+    relay_client = fake_ipc.FakeGreengrassCoreIPCClientV2(broker, executor, name="relay")
+    for p in patches:
+        p.start()
+    try:
+        injected_routes = [routes.Route.full(INJECTED_TOPIC), routes.Route.status(STATUS_TOPIC)]
+        injection_queue = inject.InjectionQueue(
+            lambda telemetry: inject.inject_and_send_telemetry(injector_client, telemetry, THING_NAME, injected_routes),
+            args.injector_queue_size,
+        ).start()
+        inject.relay_telemetry(injector_client, injection_queue)
+        alarm.check_telemetry(alarm_client, hooks.ShellHook(None))
+        relay_lanes = lanes.Lanes(lambda topic, payload: remote.publish(topic, payload, client.QoS.AT_LEAST_ONCE)[0])
+        client.relay_messages(
+            relay_client,
+            remote,
+            router.Router.from_topics([{"From": INJECTED_TOPIC, "To": REMOTE_TOPIC}], THING_NAME),
+            relay_lanes=relay_lanes.start(),
+        )
+        influxDBTelemetryPublisher.relay_telemetry(influxdb_parameters(args))
+
+        source = fake_ipc.FakeGreengrassCoreIPCClientV2(broker, None, name="source")
+        emitted = {}
+        count = max(int(args.rate * args.seconds), 1)
+        started = time.monotonic()
+        for seq in range(count):
+            delay = started + seq / args.rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            now = time.time()
+            batch = loadgen.make_batch(seq, int(now * 1000), args.batch_size, 0)
+            emitted[seq] = now
+            source.publish_to_topic(
+                topic=SOURCE_TOPIC,
+                publish_message=PublishMessage(binary_message=BinaryMessage(message=json.dumps(batch).encode())),
+            )
+        publish_seconds = time.monotonic() - started
+        drained = broker.drain(args.drain_seconds)
+        # The injector's worker is not a broker subscriber: stop it once the source is delivered, which injects
+        # whatever is still queued, and then drain what it published
+        injection_queue.stop(args.drain_seconds)
+        drained = broker.drain(args.drain_seconds) and drained
+        # The relay publishes from its lanes after the broker delivered to it
+        drained = relay_lanes.stop(args.drain_seconds) and drained
+        elapsed = time.monotonic() - started
+        stats = broker.stats()
+    finally:
+        broker.close()
+        for c in (injector_client, alarm_client, relay_client):
+            c.close()
+        for p in reversed(patches):
+            p.stop()
+
+    influxdb_arrivals = {}
+    for finished, lines in write_api.writes:
+        for seq in probe_seqs_from_points(lines):
+            influxdb_arrivals.setdefault(seq, finished)
+    remote_arrivals = {}
+    for finished, _, payload in remote.publishes:
+        for seq in probe_seqs_from_payload(payload):
+            remote_arrivals.setdefault(seq, finished)
+
+    hops = []
+    for s in stats:
+        hop = {k: s[k] for k in ("name", "topic", "delivered", "dropped", "errors", "max_depth")}
+        hop.update(percentiles_ms(s["latencies"]))
+        hop["service_ms_mean"] = statistics.mean(s["service_times"]) * 1000 if s["service_times"] else None
+        hops.append(hop)
+
+    return {
+        "sent": count,
+        "offered_rate": args.rate,
+        "achieved_rate": count / publish_seconds if publish_seconds else float("inf"),
+        "drained": drained,
+        "elapsed_s": elapsed,
+        "hops": hops,
+        "injector_merged": inject.merged.value - merged_before,
+        "injector_dropped": inject.dropped.value - dropped_before,
+        "influxdb": end_to_end(emitted, influxdb_arrivals) if not args.influxdb_url else None,
+        "remote": end_to_end(emitted, remote_arrivals),
+    }
+
+
+def _ms(value: Optional[float]) -> str:
+    return f"{value:>9.1f}" if value is not None else f"{'-':>9}"
+
+
+def print_report(result: Dict) -> None:
+    print(
+        f"sent {result['sent']} batches at {result['achieved_rate']:.1f}/s (offered {result['offered_rate']}/s), "
+        f"{'drained' if result['drained'] else 'NOT drained'} after {result['elapsed_s']:.1f}s"
+    )
+    header = f"{'subscriber':>10} {'topic':>32} {'delivered':>9} {'dropped':>7} {'errors':>6} {'max q':>6} " \
+             f"{'p50 ms':>9} {'p95 ms':>9} {'svc ms':>9}"
+    print(header)
+    print("-" * len(header))
+    for h in result["hops"]:
+        print(
+            f"{h['name']:>10} {h['topic']:>32} {h['delivered']:>9} {h['dropped']:>7} {h['errors']:>6} "
+            f"{h['max_depth']:>6} {_ms(h['p50_ms'])} {_ms(h['p95_ms'])} {_ms(h['service_ms_mean'])}"
+        )
+    print(f"injector queue: {result['injector_merged']} batches merged, {result['injector_dropped']} dropped")
+    for sink in ("influxdb", "remote"):
+        e2e = result[sink]
+        if e2e is not None:
+            print(
+                f"end to end {sink:>8}: {e2e['delivered']}/{e2e['sent']} delivered, "
+                f"p50 {_ms(e2e['p50_ms']).strip()} ms, p95 {_ms(e2e['p95_ms']).strip()} ms"
+            )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the telemetry pipeline in a single process")
+    parser.add_argument("--rate", type=float, default=10, help="Source batches per second")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--batch_size", type=int, default=3, help="System metrics per source batch")
+    parser.add_argument("--components", type=int, default=10, help="Components greengrass-cli reports")
+    parser.add_argument("--broken_components", type=int, default=0)
+    parser.add_argument("--cli_latency_ms", type=float, default=0, help="Time a greengrass-cli call takes")
+    parser.add_argument("--write_latency_ms", type=float, default=0, help="Time an InfluxDB write takes")
+    parser.add_argument("--remote_latency_ms", type=float, default=0, help="Time a remote PUBACK takes")
+    parser.add_argument("--ipc_latency_ms", type=float, default=0, help="Delivery latency of the fake IPC")
+    parser.add_argument("--queue_size", type=int, default=1000, help="Messages a subscriber may have waiting")
+    parser.add_argument("--overflow", choices=[fake_ipc.OVERFLOW_BLOCK, fake_ipc.OVERFLOW_DROP],
+                        default=fake_ipc.OVERFLOW_BLOCK)
+    parser.add_argument("--callbacks", choices=["executor", "delivery_thread"], default="executor",
+                        help="Where the V2 client callbacks run")
+    parser.add_argument("--injector_queue_size", type=int, default=8, help="Batches that can wait for the injector")
+    parser.add_argument("--drain_seconds", type=float, default=30, help="Time allowed to finish after the source")
+    parser.add_argument("--influxdb_url", help="Write to this InfluxDB instead of recording the writes")
+    parser.add_argument("--influxdb_token")
+    parser.add_argument("--influxdb_org", default="greengrass")
+    parser.add_argument("--influxdb_bucket", default="greengrass-telemetry")
+    parser.add_argument("--json_output", help="Also write the result as JSON to this path")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    result = run_pipeline(args)
+    print_report(result)
+    if args.json_output:
+        with open(args.json_output, "w") as f:
+            json.dump(result, f, indent=2)
@@ -0,0 +1,119 @@
+"""
+Benchmark the MqttClient's topic router against thousands of routes.
+
+Routes are generated as a mix of exact topics, single-level (+) and multi-level (#) wildcards, and are matched
+against topics drawn from the same space. The trie router is compared with a linear scan over every pattern, which
+is what resolving a topic costs without the trie, and the number of IPC subscriptions the plan needs is reported.
+
+Example:
+    python3 benchmarks/router_benchmark.py --routes 1000 5000 20000 --depth 5
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+from typing import Dict, List, Optional
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARKS_DIR)
+sys.path[:0] = [os.path.join(REPO_ROOT, "com.offline.MqttClient")]
+
+import router  # noqa: E402
+
+
+def make_topics(count: int, depth: int, fanout: int, rng: random.Random) -> List[Dict[str, str]]:
+    """Topics configuration entries: 70% exact topics, 20% with a + level and 10% ending in #."""
+    topics = []
+    for i in range(count):
+        segments = [f"s{rng.randrange(fanout)}" for _ in range(depth)]
+        kind = rng.random()
+        if kind < 0.2:
+            segments[rng.randrange(depth)] = "+"
+        elif kind < 0.3:
+            segments = segments[: rng.randrange(1, depth)] + ["#"]
+        topics.append({"From": "/".join(segments), "To": f"remote/{{thing_name}}/{i}"})
+    return topics
+
+
+def make_messages(count: int, depth: int, fanout: int, rng: random.Random) -> List[str]:
+    return ["/".join(f"s{rng.randrange(fanout)}" for _ in range(depth)) for _ in range(count)]
+
+
+def pattern_regex(pattern: str) -> "re.Pattern":
+    parts = []
+    for segment in pattern.split("/"):
+        parts.append("[^/]*" if segment == "+" else ".*" if segment == "#" else re.escape(segment))
+    return re.compile("/".join(parts) + "$")
+
+
+def linear_matches(compiled: List, topic: str) -> int:
+    return sum(1 for regex in compiled if regex.match(topic))
+
+
+def run(routes: int, depth: int, fanout: int, messages: int, seed: int = 0, linear: bool = True) -> Dict:
+    rng = random.Random(seed)
+    topics = make_topics(routes, depth, fanout, rng)
+    sample = make_messages(messages, depth, fanout, rng)
+
+    started = time.perf_counter()
+    topic_router = router.Router.from_topics(topics, "thing")
+    build_s = time.perf_counter() - started
+    started = time.perf_counter()
+    subscriptions = topic_router.plan()
+    plan_s = time.perf_counter() - started
+
+    matched = 0
+    started = time.perf_counter()
+    for topic in sample:
+        matched += len(topic_router.remote_topics(topic))
+    trie_us = (time.perf_counter() - started) / len(sample) * 1e6
+
+    linear_us: Optional[float] = None
+    if linear:
+        compiled = [pattern_regex(t["From"]) for t in topics]
+        started = time.perf_counter()
+        for topic in sample:
+            linear_matches(compiled, topic)
+        linear_us = (time.perf_counter() - started) / len(sample) * 1e6
+
+    return {
+        "routes": routes,
+        "subscriptions": len(subscriptions),
+        "build_ms": build_s * 1000,
+        "plan_ms": plan_s * 1000,
+        "matches_per_message": matched / len(sample),
+        "trie_us": trie_us,
+        "linear_us": linear_us,
+    }
+
+
+def print_report(results: List[Dict]) -> None:
+    header = f"{'routes':>7} {'subs':>6} {'build ms':>9} {'plan ms':>9} {'matches':>8} {'trie us':>9} {'linear us':>10}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        linear = f"{r['linear_us']:>10.1f}" if r["linear_us"] is not None else f"{'-':>10}"
+        print(
+            f"{r['routes']:>7} {r['subscriptions']:>6} {r['build_ms']:>9.1f} {r['plan_ms']:>9.1f} "
+            f"{r['matches_per_message']:>8.2f} {r['trie_us']:>9.1f} {linear}"
+        )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the MqttClient topic router")
+    parser.add_argument("--routes", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--depth", type=int, default=5, help="Levels per topic")
+    parser.add_argument("--fanout", type=int, default=10, help="Distinct segments per level")
+    parser.add_argument("--messages", type=int, default=10000, help="Topics matched per route count")
+    parser.add_argument("--no_linear", action="store_true", help="Skip the linear scan, which is slow for many routes")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    print_report(
+        [run(n, args.depth, args.fanout, args.messages, args.seed, not args.no_linear) for n in args.routes]
+    )
@@ -0,0 +1,56 @@
+from datetime import datetime, timezone
+
+import dashboard_query_benchmark as bench
+
+
+class TestSyntheticTelemetry:
+    def test_batch_shape_matches_injector_output(self):
+        batch = bench.synthetic_batch("thing-0", 1000, 4, 2, bench.random.Random(0))
+        assert len(batch) == 6
+        assert [p["N"] for p in batch[:4]] == ["CpuUsage", "SystemMemUsage", "TotalNumberOfFDs", "SyntheticMetric3"]
+        assert all(p["NS"] == "ComponentStatus" for p in batch[4:])
+        assert all(p["thing_name"] == "thing-0" and p["TS"] == 1000 for p in batch)
+
+    def test_telemetry_covers_days_for_every_thing(self):
+        end = datetime(2024, 1, 2, tzinfo=timezone.utc)
+        batches = list(bench.synthetic_telemetry(2, 3, 1, 1, 3600, end))
+        assert len(batches) == 24 * 2
+        assert {b[0]["thing_name"] for b in batches} == {"thing-0", "thing-1"}
+
+    def test_batches_convert_with_create_points(self):
+        batch = bench.synthetic_batch("thing-0", 1627597331445, 3, 1, bench.random.Random(0))
+        points = bench.streamHandlers.TelemetryStreamHandler.createPoints(None, batch)
+        assert len(points) == 4
+        assert "thing_name=thing-0" in points[0].to_line_protocol()
+
+
+class TestQueries:
+    def test_extracts_nested_panels_and_variables(self):
+        dashboard = {
+            "panels": [
+                {"title": "a", "targets": [{"refId": "A", "query": "q1"}]},
+                {"title": "row", "panels": [{"title": "b", "targets": [{"refId": "B", "query": "q2"}]}]},
+            ],
+            "templating": {"list": [{"type": "query", "name": "device", "query": "q3"}]},
+        }
+        assert bench.extract_queries(dashboard) == [("a [A]", "q1"), ("b [B]", "q2"), ("$device", "q3")]
+
+    def test_extracts_bundled_dashboard(self):
+        import json
+
+        with open(bench.DASHBOARD_PATH) as f:
+            queries = bench.extract_queries(json.load(f))
+        assert len(queries) == 5
+        assert all("from(bucket:" in q for _, q in queries)
+
+    def test_bind_query(self):
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        stop = datetime(2024, 1, 2, tzinfo=timezone.utc)
+        flux = bench.bind_query('filter(fn: (r) => r["thing_name"] == "${device}")', start, stop, {"device": "t"})
+        assert flux.startswith("option v = {timeRangeStart: 2024-01-01T00:00:00Z, timeRangeStop: 2024-01-02T00:00:00Z")
+        assert flux.endswith('r["thing_name"] == "t")')
+
+    def test_parse_duration(self):
+        assert bench.parse_duration("15m") == 900
+        assert bench.parse_duration("7d") == 7 * 86400
+        assert bench.percentile([3, 1, 2], 50) == 2
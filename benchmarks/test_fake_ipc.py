@@ -0,0 +1,203 @@
+import json
+import threading
+import time
+
+import pytest
+from awsiot.greengrasscoreipc.model import (
+    BinaryMessage,
+    JsonMessage,
+    PublishMessage,
+    PublishToTopicRequest,
+    SubscribeToTopicRequest,
+)
+
+import fake_ipc
+
+
+def binary(payload: bytes) -> PublishMessage:
+    return PublishMessage(binary_message=BinaryMessage(message=payload))
+
+
+class Collector:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.events = []
+        self.threads = set()
+        self.closed = False
+
+    def on_stream_event(self, event):
+        if self.delay:
+            time.sleep(self.delay)
+        self.threads.add(threading.current_thread().name)
+        self.events.append(event)
+
+    def on_stream_error(self, error):
+        return False
+
+    def on_stream_closed(self):
+        self.closed = True
+
+
+class TestTopicMatches:
+    @pytest.mark.parametrize(
+        "topic_filter, topic, expected",
+        [
+            ("a/b", "a/b", True),
+            ("a/b", "a/c", False),
+            ("a/+", "a/b", True),
+            ("a/+", "a/b/c", False),
+            ("a/#", "a/b/c", True),
+            ("#", "$local/greengrass/telemetry", True),
+            ("+/greengrass/+", "injected/greengrass/telemetry", True),
+            ("a/b/c", "a/b", False),
+        ],
+    )
+    def test_wildcards(self, topic_filter, topic, expected):
+        assert fake_ipc.topic_matches(topic_filter, topic) is expected
+
+
+class TestBroker:
+    def test_routes_by_topic_with_wildcards(self):
+        broker = fake_ipc.FakeIPCBroker()
+        exact, wildcard, other = Collector(), Collector(), Collector()
+        broker.subscribe("a/b", exact.on_stream_event)
+        broker.subscribe("a/#", wildcard.on_stream_event)
+        broker.subscribe("c", other.on_stream_event)
+
+        assert broker.publish("a/b", binary(b"1")) == 2
+        assert broker.drain(5)
+        assert [e.binary_message.message for e in exact.events] == [b"1"]
+        assert wildcard.events[0].binary_message.context.topic == "a/b"
+        assert other.events == []
+        broker.close()
+
+    def test_subscribers_get_independent_json_copies(self):
+        broker = fake_ipc.FakeIPCBroker()
+        first, second = Collector(), Collector()
+        broker.subscribe("t", first.on_stream_event)
+        broker.subscribe("t", second.on_stream_event)
+        message = {"points": [1]}
+        broker.publish("t", PublishMessage(json_message=JsonMessage(message=message)))
+        assert broker.drain(5)
+
+        first.events[0].json_message.message["points"].append(2)
+        assert second.events[0].json_message.message == {"points": [1]}
+        assert message == {"points": [1]}
+        broker.close()
+
+    def test_delivery_latency_is_applied(self):
+        broker = fake_ipc.FakeIPCBroker(delivery_latency=0.05)
+        collector = Collector()
+        subscription = broker.subscribe("t", collector.on_stream_event)
+        broker.publish("t", binary(b"x"))
+        assert broker.drain(5)
+        assert subscription.stats()["latencies"][0] >= 0.05
+        broker.close()
+
+    def test_slow_subscriber_drops_on_overflow(self):
+        broker = fake_ipc.FakeIPCBroker(queue_size=2, overflow=fake_ipc.OVERFLOW_DROP)
+        slow = Collector(delay=0.05)
+        subscription = broker.subscribe("t", slow.on_stream_event)
+        queued = sum(broker.publish("t", binary(b"x")) for _ in range(10))
+        assert broker.drain(5)
+
+        stats = subscription.stats()
+        assert stats["dropped"] == 10 - queued > 0
+        assert stats["delivered"] == queued
+        assert stats["max_depth"] <= 2
+        broker.close()
+
+    def test_slow_subscriber_blocks_publisher(self):
+        broker = fake_ipc.FakeIPCBroker(queue_size=1, overflow=fake_ipc.OVERFLOW_BLOCK)
+        slow = Collector(delay=0.02)
+        subscription = broker.subscribe("t", slow.on_stream_event)
+        started = time.monotonic()
+        for _ in range(5):
+            broker.publish("t", binary(b"x"))
+        # Only the queue slot and the message being handled can be ahead of the publisher
+        assert time.monotonic() - started >= 0.02 * 2
+        assert broker.drain(5)
+        assert subscription.stats()["delivered"] == 5
+        broker.close()
+
+    def test_drain_waits_for_messages_published_by_handlers(self):
+        broker = fake_ipc.FakeIPCBroker(delivery_latency=0.01)
+        sink = Collector()
+        broker.subscribe("out", sink.on_stream_event)
+        broker.subscribe("in", lambda e: broker.publish("out", binary(e.binary_message.message)))
+        broker.publish("in", binary(b"x"))
+        assert broker.drain(5)
+        assert len(sink.events) == 1
+        broker.close()
+
+    def test_error_handler_can_close_the_stream(self):
+        broker = fake_ipc.FakeIPCBroker()
+        closed = threading.Event()
+
+        def fail(_):
+            raise ValueError("boom")
+
+        subscription = broker.subscribe("t", fail, on_stream_error=lambda e: True, on_stream_closed=closed.set)
+        broker.publish("t", binary(b"x"))
+        assert closed.wait(5)
+        assert subscription.stats()["errors"] == 1
+        assert broker.publish("t", binary(b"x")) == 0
+
+
+class TestClients:
+    def test_v2_client_runs_callbacks_on_executor_by_default(self):
+        broker = fake_ipc.FakeIPCBroker()
+        collector = Collector()
+        client = fake_ipc.FakeGreengrassCoreIPCClientV2(broker)
+        _, operation = client.subscribe_to_topic(topic="t", on_stream_event=collector.on_stream_event)
+        client.publish_to_topic(topic="t", publish_message=binary(b"x"))
+        assert broker.drain(5)
+        assert not any(name.startswith("fake-ipc-") for name in collector.threads)
+
+        operation.close()
+        client.close()
+
+    def test_v2_client_without_executor_runs_on_delivery_thread(self):
+        broker = fake_ipc.FakeIPCBroker()
+        collector = Collector()
+        client = fake_ipc.FakeGreengrassCoreIPCClientV2(broker, executor=None, name="sub")
+        client.subscribe_to_topic(topic="t", on_stream_event=collector.on_stream_event)
+        client.publish_to_topic(topic="t", publish_message=binary(b"x"))
+        assert broker.drain(5)
+        assert collector.threads == {"fake-ipc-sub"}
+        broker.close()
+
+    def test_v1_client_operations(self):
+        broker = fake_ipc.FakeIPCBroker()
+        handler = Collector()
+        client = fake_ipc.connect(broker)
+
+        request = SubscribeToTopicRequest()
+        request.topic = "tokens"
+        operation = client.new_subscribe_to_topic(handler)
+        operation.activate(request).result(1)
+
+        publish = PublishToTopicRequest()
+        publish.topic = "tokens"
+        publish.publish_message = PublishMessage(json_message=JsonMessage(message={"action": "RetrieveToken"}))
+        publish_operation = client.new_publish_to_topic()
+        publish_operation.activate(publish)
+        publish_operation.get_response().result(1)
+        assert broker.drain(5)
+        assert handler.events[0].json_message.message == {"action": "RetrieveToken"}
+
+        operation.close()
+        broker.drain(5)
+        deadline = time.monotonic() + 5
+        while not handler.closed and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert handler.closed
+
+    def test_str_binary_payloads_are_delivered_as_bytes(self):
+        broker = fake_ipc.FakeIPCBroker()
+        collector = Collector()
+        broker.subscribe("t", collector.on_stream_event)
+        broker.publish("t", PublishMessage(binary_message=BinaryMessage(message=json.dumps([1]))))
+        assert broker.drain(5)
+        assert collector.events[0].binary_message.message == b"[1]"
+        broker.close()
@@ -0,0 +1,20 @@
+import lanes_benchmark as bench
+
+
+class TestLanesBenchmark:
+    def test_link_acknowledges_in_order_at_its_bandwidth(self):
+        link = bench.SimulatedLink(bandwidth=100000, rtt=0.01)
+        try:
+            futures = [link.publish("t", b"x" * 1000) for _ in range(5)]
+            for f in futures:
+                f.result(timeout=5)
+            assert link.sent_bytes == 5000
+        finally:
+            link.close()
+
+    def test_alarm_lane_bounds_alarm_latency_under_saturation(self):
+        args = dict(bandwidth=50000, rtt=0.01, bulk_size=5000, bulk_rate=20, alarm_rate=10, seconds=1.5)
+        single = bench.run("single", **args)
+        laned = bench.run("lanes", **args)
+        assert laned["alarms"] > single["alarms"]
+        assert laned["p99_ms"] < single["p99_ms"]
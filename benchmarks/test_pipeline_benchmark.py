@@ -0,0 +1,30 @@
+import pipeline_benchmark as bench
+
+
+def test_probe_seqs_from_points():
+    lines = [
+        "CpuUsage,A=Average,NS=SystemMetrics,U=Percent,thing_name=t V=3i 1000000",
+        "Probe,A=Count,NS=LoadGenerator,U=Count,thing_name=t V=42i 1000000",
+    ]
+    assert bench.probe_seqs_from_points(lines) == [42]
+
+
+def test_end_to_end_counts_missing_probes():
+    result = bench.end_to_end({0: 1.0, 1: 2.0}, {0: 1.5})
+    assert result["delivered"] == 1 and result["sent"] == 2
+    assert result["p50_ms"] == 500
+
+
+def test_pipeline_delivers_every_batch_to_every_sink():
+    args = bench.parse_args(["--rate", "200", "--seconds", "0.1", "--components", "3", "--broken_components", "1"])
+    result = bench.run_pipeline(args)
+
+    assert result["drained"]
+    assert result["influxdb"]["delivered"] == result["sent"]
+    assert result["remote"]["delivered"] == result["sent"]
+    hops = {h["name"]: h for h in result["hops"]}
+    assert set(hops) == {"injector", "alarm", "relay", "publisher"}
+    assert hops["injector"]["delivered"] == result["sent"]
+    assert result["injector_dropped"] == 0
+    # Batches the injector merged reach the later hops as one message, so only the probes show every batch arrived
+    assert all(0 < h["delivered"] <= result["sent"] and h["errors"] == 0 for h in hops.values())
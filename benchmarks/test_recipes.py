@@ -0,0 +1,20 @@
+import glob
+import os
+
+import pytest
+
+yaml = pytest.importorskip("yaml")
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RECIPES = sorted(glob.glob(os.path.join(REPOSITORY, "*", "recipe.yaml")))
+
+
+@pytest.mark.parametrize("recipe", RECIPES, ids=lambda path: os.path.basename(os.path.dirname(path)))
+def test_recipe_is_valid_yaml(recipe):
+    with open(recipe) as f:
+        parsed = yaml.safe_load(f)
+    assert "ComponentName" in parsed and parsed["Manifests"]
+
+
+def test_recipes_are_found():
+    assert RECIPES
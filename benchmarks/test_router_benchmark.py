@@ -0,0 +1,20 @@
+import random
+
+import router_benchmark as bench
+
+
+class TestRouterBenchmark:
+    def test_trie_matches_agree_with_a_linear_scan(self):
+        rng = random.Random(0)
+        topics = bench.make_topics(300, 4, 3, rng)
+        topic_router = bench.router.Router.from_topics(topics, "thing")
+        compiled = [bench.pattern_regex(t["From"]) for t in topics]
+        for topic in bench.make_messages(200, 4, 3, rng):
+            _, routes = topic_router.match(topic)
+            assert len(routes) == bench.linear_matches(compiled, topic)
+
+    def test_run_reports_fewer_subscriptions_than_routes(self):
+        result = bench.run(500, 4, 3, 100)
+        assert 0 < result["subscriptions"] < result["routes"]
+        assert result["matches_per_message"] > 0
+        assert result["trie_us"] > 0 and result["linear_us"] > 0
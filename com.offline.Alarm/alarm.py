@@ -1,22 +1,76 @@
 import json
+import logging
+import os
 import time
 from argparse import ArgumentParser
-import subprocess
+from typing import Callable, Dict, List, Optional
 
+import anomaly
+import hooks
+import lifecycle
+import logutil
+import metrics
+import profiler
+import watchdog
 from awsiot.greengrasscoreipc.clientv2 import GreengrassCoreIPCClientV2
-from awsiot.greengrasscoreipc.model import SubscriptionResponseMessage
+from awsiot.greengrasscoreipc.model import (
+    BinaryMessage,
+    PublishMessage,
+    SubscriptionResponseMessage,
+)
 
 
 parser = ArgumentParser(__name__)
 parser.add_argument("--on_alarm_command")
+parser.add_argument(
+    "--alarm_hook",
+    default="{}",
+    help='How the alarm command runs, as {"Mode": "shell" or "worker", "AckTimeoutSeconds": seconds}',
+)
+parser.add_argument("--metrics_port", type=int, default=0)
+parser.add_argument("--self_telemetry_interval", type=float, default=0)
+parser.add_argument("--log_format", choices=["text", "json"], default="text")
+# The injector's status route carries only the component states, which is all the alarm reads
+parser.add_argument("--telemetry_topic", default="injected/greengrass/status")
+parser.add_argument(
+    "--watchdog",
+    default="{}",
+    help='Telemetry expected, as {"Topics": [topic], "Things": {name: seconds}, "Components": {name: seconds}}',
+)
+parser.add_argument(
+    "--anomaly",
+    default="{}",
+    help='Anomaly detection, as {"Enabled": bool, "Topics": [topic], "ZScore": deviations, "RateZScore": deviations}',
+)
 
-telemetry_topic = "injected/greengrass/telemetry"
+telemetry_topic = "injected/greengrass/status"
+# Where the alarm's own metrics go, to be stored with the rest of the telemetry
+self_telemetry_topic = "injected/greengrass/telemetry"
+component_name = "com.offline.Alarm"
+# Components that are still BROKEN alarm again after this many seconds
+alarm_reset_interval = 300
 
 already_alarmed = set()
 
+# Logs once per message the watchdog or the anomaly detector cannot read, so it is rate limited
+event_log = logutil.rate_limited("alarm.watch", per_second=1, burst=5)
 
-def check_telemetry(ipc_client: GreengrassCoreIPCClientV2, on_alarm_command):
+messages_in = metrics.REGISTRY.counter("alarm_messages_in_total", "Telemetry messages checked")
+broken = metrics.REGISTRY.gauge("alarm_broken_components", "BROKEN components in the last telemetry message")
+alarms = metrics.REGISTRY.counter("alarm_alarms_total", "Alarms raised")
+check_seconds = metrics.REGISTRY.histogram("alarm_check_seconds", "Time to check a telemetry message")
+
+
+def raise_alarm(hook, kind: str, subjects, detail: Optional[Dict] = None):
+    """Hand an alarm to the hook: what kind it is, what it is about, and details that depend on the kind."""
+    alarms.inc()
+    hook.send(kind, subjects, detail)
+
+
+def check_telemetry(ipc_client: GreengrassCoreIPCClientV2, hook, topic: str = telemetry_topic):
     def on_tel_event(e: SubscriptionResponseMessage):
+        messages_in.inc()
+        started = time.perf_counter()
         telemetry_data = None
         if e.binary_message and e.binary_message.message:
             telemetry_data = json.loads(e.binary_message.message.decode())
@@ -26,27 +80,103 @@ def check_telemetry(ipc_client: GreengrassCoreIPCClientV2, on_alarm_command):
             for point in telemetry_data:
                 if point["NS"] == "ComponentStatus" and point["V"] == "BROKEN":
                     broken_components.add(point["N"])
+        broken.set(len(broken_components))
+        check_seconds.observe(time.perf_counter() - started)
 
         if len(broken_components - already_alarmed) > 0:
             already_alarmed.update(broken_components)
-            if on_alarm_command:
-                proc = subprocess.run(on_alarm_command, shell=True, capture_output=True)
-                print(
-                    "alarm output:",
-                    {"stdout": proc.stdout.decode(), "stderr": proc.stderr.decode()},
-                )
+            raise_alarm(hook, "broken", broken_components)
+
+    _, operation = ipc_client.subscribe_to_topic(topic=topic, on_stream_event=on_tel_event)
+    return operation
+
+
+def watch_telemetry(ipc_client: GreengrassCoreIPCClientV2, observers: Dict[str, List[Callable[[List[Dict]], None]]]):
+    """Feed every telemetry message on a topic to its observers, parsing it once for all of them."""
+
+    def on_event(observe: List[Callable[[List[Dict]], None]]):
+        def on_stream_event(e: SubscriptionResponseMessage):
+            try:
+                telemetry_data = json.loads(e.binary_message.message.decode())
+            except Exception:
+                event_log.warning("ignoring a telemetry message that cannot be read")
+                return
+            if isinstance(telemetry_data, list):
+                for observer in observe:
+                    observer(telemetry_data)
+
+        return on_stream_event
+
+    operations = []
+    for topic, observe in observers.items():
+        _, operation = ipc_client.subscribe_to_topic(topic=topic, on_stream_event=on_event(observe))
+        operations.append(operation)
+    return operations
 
-    ipc_client.subscribe_to_topic(topic=telemetry_topic, on_stream_event=on_tel_event)
+
+def detect_anomalies(detector: anomaly.Detector, hook) -> Callable[[List[Dict]], None]:
+    def observe(telemetry_data: List[Dict]):
+        found = detector.observe(telemetry_data)
+        for a in found:
+            logging.warning(f"{a} is anomalous at {a.value} (z-score {a.z_score:.1f}, of its rate {a.rate_z_score:.1f})")
+        if found:
+            detail = {str(a): {"value": a.value, "z_score": a.z_score, "rate_z_score": a.rate_z_score} for a in found}
+            raise_alarm(hook, "anomaly", detail.keys(), detail)
+
+    return observe
+
+
+def self_telemetry_publisher(ipc_client: GreengrassCoreIPCClientV2, topic: str):
+    def publish(points):
+        msg = PublishMessage(binary_message=BinaryMessage(message=json.dumps(points)))
+        ipc_client.publish_to_topic(topic=topic, publish_message=msg)
+
+    return publish
 
 
 if __name__ == "__main__":
     args = parser.parse_args()
+    logutil.configure(json_format=args.log_format == "json")
+    ipc_client = GreengrassCoreIPCClientV2()
+    runner = lifecycle.Lifecycle()
+    runner.on_shutdown(logutil.flush)
+    runner.on_shutdown(ipc_client.close)
+
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+    if args.self_telemetry_interval > 0:
+        reporter = metrics.TelemetryReporter(
+            self_telemetry_publisher(ipc_client, self_telemetry_topic),
+            component_name,
+            os.environ.get("AWS_IOT_THING_NAME", ""),
+            args.self_telemetry_interval,
+        ).start()
+        runner.on_shutdown(reporter.report)
+
+    hook = hooks.from_config(args.on_alarm_command, args.alarm_hook)
+    runner.on_shutdown(hook.stop)
+    if isinstance(hook, hooks.HookWorker):
+        runner.every(hook.ack_timeout, hook.check)
+
+    profiler.ProfilerControl(component_name).listen_v2(ipc_client)
+    operation = check_telemetry(ipc_client, hook, args.telemetry_topic)
+    runner.on_shutdown(operation.close)
+    runner.every(alarm_reset_interval, already_alarmed.clear)
+
+    observers: Dict[str, List[Callable[[List[Dict]], None]]] = {}
+    dog = watchdog.Watchdog.from_config(
+        args.watchdog,
+        lambda kind, name, silent: raise_alarm(hook, "absence", [f"{kind}:{name}"], {"silent_seconds": silent}),
+    )
+    if dog is not None:
+        for topic in json.loads(args.watchdog).get("Topics") or [self_telemetry_topic]:
+            observers.setdefault(topic, []).append(dog.observe)
+        runner.every(dog.resolution, dog.tick)
+    detector = anomaly.Detector.from_config(args.anomaly)
+    if detector is not None:
+        for topic in json.loads(args.anomaly).get("Topics") or [self_telemetry_topic]:
+            observers.setdefault(topic, []).append(detect_anomalies(detector, hook))
+    for watch_operation in watch_telemetry(ipc_client, observers):
+        runner.on_shutdown(watch_operation.close)
 
-    check_telemetry(GreengrassCoreIPCClientV2(), args.on_alarm_command)
-    timer = 0
-    while True:
-        # every 5 minutes we reset the alarm
-        if timer % 300 == 0:
-            already_alarmed.clear()
-        time.sleep(1)
-        timer += 1
+    runner.run()
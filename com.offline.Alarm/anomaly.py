@@ -0,0 +1,251 @@
+import array
+import json
+import math
+import threading
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+import metrics
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover - exercised on devices without NumPy
+    numpy = None
+
+DEFAULT_ALPHA = 0.05
+DEFAULT_Z_SCORE = 4.0
+DEFAULT_RATE_Z_SCORE = 6.0
+# Values of a series seen before its z-scores are trusted
+DEFAULT_WARMUP = 30
+DEFAULT_COOLDOWN = 300
+# The least standard deviation of a series, relative to its mean, so a nearly constant series does not alarm on noise
+MIN_STD_FRACTION = 0.01
+MIN_STD = 1e-9
+
+series_tracked = metrics.REGISTRY.gauge("alarm_anomaly_series", "Telemetry series the anomaly detector tracks")
+anomalies_found = metrics.REGISTRY.counter("alarm_anomalies_total", "Telemetry values found anomalous")
+detect_seconds = metrics.REGISTRY.histogram("alarm_anomaly_seconds", "Time to check a telemetry message for anomalies")
+
+SeriesKey = Tuple[str, str, str]
+
+
+class Anomaly(NamedTuple):
+    thing_name: str
+    namespace: str
+    name: str
+    value: float
+    # Standard deviations from the series' average, of the value and of its rate of change
+    z_score: float
+    rate_z_score: float
+
+    def __str__(self) -> str:
+        return f"{self.thing_name}/{self.namespace}/{self.name}"
+
+
+def is_numeric(value) -> bool:
+    # bool is an int, but a flag has no meaningful mean
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+class _PythonState:
+    """The statistics of every series, one slot per interned series ID in compact arrays of doubles."""
+
+    FIELDS = ("count", "mean", "var", "last", "last_ts", "rate_count", "rate_mean", "rate_var", "alarmed_at")
+
+    def __init__(self):
+        for field in self.FIELDS:
+            setattr(self, field, array.array("d"))
+
+    def grow(self, size: int):
+        grow = size - len(self.count)
+        if grow > 0:
+            for field in self.FIELDS:
+                getattr(self, field).extend([-math.inf if field == "alarmed_at" else 0.0] * grow)
+
+    def update(self, ids, values, timestamps, alpha, warmup) -> List[Tuple[int, float, float]]:
+        """Fold one value into each series, every ID at most once, returning the ID and z-scores of each value."""
+        scores = []
+        for i, x, t in zip(ids, values, timestamps):
+            count = self.count[i]
+            z = 0.0
+            if count >= warmup:
+                z = (x - self.mean[i]) / max(math.sqrt(self.var[i]), abs(self.mean[i]) * MIN_STD_FRACTION, MIN_STD)
+            rate_z = 0.0
+            dt = t - self.last_ts[i]
+            if count > 0 and dt > 0:
+                rate = (x - self.last[i]) / dt
+                rate_count = self.rate_count[i]
+                if rate_count >= warmup:
+                    rate_std = max(math.sqrt(self.rate_var[i]), abs(self.rate_mean[i]) * MIN_STD_FRACTION, MIN_STD)
+                    rate_z = (rate - self.rate_mean[i]) / rate_std
+                if rate_count == 0:
+                    self.rate_mean[i], self.rate_var[i] = rate, 0.0
+                else:
+                    diff = rate - self.rate_mean[i]
+                    self.rate_mean[i] += alpha * diff
+                    self.rate_var[i] = (1 - alpha) * (self.rate_var[i] + alpha * diff * diff)
+                self.rate_count[i] = rate_count + 1
+            if count == 0:
+                self.mean[i], self.var[i] = x, 0.0
+            else:
+                diff = x - self.mean[i]
+                self.mean[i] += alpha * diff
+                self.var[i] = (1 - alpha) * (self.var[i] + alpha * diff * diff)
+            self.count[i] = count + 1
+            self.last[i], self.last_ts[i] = x, t
+            scores.append((i, z, rate_z))
+        return scores
+
+
+class _NumpyState:
+    """The statistics of every series in NumPy arrays, updated for a whole round of distinct series at once."""
+
+    FIELDS = _PythonState.FIELDS
+
+    def __init__(self):
+        for field in self.FIELDS:
+            setattr(self, field, numpy.empty(0))
+
+    def grow(self, size: int):
+        if size <= len(self.count):
+            return
+        # Doubled, so interning series one by one costs amortized O(1) copies
+        capacity = max(size, 2 * len(self.count), 64)
+        for field in self.FIELDS:
+            grown = numpy.full(capacity, -numpy.inf if field == "alarmed_at" else 0.0)
+            grown[: len(getattr(self, field))] = getattr(self, field)
+            setattr(self, field, grown)
+
+    def update(self, ids, values, timestamps, alpha, warmup) -> List[Tuple[int, float, float]]:
+        i = numpy.asarray(ids, dtype=numpy.intp)
+        x = numpy.asarray(values, dtype=numpy.float64)
+        t = numpy.asarray(timestamps, dtype=numpy.float64)
+        count, mean, var = self.count[i], self.mean[i], self.var[i]
+
+        std = numpy.maximum(numpy.maximum(numpy.sqrt(var), numpy.abs(mean) * MIN_STD_FRACTION), MIN_STD)
+        z = numpy.where(count >= warmup, (x - mean) / std, 0.0)
+
+        dt = t - self.last_ts[i]
+        has_rate = (count > 0) & (dt > 0)
+        rate = numpy.where(has_rate, (x - self.last[i]) / numpy.where(dt > 0, dt, 1.0), 0.0)
+        rate_count, rate_mean, rate_var = self.rate_count[i], self.rate_mean[i], self.rate_var[i]
+        rate_std = numpy.maximum(
+            numpy.maximum(numpy.sqrt(rate_var), numpy.abs(rate_mean) * MIN_STD_FRACTION), MIN_STD
+        )
+        rate_z = numpy.where(has_rate & (rate_count >= warmup), (rate - rate_mean) / rate_std, 0.0)
+
+        rate_diff = rate - rate_mean
+        first_rate = rate_count == 0
+        self.rate_mean[i] = numpy.where(
+            has_rate, numpy.where(first_rate, rate, rate_mean + alpha * rate_diff), rate_mean
+        )
+        self.rate_var[i] = numpy.where(
+            has_rate & ~first_rate, (1 - alpha) * (rate_var + alpha * rate_diff * rate_diff), rate_var
+        )
+        self.rate_count[i] = rate_count + has_rate
+
+        diff = x - mean
+        first = count == 0
+        self.mean[i] = numpy.where(first, x, mean + alpha * diff)
+        self.var[i] = numpy.where(first, 0.0, (1 - alpha) * (var + alpha * diff * diff))
+        self.count[i] = count + 1
+        self.last[i] = x
+        self.last_ts[i] = t
+        return list(zip(ids, z.tolist(), rate_z.tolist()))
+
+
+class Detector:
+    """
+    Finds anomalous values in numeric telemetry without static thresholds. Each (thing_name, NS, N) series
+    keeps an exponentially weighted mean and variance of its values and of their rate of change, O(1) memory
+    per series, in arrays indexed by an interned series ID. A value more than `z_score` standard deviations
+    from its series' mean, or changing more than `rate_z_score` deviations faster than usual, is anomalous.
+    A series is alarmed about at most once per cooldown.
+    """
+
+    def __init__(
+        self,
+        alpha: float = DEFAULT_ALPHA,
+        z_score: float = DEFAULT_Z_SCORE,
+        rate_z_score: float = DEFAULT_RATE_Z_SCORE,
+        warmup: int = DEFAULT_WARMUP,
+        cooldown: float = DEFAULT_COOLDOWN,
+        use_numpy: Optional[bool] = None,
+    ):
+        """`use_numpy` updates a batch with NumPy; by default, whenever it is installed."""
+        if not 0 < alpha <= 1:
+            raise ValueError("the anomaly detector's Alpha must be in (0, 1]")
+        self.alpha = alpha
+        self.z_score = z_score
+        self.rate_z_score = rate_z_score
+        self.warmup = warmup
+        self.cooldown = cooldown
+        if use_numpy is None:
+            use_numpy = numpy is not None
+        self._state = _NumpyState() if use_numpy else _PythonState()
+        self._ids: Dict[SeriesKey, int] = {}
+        self._keys: List[SeriesKey] = []
+        self._lock = threading.Lock()
+        series_tracked.set_function(lambda: len(self._keys))
+
+    @classmethod
+    def from_config(cls, config: Union[str, Dict, None]) -> Optional["Detector"]:
+        """
+        A detector for the Anomaly configuration, {"Enabled": bool, "Alpha": weight of a new value, "ZScore":
+        deviations, "RateZScore": deviations, "Warmup": values, "CooldownSeconds": seconds}, or None if disabled.
+        """
+        if isinstance(config, str):
+            config = json.loads(config) if config.strip() else {}
+        config = config or {}
+        if not config.get("Enabled"):
+            return None
+        return cls(
+            float(config.get("Alpha", DEFAULT_ALPHA)),
+            float(config.get("ZScore", DEFAULT_Z_SCORE)),
+            float(config.get("RateZScore", DEFAULT_RATE_Z_SCORE)),
+            int(config.get("Warmup", DEFAULT_WARMUP)),
+            float(config.get("CooldownSeconds", DEFAULT_COOLDOWN)),
+        )
+
+    def _intern(self, key: SeriesKey) -> int:
+        series_id = self._ids.get(key)
+        if series_id is None:
+            series_id = self._ids[key] = len(self._keys)
+            self._keys.append(key)
+        return series_id
+
+    def observe(self, telemetry: Iterable[Dict], now: Optional[float] = None) -> List[Anomaly]:
+        """Fold a batch of telemetry points into their series, returning the anomalies to alarm about."""
+        now = time.monotonic() if now is None else now
+        with detect_seconds.time(), self._lock:
+            # A series may appear more than once in a batch; its values are folded in order, one round each
+            rounds: List[Tuple[List[int], List[float], List[float]]] = []
+            occurrences: Dict[int, int] = {}
+            for point in telemetry:
+                value = point.get("V")
+                if not is_numeric(value):
+                    continue
+                series_id = self._intern((point.get("thing_name", ""), point.get("NS", ""), point.get("N", "")))
+                occurrence = occurrences.get(series_id, 0)
+                occurrences[series_id] = occurrence + 1
+                if occurrence == len(rounds):
+                    rounds.append(([], [], []))
+                ids, values, timestamps = rounds[occurrence]
+                ids.append(series_id)
+                values.append(float(value))
+                # Seconds, for rates per second; a point without a timestamp has no rate of change
+                timestamps.append(point.get("TS", 0) / 1000)
+            self._state.grow(len(self._keys))
+
+            found: List[Anomaly] = []
+            for ids, values, timestamps in rounds:
+                scores = self._state.update(ids, values, timestamps, self.alpha, self.warmup)
+                for (series_id, z, rate_z), value in zip(scores, values):
+                    if abs(z) <= self.z_score and abs(rate_z) <= self.rate_z_score:
+                        continue
+                    anomalies_found.inc()
+                    if now - self._state.alarmed_at[series_id] < self.cooldown:
+                        continue
+                    self._state.alarmed_at[series_id] = now
+                    found.append(Anomaly(*self._keys[series_id], value, z, rate_z))
+            return found
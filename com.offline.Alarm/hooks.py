@@ -0,0 +1,249 @@
+import collections
+import itertools
+import json
+import logging
+import os
+import signal
+import subprocess
+import threading
+import time
+from typing import Dict, IO, Iterable, List, Optional, Union
+
+import logutil
+import metrics
+
+SHELL = "shell"
+WORKER = "worker"
+DEFAULT_ACK_TIMEOUT = 10.0
+DEFAULT_RESTART_MIN = 1.0
+DEFAULT_RESTART_MAX = 60.0
+# Alarms kept for a hook that is down, and deliveries of one alarm before it is given up on, so an alarm that
+# crashes the hook cannot crash it forever
+DEFAULT_MAX_PENDING = 1000
+MAX_ATTEMPTS = 3
+
+command_seconds = metrics.REGISTRY.histogram("alarm_command_seconds", "Time the alarm command took to run")
+ack_seconds = metrics.REGISTRY.histogram("alarm_hook_ack_seconds", "Time from an alarm to the hook acknowledging it")
+restarts = metrics.REGISTRY.counter("alarm_hook_restarts_total", "Times the alarm hook was restarted")
+dropped = metrics.REGISTRY.counter("alarm_hook_dropped_total", "Alarms given up on before the hook acknowledged them")
+unrecognized = metrics.REGISTRY.counter(
+    "alarm_hook_unrecognized_lines_total", "Lines the alarm hook wrote that are not acknowledgements"
+)
+pending_alarms = metrics.REGISTRY.gauge("alarm_hook_pending", "Alarms sent to the hook and not yet acknowledged")
+
+# Output of the hook other than acknowledgements, which a chatty hook could flood the log with
+hook_log = logutil.rate_limited("alarm.hook", per_second=1, burst=10)
+
+
+def _kill(proc: subprocess.Popen):
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+class ShellHook:
+    """Runs the alarm command in a new shell for every alarm, with ALARM_KIND and ALARM_SUBJECTS in its environment."""
+
+    def __init__(self, command: Optional[str]):
+        self.command = command
+
+    def send(self, kind: str, subjects: Iterable[str], detail: Optional[Dict] = None):
+        if not self.command:
+            return
+        env = dict(os.environ, ALARM_KIND=kind, ALARM_SUBJECTS=",".join(sorted(subjects)))
+        with command_seconds.time():
+            proc = subprocess.run(self.command, shell=True, capture_output=True, env=env)
+        logging.info(
+            "alarm output: %s",
+            {"stdout": proc.stdout.decode(), "stderr": proc.stderr.decode()},
+        )
+
+    def stop(self):
+        pass
+
+
+class _Pending:
+    __slots__ = ("line", "raised", "written", "attempts")
+
+    def __init__(self, line: bytes, raised: float):
+        self.line = line
+        self.raised = raised
+        self.written: Optional[float] = None
+        self.attempts = 0
+
+
+class HookWorker:
+    """
+    Runs the alarm command once as a long-lived hook and streams every alarm to its stdin as a line of JSON,
+    {"id", "kind", "subjects", "time", "thing_name", "detail"}. The hook acknowledges an alarm by writing a line to
+    its stdout as {"id": id}; anything else it writes is logged.
+
+    A hook that exits, or does not acknowledge within `ack_timeout`, is restarted with exponential backoff, and
+    the alarms it did not acknowledge are sent again, so a hook sees an alarm at least once.
+    """
+
+    def __init__(
+        self,
+        command: str,
+        ack_timeout: float = DEFAULT_ACK_TIMEOUT,
+        restart_min: float = DEFAULT_RESTART_MIN,
+        restart_max: float = DEFAULT_RESTART_MAX,
+        max_pending: int = DEFAULT_MAX_PENDING,
+    ):
+        self.command = command
+        self.ack_timeout = ack_timeout
+        self.restart_min = restart_min
+        self.restart_max = restart_max
+        self.max_pending = max_pending
+        self.thing_name = os.environ.get("AWS_IOT_THING_NAME", "")
+        self._ids = itertools.count(1)
+        self._pending: "collections.OrderedDict[int, _Pending]" = collections.OrderedDict()
+        self._lock = threading.Lock()
+        # Writes may block on a hook that stopped reading; they are serialized apart from the acknowledgements
+        self._write_lock = threading.Lock()
+        self._proc: Optional[subprocess.Popen] = None
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        pending_alarms.set_function(lambda: len(self._pending))
+
+    def start(self) -> "HookWorker":
+        self._thread = threading.Thread(target=self._supervise, name="alarm-hook", daemon=True)
+        self._thread.start()
+        return self
+
+    def _supervise(self):
+        delay = self.restart_min
+        while not self._stopped.is_set():
+            started = time.monotonic()
+            try:
+                # In a process group of its own, so killing the hook kills the command and not only its shell
+                proc = subprocess.Popen(
+                    self.command, shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE, start_new_session=True
+                )
+            except OSError:
+                logging.exception("could not start the alarm hook")
+            else:
+                logging.info(f"started the alarm hook, pid {proc.pid}")
+                with self._lock:
+                    self._proc = proc
+                    resend = list(self._pending.values())
+                for pending in resend:
+                    self._write(proc, pending)
+                self._read_acks(proc.stdout)
+                code = proc.wait()
+                with self._lock:
+                    self._proc = None
+                if self._stopped.is_set():
+                    return
+                logging.warning(f"the alarm hook exited with {code}, restarting it in {delay:.0f}s")
+            restarts.inc()
+            # A hook that ran for a while before failing starts over from the shortest backoff
+            if time.monotonic() - started > self.restart_max:
+                delay = self.restart_min
+            self._stopped.wait(delay)
+            delay = min(delay * 2, self.restart_max)
+
+    def _write(self, proc: subprocess.Popen, pending: _Pending):
+        with self._lock:
+            pending.attempts += 1
+            pending.written = time.monotonic()
+        try:
+            with self._write_lock:
+                proc.stdin.write(pending.line)
+                proc.stdin.flush()
+        except (OSError, ValueError):
+            # The hook is gone; the supervisor restarts it and sends the alarm again
+            pass
+
+    def _read_acks(self, stdout: IO[bytes]):
+        for line in stdout:
+            now = time.monotonic()
+            try:
+                ack = json.loads(line)
+            except ValueError:
+                ack = None
+            # Only an explicit {"id": id} acknowledges, so a hook printing anything else cannot lose alarms
+            if not isinstance(ack, dict) or not isinstance(ack.get("id"), int):
+                unrecognized.inc()
+                hook_log.info(f"alarm hook: {line.decode(errors='replace').rstrip()}")
+                continue
+            with self._lock:
+                pending = self._pending.pop(ack["id"], None)
+            if pending is not None:
+                ack_seconds.observe(now - pending.raised)
+
+    def send(self, kind: str, subjects: Iterable[str], detail: Optional[Dict] = None):
+        event = {
+            "kind": kind,
+            "subjects": sorted(subjects),
+            "time": time.time(),
+            "thing_name": self.thing_name,
+            "detail": detail or {},
+        }
+        with self._lock:
+            alarm_id = next(self._ids)
+            pending = self._pending[alarm_id] = _Pending(
+                json.dumps(dict(event, id=alarm_id)).encode() + b"\n", time.monotonic()
+            )
+            if len(self._pending) > self.max_pending:
+                self._pending.popitem(last=False)
+                dropped.inc()
+            proc = self._proc
+        # With the hook down, the alarm waits in pending for the restart
+        if proc is not None:
+            self._write(proc, pending)
+
+    def check(self, now: Optional[float] = None):
+        """Give up on alarms delivered too often, and restart a hook that is not acknowledging its alarms."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            late: List[int] = [
+                k for k, p in self._pending.items() if p.written is not None and now - p.written > self.ack_timeout
+            ]
+            for alarm_id in late:
+                if self._pending[alarm_id].attempts >= MAX_ATTEMPTS:
+                    logging.warning(f"giving up on alarm {alarm_id} after {MAX_ATTEMPTS} deliveries to the hook")
+                    del self._pending[alarm_id]
+                    dropped.inc()
+            proc = self._proc
+        if late and proc is not None:
+            logging.warning(f"the alarm hook has not acknowledged {len(late)} alarms in {self.ack_timeout:g}s")
+            _kill(proc)
+
+    def stop(self, timeout: float = 5.0):
+        """Close the hook's stdin, which tells it to exit, and kill it if it has not within `timeout`."""
+        self._stopped.set()
+        with self._lock:
+            proc = self._proc
+        if proc is None:
+            return
+        try:
+            proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            proc.wait(timeout)
+        except subprocess.TimeoutExpired:
+            _kill(proc)
+
+
+def from_config(command: Optional[str], config: Union[str, Dict, None]) -> Union[ShellHook, HookWorker]:
+    """
+    The hook for the AlarmHook configuration, {"Mode": "shell" or "worker", "AckTimeoutSeconds": seconds,
+    "RestartMinSeconds": seconds, "RestartMaxSeconds": seconds}. Shell mode, the default, runs `command` per alarm.
+    """
+    if isinstance(config, str):
+        config = json.loads(config) if config.strip() else {}
+    config = config or {}
+    mode = config.get("Mode", SHELL)
+    if mode not in (SHELL, WORKER):
+        raise ValueError(f"unknown alarm hook mode {mode}")
+    if mode == SHELL or not command:
+        return ShellHook(command)
+    return HookWorker(
+        command,
+        float(config.get("AckTimeoutSeconds", DEFAULT_ACK_TIMEOUT)),
+        float(config.get("RestartMinSeconds", DEFAULT_RESTART_MIN)),
+        float(config.get("RestartMaxSeconds", DEFAULT_RESTART_MAX)),
+    ).start()
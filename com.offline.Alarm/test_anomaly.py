@@ -0,0 +1,82 @@
+import random
+
+import pytest
+
+import anomaly
+
+BACKENDS = [False, pytest.param(True, marks=pytest.mark.skipif(anomaly.numpy is None, reason="NumPy is not installed"))]
+
+
+def point(value, ts_ms, name="CpuUsage", thing="thing-1"):
+    return {"thing_name": thing, "NS": "SystemMetrics", "N": name, "V": value, "TS": ts_ms}
+
+
+def noisy(count, seed=0):
+    rng = random.Random(seed)
+    return [50 + rng.gauss(0, 1) for _ in range(count)]
+
+
+@pytest.mark.parametrize("use_numpy", BACKENDS)
+class TestDetector:
+    def test_nothing_alarms_during_warmup(self, use_numpy):
+        detector = anomaly.Detector(warmup=10, use_numpy=use_numpy)
+        found = [detector.observe([point(v, i * 1000)], now=i) for i, v in enumerate([1, 1000, 1, 1000, 1])]
+        assert found == [[]] * 5
+
+    def test_a_spike_trips_the_threshold(self, use_numpy):
+        detector = anomaly.Detector(warmup=10, use_numpy=use_numpy)
+        for i, v in enumerate(noisy(50)):
+            assert detector.observe([point(v, i * 1000)], now=i) == []
+        found = detector.observe([point(80, 50_000)], now=50)
+        assert [str(a) for a in found] == ["thing-1/SystemMetrics/CpuUsage"]
+        assert found[0].value == 80 and found[0].z_score > detector.z_score
+
+    def test_a_series_alarms_once_per_cooldown(self, use_numpy):
+        detector = anomaly.Detector(warmup=10, cooldown=100, use_numpy=use_numpy)
+        for i, v in enumerate(noisy(50)):
+            detector.observe([point(v, i * 1000)], now=i)
+        assert len(detector.observe([point(80, 50_000)], now=50)) == 1
+        assert detector.observe([point(20, 51_000)], now=51) == []
+
+    def test_series_are_told_apart_and_only_numbers_count(self, use_numpy):
+        detector = anomaly.Detector(warmup=10, use_numpy=use_numpy)
+        for i, v in enumerate(noisy(50)):
+            detector.observe([point(v, i * 1000), point(v, i * 1000, thing="thing-2"), point(True, i * 1000, "Up")], now=i)
+        found = detector.observe([point(50, 50_000), point(80, 50_000, thing="thing-2")], now=50)
+        assert [a.thing_name for a in found] == ["thing-2"]
+        assert len(detector._keys) == 2
+
+    def test_repeats_of_a_series_in_one_batch_are_folded_in_order(self, use_numpy):
+        batched = anomaly.Detector(warmup=10, use_numpy=use_numpy)
+        one_by_one = anomaly.Detector(warmup=10, use_numpy=use_numpy)
+        values = noisy(60) + [80]
+        found = batched.observe([point(v, i * 1000) for i, v in enumerate(values)], now=0)
+        expected = [a for i, v in enumerate(values) for a in one_by_one.observe([point(v, i * 1000)], now=0)]
+        assert found == expected and len(found) == 1
+
+
+@pytest.mark.skipif(anomaly.numpy is None, reason="NumPy is not installed")
+def test_numpy_and_python_state_agree():
+    rng = random.Random(1)
+    python = anomaly.Detector(warmup=5, cooldown=0, use_numpy=False)
+    vectorized = anomaly.Detector(warmup=5, cooldown=0, use_numpy=True)
+    alarmed = 0
+    for step in range(100):
+        batch = [point(rng.gauss(50, 5) * (4 if rng.random() < 0.02 else 1), step * 1000 + j, f"m{rng.randrange(8)}")
+                 for j in range(20)]
+        expected, found = python.observe(batch, now=step), vectorized.observe(batch, now=step)
+        assert [str(a) for a in found] == [str(a) for a in expected]
+        assert [a.z_score for a in found] == pytest.approx([a.z_score for a in expected])
+        alarmed += len(found)
+    assert alarmed > 0
+    size = len(python._keys)
+    for field in anomaly._PythonState.FIELDS:
+        assert list(getattr(python._state, field)) == pytest.approx(list(getattr(vectorized._state, field)[:size]))
+
+
+def test_from_config_is_none_when_disabled():
+    assert anomaly.Detector.from_config("{}") is None
+    detector = anomaly.Detector.from_config('{"Enabled": true, "ZScore": 3, "Warmup": 5}')
+    assert detector.z_score == 3 and detector.warmup == 5
+    with pytest.raises(ValueError):
+        anomaly.Detector.from_config('{"Enabled": true, "Alpha": 0}')
@@ -0,0 +1,130 @@
+import json
+import sys
+import time
+
+import pytest
+
+import hooks
+
+# Reads alarms, records their ids, and acknowledges them, but crashes on the first alarm about "crash" and only
+# chats about alarms about "chatty"
+FAKE_HOOK = """
+import json, os, sys
+received, crashed = sys.argv[1], sys.argv[2]
+for line in sys.stdin:
+    alarm = json.loads(line)
+    with open(received, "a") as f:
+        f.write(f"{alarm['id']}\\n")
+    if alarm["subjects"] == ["crash"] and not os.path.exists(crashed):
+        open(crashed, "w").close()
+        sys.exit(3)
+    if alarm["subjects"] == ["chatty"]:
+        print("handling it", flush=True)
+        print('{"status": "ok"}', flush=True)
+        continue
+    print(json.dumps({"id": alarm["id"]}), flush=True)
+"""
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def fake_hook(tmp_path):
+    script = tmp_path / "hook.py"
+    script.write_text(FAKE_HOOK)
+    received = tmp_path / "received"
+    received.touch()
+    return f"{sys.executable} {script} {received} {tmp_path / 'crashed'}", received
+
+
+@pytest.fixture
+def worker(fake_hook):
+    started = []
+
+    def start(**kwargs):
+        hook = hooks.HookWorker(fake_hook[0], **dict({"restart_min": 0.05}, **kwargs)).start()
+        started.append(hook)
+        wait_for(lambda: hook._proc is not None)
+        return hook
+
+    yield start
+    for hook in started:
+        hook.stop()
+
+
+def received_ids(fake_hook):
+    return [int(line) for line in fake_hook[1].read_text().split()]
+
+
+class TestHookWorker:
+    def test_alarms_are_streamed_and_acknowledged_by_id(self, worker, fake_hook):
+        hook = worker()
+        for i in range(3):
+            hook.send("broken", [f"com.example.C{i}"], {"n": i})
+        wait_for(lambda: not hook._pending)
+        assert received_ids(fake_hook) == [1, 2, 3]
+
+    def test_other_output_does_not_acknowledge(self, worker, fake_hook):
+        unrecognized = hooks.unrecognized.value
+        hook = worker()
+        hook.send("broken", ["chatty"])
+        wait_for(lambda: hooks.unrecognized.value == unrecognized + 2)
+        assert list(hook._pending) == [1]
+
+    def test_a_crashed_hook_is_restarted_and_gets_its_alarms_again(self, worker, fake_hook):
+        restarts = hooks.restarts.value
+        hook = worker()
+        hook.send("broken", ["crash"])
+        hook.send("broken", ["after"])
+        wait_for(lambda: not hook._pending)
+        assert hooks.restarts.value == restarts + 1
+        # The crash lost the first alarm, and possibly the second too if it arrived before the hook exited
+        assert received_ids(fake_hook)[0] == 1 and received_ids(fake_hook).count(1) == 2
+
+    def test_a_hook_that_does_not_acknowledge_is_restarted_then_given_up_on(self, worker, fake_hook):
+        dropped = hooks.dropped.value
+        hook = worker(ack_timeout=0.01)
+        hook.send("broken", ["chatty"])
+        for attempt in range(1, hooks.MAX_ATTEMPTS + 1):
+            wait_for(lambda: received_ids(fake_hook).count(1) == attempt)
+            time.sleep(0.02)
+            hook.check()
+        assert not hook._pending and hooks.dropped.value == dropped + 1
+
+    def test_alarms_wait_for_a_hook_that_is_down(self, fake_hook):
+        hook = hooks.HookWorker(fake_hook[0])
+        hook.send("absence", ["thing:thing-1"], {"silent_seconds": None})
+        hook.start()
+        try:
+            wait_for(lambda: not hook._pending)
+        finally:
+            hook.stop()
+        assert received_ids(fake_hook) == [1]
+
+
+class TestShellHook:
+    def test_the_command_gets_the_alarm_in_its_environment(self, tmp_path):
+        out = tmp_path / "out"
+        hooks.ShellHook(f'echo "$ALARM_KIND $ALARM_SUBJECTS" > {out}').send("broken", ["b", "a"])
+        assert out.read_text() == "broken a,b\n"
+
+
+class TestFromConfig:
+    def test_shell_mode_is_the_default(self):
+        assert isinstance(hooks.from_config("true", "{}"), hooks.ShellHook)
+
+    def test_worker_mode(self, fake_hook):
+        hook = hooks.from_config(fake_hook[0], json.dumps({"Mode": "worker", "AckTimeoutSeconds": 3}))
+        try:
+            assert isinstance(hook, hooks.HookWorker) and hook.ack_timeout == 3
+        finally:
+            hook.stop()
+
+    def test_unknown_modes_are_rejected(self):
+        with pytest.raises(ValueError):
+            hooks.from_config("true", '{"Mode": "daemon"}')
@@ -0,0 +1,109 @@
+import pytest
+
+import watchdog
+
+
+def status(component, thing="thing-1", ns="ComponentStatus"):
+    return {"thing_name": thing, "NS": ns, "N": component, "V": "RUNNING", "TS": 0}
+
+
+class TestTimerWheel:
+    def test_a_timer_fires_once_its_deadline_passes(self):
+        wheel = watchdog.TimerWheel(resolution=1, slots=8, now=0)
+        wheel.schedule("a", 3)
+        assert wheel.advance(2.5) == []
+        assert wheel.advance(3) == ["a"]
+        assert wheel.advance(10) == []
+
+    def test_a_deadline_is_rounded_up_to_the_next_tick(self):
+        wheel = watchdog.TimerWheel(resolution=1, slots=8, now=0)
+        wheel.schedule("a", 2.2)
+        assert wheel.advance(2.9) == []
+        assert wheel.advance(3) == ["a"]
+
+    def test_a_deadline_more_than_a_turn_away_waits_out_the_turns(self):
+        wheel = watchdog.TimerWheel(resolution=1, slots=8, now=0)
+        wheel.schedule("far", 20)
+        assert wheel.advance(8) == []
+        assert wheel.advance(19) == []
+        assert wheel.advance(20) == ["far"]
+
+    def test_a_pause_longer_than_a_turn_fires_everything_due(self):
+        wheel = watchdog.TimerWheel(resolution=1, slots=8, now=0)
+        for key, deadline in (("a", 1), ("b", 5), ("c", 30)):
+            wheel.schedule(key, deadline)
+        assert sorted(wheel.advance(25)) == ["a", "b"]
+        assert wheel.advance(30) == ["c"]
+
+    def test_a_timer_can_be_rearmed_after_it_fires(self):
+        wheel = watchdog.TimerWheel(resolution=1, slots=8, now=0)
+        wheel.schedule("a", 2)
+        assert wheel.advance(2) == ["a"]
+        wheel.schedule("a", 5)
+        assert wheel.advance(4) == []
+        assert wheel.advance(5) == ["a"]
+
+
+class TestWatchdog:
+    @pytest.fixture
+    def absences(self):
+        return []
+
+    def watchdog(self, absences, things=None, components=None):
+        return watchdog.Watchdog(
+            things or {}, components or {}, lambda *a: absences.append(a), resolution=1, now=0
+        )
+
+    def test_a_source_that_never_sends_is_absent(self, absences):
+        dog = self.watchdog(absences, components={"com.example.A": 10})
+        dog.tick(9)
+        assert absences == []
+        dog.tick(10)
+        assert absences == [(watchdog.COMPONENT, "com.example.A", None)]
+
+    def test_a_late_heartbeat_moves_the_deadline(self, absences):
+        dog = self.watchdog(absences, components={"com.example.A": 10})
+        dog.observe([status("com.example.A")], now=8)
+        dog.tick(10)
+        assert absences == []
+        dog.tick(17)
+        assert absences == []
+        dog.tick(18)
+        assert absences == [(watchdog.COMPONENT, "com.example.A", 10)]
+
+    def test_an_absence_alarms_once_per_silence(self, absences):
+        dog = self.watchdog(absences, things={"thing-1": 5})
+        for t in range(5, 30):
+            dog.tick(t)
+        assert absences == [(watchdog.THING, "thing-1", None)]
+        dog.observe([status("com.example.A")], now=30)
+        for t in range(31, 40):
+            dog.tick(t)
+        assert absences == [(watchdog.THING, "thing-1", None), (watchdog.THING, "thing-1", 5)]
+
+    def test_components_are_told_apart_by_name_not_namespace(self, absences):
+        dog = self.watchdog(absences, components={"com.example.A": 10, "com.example.B": 10})
+        for t in range(0, 30, 5):
+            dog.observe([status("com.example.A"), status("com.example.A", ns="ComponentCpuUsage")], now=t)
+            dog.tick(t)
+        assert absences == [(watchdog.COMPONENT, "com.example.B", None)]
+
+    def test_other_namespaces_are_not_components(self, absences):
+        dog = self.watchdog(absences, components={watchdog.ANY: 10})
+        dog.observe([{"NS": "SystemMetrics", "N": "CpuUsage", "V": 1, "TS": 0}], now=0)
+        dog.tick(20)
+        assert absences == []
+
+    def test_any_expects_every_source_seen_once(self, absences):
+        dog = self.watchdog(absences, things={watchdog.ANY: 10})
+        dog.observe([status("com.example.A", thing="thing-2")], now=1)
+        dog.tick(10)
+        assert absences == []
+        dog.tick(11)
+        assert absences == [(watchdog.THING, "thing-2", 10)]
+
+    def test_from_config_is_none_when_nothing_is_expected(self):
+        assert watchdog.Watchdog.from_config("{}", lambda *a: None) is None
+        assert watchdog.Watchdog.from_config('{"Things": {"thing-1": 0}}', lambda *a: None) is None
+        dog = watchdog.Watchdog.from_config('{"Components": {"*": 60}, "ResolutionSeconds": 5}', lambda *a: None)
+        assert dog.resolution == 5 and dog.expected[watchdog.COMPONENT] == {"*": 60.0}
@@ -0,0 +1,173 @@
+import json
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple, Union
+
+import metrics
+
+THING = "thing"
+COMPONENT = "component"
+# An expected interval for every source of a kind that sends at least once
+ANY = "*"
+# The namespaces whose points are named after the component they describe
+COMPONENT_NAMESPACES = frozenset(("ComponentStatus", "ComponentCpuUsage", "ComponentMemUsage"))
+DEFAULT_RESOLUTION = 1.0
+DEFAULT_SLOTS = 512
+
+Source = Tuple[str, str]
+
+absences = metrics.REGISTRY.counter("alarm_absences_total", "Sources that stopped sending telemetry")
+absent = metrics.REGISTRY.gauge("alarm_absent_sources", "Sources currently not sending telemetry")
+tracked = metrics.REGISTRY.gauge("alarm_tracked_sources", "Sources whose telemetry is expected")
+
+
+class TimerWheel:
+    """
+    A hashed timing wheel: deadlines fall into one of `slots` buckets by their tick, so scheduling is O(1) and
+    advancing the wheel only looks at the buckets of the ticks that passed. Deadlines more than one turn of the
+    wheel away wait in their bucket for the turns in between.
+    """
+
+    def __init__(self, resolution: float = DEFAULT_RESOLUTION, slots: int = DEFAULT_SLOTS, now: Optional[float] = None):
+        self.resolution = resolution
+        self.slots: List[List[Tuple[int, Source]]] = [[] for _ in range(slots)]
+        self.tick = self._tick(time.monotonic() if now is None else now)
+
+    def _tick(self, t: float) -> int:
+        return int(t // self.resolution)
+
+    def schedule(self, key: Source, deadline: float):
+        # Rounded up, so a timer never fires before its deadline
+        tick = max(-int(-deadline // self.resolution), self.tick + 1)
+        self.slots[tick % len(self.slots)].append((tick, key))
+
+    def advance(self, now: float) -> List[Source]:
+        """The keys whose deadline passed since the last advance."""
+        expired: List[Source] = []
+        target = self._tick(now)
+        # After a pause longer than a turn, every bucket is visited once rather than once per missed tick
+        for step in range(1, min(target - self.tick, len(self.slots)) + 1):
+            slot = self.slots[(self.tick + step) % len(self.slots)]
+            if slot:
+                expired.extend(k for t, k in slot if t <= target)
+                slot[:] = [(t, k) for t, k in slot if t > target]
+        self.tick = max(self.tick, target)
+        return expired
+
+
+class Watchdog:
+    """
+    Raises an absence alarm when a thing or a component stops sending telemetry for longer than expected. A
+    message only records when its sources were last seen, which is O(1); the wheel holds one timer per source,
+    and a timer that expires for a source seen since is moved to its new deadline rather than firing. A source
+    alarms once per absence, and again only after it was seen in between.
+    """
+
+    def __init__(
+        self,
+        things: Dict[str, float],
+        components: Dict[str, float],
+        on_absent: Callable[[str, str, Optional[float]], None],
+        resolution: float = DEFAULT_RESOLUTION,
+        now: Optional[float] = None,
+    ):
+        """
+        `things` and `components` map names to the seconds expected between their telemetry, where "*" applies
+        to every one seen. `on_absent` is called with the kind, the name and the seconds since it was last seen,
+        None if it never was.
+        """
+        now = time.monotonic() if now is None else now
+        self.expected = {THING: dict(things), COMPONENT: dict(components)}
+        self.on_absent = on_absent
+        self.resolution = resolution
+        self.wheel = TimerWheel(resolution, now=now)
+        self._started = now
+        self._last_seen: Dict[Source, float] = {}
+        self._intervals: Dict[Source, float] = {}
+        self._armed: Set[Source] = set()
+        self._absent: Set[Source] = set()
+        self._lock = threading.Lock()
+        # Sources named explicitly are expected from the start, so one that never sends is caught too
+        for kind, intervals in self.expected.items():
+            for name, interval in intervals.items():
+                if name != ANY:
+                    self._track((kind, name), interval, now)
+        absent.set_function(lambda: len(self._absent))
+        tracked.set_function(lambda: len(self._intervals))
+
+    @classmethod
+    def from_config(
+        cls, config: Union[str, Dict, None], on_absent: Callable[[str, str, Optional[float]], None]
+    ) -> Optional["Watchdog"]:
+        """
+        A watchdog for the Watchdog configuration, {"Things": {name: seconds}, "Components": {name: seconds},
+        "ResolutionSeconds": seconds}, or None when it expects nothing.
+        """
+        if isinstance(config, str):
+            config = json.loads(config) if config.strip() else {}
+        config = config or {}
+        things = {k: float(v) for k, v in (config.get("Things") or {}).items() if float(v) > 0}
+        components = {k: float(v) for k, v in (config.get("Components") or {}).items() if float(v) > 0}
+        if not things and not components:
+            return None
+        return cls(things, components, on_absent, float(config.get("ResolutionSeconds", DEFAULT_RESOLUTION)))
+
+    def _track(self, source: Source, interval: float, now: float):
+        self._intervals[source] = interval
+        self._armed.add(source)
+        self.wheel.schedule(source, now + interval)
+
+    def heartbeat(self, kind: str, name: str, now: Optional[float] = None):
+        source = (kind, name)
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if source not in self._intervals:
+                interval = self.expected[kind].get(ANY)
+                if interval is None:
+                    return
+                self._track(source, interval, now)
+            self._last_seen[source] = now
+            if source in self._absent:
+                self._absent.discard(source)
+                logging.info(f"{kind} {name} is sending telemetry again")
+            if source not in self._armed:
+                self._armed.add(source)
+                self.wheel.schedule(source, now + self._intervals[source])
+
+    def observe(self, telemetry: List[Dict], now: Optional[float] = None):
+        """Record the things and components a telemetry message came from, by thing_name and component name."""
+        now = time.monotonic() if now is None else now
+        seen: Set[Source] = set()
+        for point in telemetry:
+            thing_name = point.get("thing_name")
+            if thing_name:
+                seen.add((THING, thing_name))
+            # Every component reports under the same namespaces, so a component is told apart by its point's name
+            if point.get("NS") in COMPONENT_NAMESPACES and point.get("N"):
+                seen.add((COMPONENT, point["N"]))
+        for kind, name in seen:
+            self.heartbeat(kind, name, now)
+
+    def tick(self, now: Optional[float] = None):
+        """Fire the timers that expired, calling on_absent for every source not seen before its deadline."""
+        now = time.monotonic() if now is None else now
+        missing: List[Tuple[Source, Optional[float]]] = []
+        with self._lock:
+            for source in self.wheel.advance(now):
+                self._armed.discard(source)
+                last_seen = self._last_seen.get(source)
+                deadline = (self._started if last_seen is None else last_seen) + self._intervals[source]
+                if deadline > now:
+                    self._armed.add(source)
+                    self.wheel.schedule(source, deadline)
+                    continue
+                self._absent.add(source)
+                absences.inc()
+                missing.append((source, None if last_seen is None else now - last_seen))
+        for (kind, name), silent in missing:
+            logging.warning(
+                f"{kind} {name} has sent no telemetry "
+                + ("since the watchdog started" if silent is None else f"for {silent:.0f}s")
+            )
+            self.on_absent(kind, name, silent)
@@ -0,0 +1,277 @@
+import json
+import logging
+import statistics
+import threading
+import time
+from argparse import ArgumentParser
+from typing import Callable, Dict, List, Optional
+
+from awsiot.greengrasscoreipc.clientv2 import GreengrassCoreIPCClientV2
+from awsiot.greengrasscoreipc.model import BinaryMessage, PublishMessage
+
+
+logging.basicConfig(level=logging.INFO)
+
+telemetry_topic = "$local/greengrass/telemetry"
+
+# Every batch carries one probe point so its arrival in InfluxDB can be timed end to end
+PROBE_NAMESPACE = "LoadGenerator"
+PROBE_NAME = "Probe"
+DEFAULT_INFLUXDB_URL = "https://localhost:8086"
+
+SYSTEM_METRICS = [
+    ("CpuUsage", "Percent", "Average"),
+    ("SystemMemUsage", "Megabytes", "Count"),
+    ("TotalNumberOfFDs", "Count", "Count"),
+]
+
+Publish = Callable[[bytes], None]
+
+
+def parse_args():
+    parser = ArgumentParser(description="Publish synthetic NucleusEmitter telemetry and measure its delivery")
+    parser.add_argument("--transport", choices=["ipc", "mqtt"], default="ipc")
+    parser.add_argument("--topic", default=telemetry_topic)
+    parser.add_argument("--mqtt_host", default="localhost", help="Stand-in broker host for --transport mqtt")
+    parser.add_argument("--mqtt_port", type=int, default=1883)
+    parser.add_argument(
+        "--rates",
+        default="1,5,10,25,50",
+        help="Comma separated batches per second, one step each, in increasing order",
+    )
+    parser.add_argument("--step_seconds", type=float, default=30)
+    parser.add_argument("--batch_size", type=int, default=3, help="System metrics per batch")
+    parser.add_argument("--components", type=int, default=10, help="Components with CPU/memory metrics")
+    parser.add_argument("--flapping_components", type=int, default=0)
+    parser.add_argument("--flap_period", type=float, default=10, help="Seconds between state flips")
+    parser.add_argument("--influxdb_url", help=f"InfluxDB to query for probes, {DEFAULT_INFLUXDB_URL} if empty")
+    parser.add_argument("--influxdb_token", help="Query InfluxDB for probes to measure end-to-end latency")
+    parser.add_argument("--influxdb_org", default="greengrass")
+    parser.add_argument("--influxdb_bucket", default="greengrass-telemetry")
+    parser.add_argument("--poll_interval", type=float, default=0.25)
+    parser.add_argument("--drain_seconds", type=float, default=10, help="Time allowed for probes after each step")
+    parser.add_argument("--max_p95_ms", type=float, default=5000, help="p95 latency considered saturated")
+    return parser.parse_args()
+
+
+def make_batch(
+    seq: int,
+    ts_ms: int,
+    batch_size: int,
+    components: int,
+    flapping_components: int = 0,
+    flap_period: float = 10,
+) -> List[Dict]:
+    batch = []
+    for i in range(batch_size):
+        if i < len(SYSTEM_METRICS):
+            name, unit, aggregation = SYSTEM_METRICS[i]
+        else:
+            name, unit, aggregation = f"SyntheticMetric{i}", "Count", "Average"
+        batch.append({"NS": "SystemMetrics", "N": name, "U": unit, "A": aggregation, "V": seq % 100, "TS": ts_ms})
+    for i in range(components):
+        name = f"com.offline.load.Component{i}"
+        batch.append({"NS": "ComponentCpuUsage", "N": name, "U": "Percent", "A": "Average", "V": i % 100, "TS": ts_ms})
+        batch.append({"NS": "ComponentMemUsage", "N": name, "U": "Megabytes", "A": "Count", "V": i, "TS": ts_ms})
+    # Flapping components alternate between RUNNING and BROKEN, shifted so they do not all flip together
+    for i in range(flapping_components):
+        phase = int(ts_ms / 1000 / flap_period) + i
+        state = "BROKEN" if phase % 2 else "RUNNING"
+        batch.append(
+            {"NS": "ComponentStatus", "N": f"com.offline.load.Flapping{i}", "U": "None", "A": "None", "V": state, "TS": ts_ms}
+        )
+    batch.append({"NS": PROBE_NAMESPACE, "N": PROBE_NAME, "U": "Count", "A": "Count", "V": seq, "TS": ts_ms})
+    return batch
+
+
+def ipc_publisher(ipc_client: GreengrassCoreIPCClientV2, topic: str) -> Publish:
+    def publish(payload: bytes):
+        msg = PublishMessage(binary_message=BinaryMessage(message=payload))
+        ipc_client.publish_to_topic(topic=topic, publish_message=msg)
+
+    return publish
+
+
+def mqtt_publisher(host: str, port: int, topic: str) -> Publish:
+    import awscrt.mqtt
+    from awscrt import io
+
+    client = awscrt.mqtt.Client(io.ClientBootstrap.get_or_create_static_default())
+    conn = awscrt.mqtt.Connection(client, host, port, f"loadgen-{int(time.time())}")
+    conn.connect().result()
+
+    def publish(payload: bytes):
+        resp, _ = conn.publish(topic, payload, awscrt.mqtt.QoS.AT_LEAST_ONCE)
+        resp.result()
+
+    return publish
+
+
+class ProbeTracker:
+    def __init__(self):
+        self.emitted: Dict[int, float] = {}
+        self.latencies_ms: Dict[int, float] = {}
+        self.lock = threading.Lock()
+
+    def emit(self, seq: int, at: float):
+        with self.lock:
+            self.emitted[seq] = at
+
+    def observe(self, seq: int, at: float):
+        with self.lock:
+            if seq in self.emitted and seq not in self.latencies_ms:
+                self.latencies_ms[seq] = (at - self.emitted[seq]) * 1000
+
+    def delivered(self, seqs: range) -> List[float]:
+        with self.lock:
+            return [self.latencies_ms[s] for s in seqs if s in self.latencies_ms]
+
+
+def poll_probes(
+    query_api, bucket: str, org: str, since_ms: int, tracker: ProbeTracker, stop: threading.Event, interval: float
+):
+    # Only ask for probes that have not been seen yet, so every poll stays cheap
+    last_seen = -1
+    while not stop.is_set():
+        query = (
+            f'from(bucket: "{bucket}") |> range(start: time(v: {since_ms * 1_000_000})) '
+            f'|> filter(fn: (r) => r["_measurement"] == "{PROBE_NAME}" and r["NS"] == "{PROBE_NAMESPACE}") '
+            f'|> filter(fn: (r) => r["_value"] > {last_seen})'
+        )
+        try:
+            now = time.time()
+            for table in query_api.query(query, org=org):
+                for record in table.records:
+                    seq = int(record.get_value())
+                    tracker.observe(seq, now)
+                    last_seen = max(last_seen, seq)
+        except Exception as e:
+            logging.warning(f"probe query failed: {e}")
+        stop.wait(interval)
+
+
+def run_step(publish: Publish, rate: float, duration: float, first_seq: int, tracker: ProbeTracker, args) -> Dict:
+    count = max(int(rate * duration), 1)
+    started = time.monotonic()
+    failures = 0
+    for i in range(count):
+        # Pace against the step start so a slow publish is not hidden by the next sleep
+        delay = started + i / rate - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        seq = first_seq + i
+        now = time.time()
+        payload = json.dumps(
+            make_batch(seq, int(now * 1000), args.batch_size, args.components, args.flapping_components, args.flap_period)
+        ).encode()
+        tracker.emit(seq, now)
+        try:
+            publish(payload)
+        except Exception as e:
+            failures += 1
+            logging.warning(f"publish failed: {e}")
+    elapsed = time.monotonic() - started
+    return {"target_rate": rate, "sent": count, "failures": failures, "achieved_rate": count / elapsed}
+
+
+def summarize_step(step: Dict, latencies: List[float], measured: bool) -> Dict:
+    step = dict(step)
+    if measured:
+        step["delivered"] = len(latencies)
+        step["delivered_ratio"] = len(latencies) / step["sent"]
+        if latencies:
+            ordered = sorted(latencies)
+            step["latency_ms_p50"] = statistics.median(ordered)
+            step["latency_ms_p95"] = ordered[int(0.95 * (len(ordered) - 1))]
+            step["latency_ms_p99"] = ordered[int(0.99 * (len(ordered) - 1))]
+    return step
+
+
+def is_saturated(step: Dict, max_p95_ms: float) -> bool:
+    if step["achieved_rate"] < 0.95 * step["target_rate"] or step["failures"] > 0:
+        return True
+    if "delivered_ratio" in step:
+        return step["delivered_ratio"] < 0.99 or step.get("latency_ms_p95", float("inf")) > max_p95_ms
+    return False
+
+
+def run(publish: Publish, args, query_api=None) -> List[Dict]:
+    tracker = ProbeTracker()
+    stop = threading.Event()
+    if query_api is not None:
+        poller = threading.Thread(
+            target=poll_probes,
+            args=(
+                query_api,
+                args.influxdb_bucket,
+                args.influxdb_org,
+                int(time.time() * 1000),
+                tracker,
+                stop,
+                args.poll_interval,
+            ),
+            daemon=True,
+        )
+        poller.start()
+
+    steps = []
+    seq = 0
+    try:
+        for rate in [float(r) for r in args.rates.split(",")]:
+            logging.info(f"publishing {rate} batches/s for {args.step_seconds}s")
+            step = run_step(publish, rate, args.step_seconds, seq, tracker, args)
+            if query_api is not None:
+                time.sleep(args.drain_seconds)
+            step = summarize_step(step, tracker.delivered(range(seq, seq + step["sent"])), query_api is not None)
+            seq += step["sent"]
+            steps.append(step)
+            logging.info(f"step result: {step}")
+            if is_saturated(step, args.max_p95_ms):
+                logging.info(f"saturated at {rate} batches/s")
+                break
+    finally:
+        stop.set()
+    return steps
+
+
+def saturation_point(steps: List[Dict], max_p95_ms: float) -> Optional[float]:
+    for step in steps:
+        if is_saturated(step, max_p95_ms):
+            return step["target_rate"]
+    return None
+
+
+def report(steps: List[Dict]):
+    print(f"{'target/s':>9} {'achieved/s':>10} {'sent':>7} {'delivered':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for s in steps:
+        print(
+            f"{s['target_rate']:>9.1f} {s['achieved_rate']:>10.1f} {s['sent']:>7} {s.get('delivered', '-'):>9} "
+            f"{s.get('latency_ms_p50', float('nan')):>9.1f} {s.get('latency_ms_p95', float('nan')):>9.1f} "
+            f"{s.get('latency_ms_p99', float('nan')):>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    if args.transport == "ipc":
+        publish = ipc_publisher(GreengrassCoreIPCClientV2(), args.topic)
+    else:
+        publish = mqtt_publisher(args.mqtt_host, args.mqtt_port, args.topic)
+
+    query_api = None
+    # Without a token every probe query fails, which would look like nothing was delivered
+    if args.influxdb_token:
+        import influxdb_client
+
+        query_api = influxdb_client.InfluxDBClient(
+            url=args.influxdb_url or DEFAULT_INFLUXDB_URL, token=args.influxdb_token, org=args.influxdb_org, verify_ssl=False
+        ).query_api()
+
+    steps = run(publish, args, query_api)
+    report(steps)
+    saturated_at = saturation_point(steps, args.max_p95_ms)
+    if saturated_at is not None:
+        print(f"saturation point: {saturated_at} batches/s")
+    else:
+        print("no saturation reached, increase --rates")
@@ -0,0 +1,57 @@
+import argparse
+
+import loadgen
+import pytest
+
+
+def make_args(**kwargs):
+    defaults = dict(batch_size=3, components=2, flapping_components=1, flap_period=10, rates="10,20",
+                    step_seconds=0.1, influxdb_bucket="b", influxdb_org="o", poll_interval=0.01,
+                    drain_seconds=0, max_p95_ms=1000)
+    defaults.update(kwargs)
+    return argparse.Namespace(**defaults)
+
+
+class TestMakeBatch:
+    def test_batch_contents(self):
+        batch = loadgen.make_batch(7, 1000, 4, 2, 1)
+        assert [p["N"] for p in batch[:4]] == ["CpuUsage", "SystemMemUsage", "TotalNumberOfFDs", "SyntheticMetric3"]
+        assert len([p for p in batch if p["NS"] == "ComponentCpuUsage"]) == 2
+        assert batch[-1] == {"NS": "LoadGenerator", "N": "Probe", "U": "Count", "A": "Count", "V": 7, "TS": 1000}
+
+    def test_flapping_states_alternate(self):
+        states = [loadgen.make_batch(0, ts, 0, 0, 1, flap_period=10)[0]["V"] for ts in (0, 10_000, 20_000)]
+        assert states == ["RUNNING", "BROKEN", "RUNNING"]
+
+
+class TestProbeTracker:
+    def test_latency_is_recorded_once(self):
+        tracker = loadgen.ProbeTracker()
+        tracker.emit(1, 10.0)
+        tracker.observe(1, 10.5)
+        tracker.observe(1, 11.0)
+        tracker.observe(2, 11.0)
+        assert tracker.delivered(range(0, 3)) == [500.0]
+
+
+class TestRun:
+    def test_publishes_every_step_without_influxdb(self):
+        published = []
+        steps = loadgen.run(published.append, make_args())
+        assert [s["sent"] for s in steps] == [1, 2]
+        assert len(published) == 3
+        assert "delivered" not in steps[0]
+
+    def test_stops_at_saturation(self):
+        def failing_publish(_):
+            raise ConnectionError()
+
+        steps = loadgen.run(failing_publish, make_args())
+        assert len(steps) == 1
+        assert loadgen.saturation_point(steps, 1000) == 10.0
+
+    def test_summarize_step(self):
+        step = loadgen.summarize_step({"sent": 4, "target_rate": 1, "achieved_rate": 1, "failures": 0}, [1, 2, 3], True)
+        assert step["delivered_ratio"] == pytest.approx(0.75)
+        assert step["latency_ms_p50"] == 2
+        assert loadgen.is_saturated(step, 1000)
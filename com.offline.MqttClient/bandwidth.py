@@ -0,0 +1,160 @@
+import json
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Union
+
+import metrics
+from router import HIGH, PRIORITIES, Route
+
+DEFAULT_INTERVAL = 60
+# Weight of the latest interval in the average demand of a route
+DEMAND_WEIGHT = 0.5
+# The link is considered saturated when less than this fraction of what was sent in an interval was acknowledged
+SATURATED = 0.9
+# Growth of the usable budget per interval while the link keeps up, and the least it shrinks to
+RECOVERY = 1.25
+MIN_FRACTION = 0.05
+
+usable_budget = metrics.REGISTRY.gauge(
+    "relay_bandwidth_budget_bytes", "Bytes per interval the relay currently allows itself to send"
+)
+acked_bytes = metrics.REGISTRY.gauge(
+    "relay_bandwidth_acked_bytes", "Bytes the remote broker acknowledged in the last interval"
+)
+
+
+def fair_shares(capacity: float, demands: List[float], weights: List[float]) -> List[float]:
+    """
+    Split the capacity by weighted max-min fairness: no share exceeds its demand, and what a small demand
+    leaves unused goes to the others in proportion to their weights.
+    """
+    shares = [0.0] * len(demands)
+    active = [i for i, d in enumerate(demands) if d > 0]
+    while active and capacity > 1e-9:
+        total_weight = sum(weights[i] for i in active)
+        satisfied = [i for i in active if demands[i] - shares[i] <= capacity * weights[i] / total_weight]
+        if not satisfied:
+            for i in active:
+                shares[i] += capacity * weights[i] / total_weight
+            return shares
+        for i in satisfied:
+            capacity -= demands[i] - shares[i]
+            shares[i] = demands[i]
+        active = [i for i in active if i not in satisfied]
+    return shares
+
+
+class _RouteBudget:
+    """What one route sent and may send: a token bucket refilled at its share of the budget."""
+
+    __slots__ = ("route", "offered", "demand", "share", "tokens", "updated")
+
+    def __init__(self, route: Route, share: float, now: float):
+        self.route = route
+        # Bytes offered in the current interval, and their average over past intervals
+        self.offered = 0
+        self.demand: Optional[float] = None
+        self.share = share
+        self.tokens = share
+        self.updated = now
+
+
+class Governor:
+    """
+    Keeps what the relay sends within a budget of bytes per interval. High priority routes always pass; the
+    rest of the budget goes to normal routes before low ones, and is split between the routes of a priority by
+    their weights. A route offering more than its share is downsampled: its messages pass while it has tokens
+    left, so the ones that do are spread evenly over the interval. The usable budget shrinks to the throughput
+    the remote broker actually acknowledges once the link cannot keep up, and grows back while it does.
+    """
+
+    def __init__(self, budget: int, interval: float = DEFAULT_INTERVAL):
+        if budget <= 0 or interval <= 0:
+            raise ValueError("the bandwidth budget and interval must be positive")
+        self.budget = budget
+        self.interval = interval
+        self.usable = float(budget)
+        self._budgets: Dict[int, _RouteBudget] = {}
+        self._sent = 0
+        self._acked = 0
+        self._lock = threading.Lock()
+        usable_budget.set_function(lambda: self.usable)
+
+    @classmethod
+    def from_config(cls, config: Union[str, Dict, None]) -> Optional["Governor"]:
+        """
+        A governor for the Bandwidth configuration, {"BytesPerInterval": budget, "IntervalSeconds": seconds},
+        or None when there is no budget.
+        """
+        if isinstance(config, str):
+            config = json.loads(config) if config.strip() else {}
+        config = config or {}
+        budget = int(config.get("BytesPerInterval", 0))
+        if budget <= 0:
+            return None
+        return cls(budget, float(config.get("IntervalSeconds", DEFAULT_INTERVAL)))
+
+    def _budget(self, route: Route, now: float) -> _RouteBudget:
+        bucket = self._budgets.get(id(route))
+        if bucket is None:
+            # Until demand is measured, a new route gets an equal weighted part of the usable budget
+            bucket = _RouteBudget(route, self.usable * route.weight / (route.weight + len(self._budgets)), now)
+            self._budgets[id(route)] = bucket
+        return bucket
+
+    def admit(self, route: Route, size: int, now: Optional[float] = None) -> bool:
+        """Whether to relay a message of `size` bytes on a route now."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._budget(route, now)
+            bucket.offered += size
+            if route.priority != HIGH:
+                bucket.tokens = min(bucket.tokens + bucket.share * (now - bucket.updated) / self.interval, bucket.share)
+                bucket.updated = now
+                # A message larger than what is left still passes, and the route goes into debt for it
+                if bucket.tokens <= 0:
+                    return False
+                bucket.tokens -= size
+            self._sent += size
+            return True
+
+    def acked(self, size: int):
+        """Count bytes the remote broker acknowledged."""
+        with self._lock:
+            self._acked += size
+
+    def adjust(self):
+        """Once per interval: update the usable budget from the measured throughput, and the shares from demand."""
+        with self._lock:
+            sent, acked, self._sent, self._acked = self._sent, self._acked, 0, 0
+            acked_bytes.set(acked)
+            if sent > 0 and acked < sent * SATURATED:
+                self.usable = max(float(acked), self.budget * MIN_FRACTION)
+                logging.info(f"uplink saturated: {acked} of {sent} bytes acknowledged, budget now {self.usable:.0f}")
+            else:
+                self.usable = min(self.usable * RECOVERY, float(self.budget))
+
+            buckets = list(self._budgets.values())
+            for bucket in buckets:
+                if bucket.demand is None:
+                    bucket.demand = float(bucket.offered)
+                else:
+                    bucket.demand += DEMAND_WEIGHT * (bucket.offered - bucket.demand)
+                bucket.offered = 0
+            remaining = self.usable - sum(bucket.demand for bucket in buckets if bucket.route.priority == HIGH)
+            for priority in PRIORITIES[1:]:
+                level = [bucket for bucket in buckets if bucket.route.priority == priority]
+                shares = fair_shares(
+                    max(remaining, 0), [bucket.demand for bucket in level], [bucket.route.weight for bucket in level]
+                )
+                for bucket, share in zip(level, shares):
+                    # A route that was idle keeps a small share, so it is not starved when it starts again
+                    bucket.share = max(share, self.usable * MIN_FRACTION / len(buckets))
+                    remaining -= share
+            # Budget no demand called for is headroom, so a route whose rate rises is not cut until the next interval
+            shared = [bucket for bucket in buckets if bucket.route.priority != HIGH]
+            if remaining > 0 and shared:
+                total_weight = sum(bucket.route.weight for bucket in shared)
+                for bucket in shared:
+                    bucket.share += remaining * bucket.route.weight / total_weight
@@ -1,40 +1,70 @@
-import time
 import logging
 import json
 from argparse import ArgumentParser
-from typing import Tuple, Union, Dict
+from typing import Dict, Optional, Tuple, Union
 
 import awscrt.mqtt
 from awscrt.mqtt import QoS
-from awsiot import mqtt_connection_builder
 from awsiot.greengrasscoreipc.clientv2 import GreengrassCoreIPCClientV2
-from awsiot.greengrasscoreipc.model import SubscriptionResponseMessage
+from awsiot.greengrasscoreipc.model import (
+    BinaryMessage,
+    PublishMessage,
+    SubscriptionResponseMessage,
+)
+
+import bandwidth
+import connection
+import dedup
+import discovery
+import lanes
+import lifecycle
+import logutil
+import metrics
+import profiler
+import router
 
 
 logging.basicConfig(level=logging.INFO)
 
+component_name = "com.offline.MqttClient"
+
+# Logs once per relayed message, so it is rate limited rather than written at the message rate
+event_log = logutil.rate_limited("client.events", per_second=1, burst=5)
+
+in_flight = metrics.REGISTRY.gauge("relay_in_flight", "Messages waiting for the remote broker to acknowledge")
+
 
 def parse_args():
     parser = ArgumentParser(description="Send the output from a command over MQTT")
     parser.add_argument(
         "--topics",
         required=True,
-        help="A map of topics to relay in the form local:remote",
+        help='The topics to relay, as [{"From": local pattern, "To": remote template}]',
     )
     parser.add_argument(
-        "--hostname_path",
+        "--discovery_cache_path",
         required=True,
-        help="The path to a file containing the hostname of the broker",
+        help="The path to the broker's cached endpoints and CA, as written by discover.py",
     )
+    parser.add_argument("--broker_thing_name", required=True, help="The IoT thing name of the broker device")
+    parser.add_argument("--region", required=True, help="The AWS region of the broker device")
     parser.add_argument(
-        "--port_path",
-        required=True,
-        help="The path to a file containing the port of the broker",
+        "--discovery_ttl",
+        type=float,
+        default=discovery.DEFAULT_TTL,
+        help="Seconds before the broker's connectivity is discovered again in the background, 0 to never",
     )
     parser.add_argument(
-        "--broker_cert_path",
-        required=True,
-        help="The path to the broker's CA certificate",
+        "--discovery_grace",
+        type=float,
+        default=discovery.DEFAULT_GRACE,
+        help="Seconds past the TTL to keep using cached connectivity quietly while the cloud is unreachable",
+    )
+    parser.add_argument(
+        "--force_rediscovery",
+        type=lambda v: v.lower() == "true",
+        default=False,
+        help="Whether to refresh the cached connectivity as soon as the relay starts",
     )
     parser.add_argument(
         "--cert_path",
@@ -46,72 +76,81 @@ def parse_args():
         required=True,
         help="Path to the X.509 certificate's private key",
     )
+    parser.add_argument("--ca_path", help="The path to the root CA file of the discovery endpoint")
     parser.add_argument(
         "--thing_name",
         required=True,
         help="The AWS IoT thing name for use as client ID for MQTT",
     )
+    parser.add_argument(
+        "--reconnect_min",
+        type=float,
+        default=connection.MIN_RECONNECT_DELAY,
+        help="Seconds before the first attempt to reconnect to the same endpoint",
+    )
+    parser.add_argument(
+        "--reconnect_max",
+        type=float,
+        default=connection.MAX_RETRY_DELAY,
+        help="Most seconds between attempts to reconnect, to the same endpoint or any of them",
+    )
+    parser.add_argument(
+        "--failover_after",
+        type=float,
+        default=connection.DEFAULT_FAILOVER_AFTER,
+        help="Seconds to try reconnecting to the same endpoint before moving to another one, 0 to move at once",
+    )
+    parser.add_argument(
+        "--lanes",
+        default="{}",
+        help='The priority lanes, as {"Scheduler": "strict" or "weighted", "Classes": {priority: settings}}',
+    )
+    parser.add_argument(
+        "--bandwidth",
+        default="{}",
+        help='The uplink budget, as {"BytesPerInterval": bytes, "IntervalSeconds": seconds}; none by default',
+    )
+    parser.add_argument(
+        "--idempotency_keys",
+        type=lambda v: v.lower() == "true",
+        default=False,
+        help="Whether to prefix every relayed message with its source and sequence number, for consumers to dedup",
+    )
+    parser.add_argument("--metrics_port", type=int, default=0, help="Serve Prometheus metrics on this port")
+    parser.add_argument(
+        "--self_telemetry_interval",
+        type=float,
+        default=0,
+        help="Seconds between publishing this component's metrics as telemetry, 0 to disable",
+    )
+    parser.add_argument(
+        "--self_telemetry_topic",
+        default="injected/greengrass/telemetry",
+        help="The local topic to publish this component's metrics on",
+    )
+    parser.add_argument("--log_format", choices=["text", "json"], default="text")
     return parser.parse_args()
 
 
-def remote_connection(
-    endpoint: str,
-    port: int,
-    cert_path: str,
-    key_path: str,
-    ca_path: str,
-    client_id: str,
-) -> Union[awscrt.mqtt.Connection, None]:
-    def on_conn_success(**_):
-        logging.info(f"connected to {hostname}:{port} as {client_id}")
-
-    def on_conn_failure(**_):
-        logging.error(f"error: failed to connect to {hostname}:{port} as {client_id}")
-
-    def on_conn_close(**_):
-        logging.error(f"closed connection to {hostname}:{port} as {client_id}")
-
-    remote_client = mqtt_connection_builder.mtls_from_path(
-        endpoint=endpoint,
-        port=port,
-        cert_filepath=cert_path,
-        pri_key_filepath=key_path,
-        ca_filepath=ca_path,
-        client_id=client_id,
-        clean_session=False,
-        on_connection_success=on_conn_success,
-        on_connection_failure=on_conn_failure,
-        on_connection_closed=on_conn_close,
-        keep_alive_secs=30,
-    )
-
-    # this will raise an error if connection fails
-    try:
-        remote_client.connect().result()
-    except:
-        return None
-    return remote_client
-
-
-def remote_connection_with_retry(
-    endpoint: str,
-    port: int,
+def failover_connection(
+    cache: discovery.DiscoveryCache,
     cert_path: str,
     key_path: str,
-    ca_path: str,
     client_id: str,
-    retries: int = 10,
-) -> awscrt.mqtt.Connection:
-    for pwr in range(retries):
-        conn = remote_connection(
-            endpoint, port, cert_path, key_path, ca_path, client_id
-        )
-        if not conn:
-            time.sleep(2**pwr)
-            logging.info(f"could not connect: retrying in {2**pwr}s")
-            continue
-        return conn
-    raise ConnectionError(f"could not connect to broker at {endpoint}:{port}")
+    reconnect_min: float = connection.MIN_RECONNECT_DELAY,
+    reconnect_max: float = connection.MAX_RETRY_DELAY,
+    failover_after: float = connection.DEFAULT_FAILOVER_AFTER,
+) -> connection.FailoverConnection:
+    manager = connection.ConnectionManager(
+        cert_path, key_path, lambda: cache.current.ca, client_id, reconnect_min, reconnect_max
+    )
+    return connection.FailoverConnection(
+        cache.current.endpoints,
+        manager.connect,
+        manager.probe,
+        failover_after=failover_after,
+        max_retry_delay=reconnect_max,
+    )
 
 
 def safe_get_message_and_topic(
@@ -128,64 +167,167 @@ def safe_get_message_and_topic(
     raise ValueError(f"message must have both a message and topic field: {e}")
 
 
+def relay_metrics(topic: str) -> Dict:
+    return {
+        "in": metrics.REGISTRY.counter("relay_messages_in_total", "Local messages received", topic=topic),
+        "out": metrics.REGISTRY.counter("relay_messages_out_total", "Messages relayed", topic=topic),
+        "bytes_out": metrics.REGISTRY.counter("relay_bytes_out_total", "Payload bytes relayed", topic=topic),
+        "errors": metrics.REGISTRY.counter("relay_errors_total", "Messages that failed to relay", topic=topic),
+        "sampled": metrics.REGISTRY.counter(
+            "relay_sampled_total", "Messages not relayed to stay within the bandwidth budget", topic=topic
+        ),
+        "publish_seconds": metrics.REGISTRY.histogram(
+            "relay_publish_seconds", "Time until the remote broker acknowledged", topic=topic
+        ),
+    }
+
+
 def relay_messages(
     local_client: GreengrassCoreIPCClientV2,
-    remote_client: awscrt.mqtt.Connection,
-    topic_map: Dict[str, str],
+    remote_client: Union[awscrt.mqtt.Connection, connection.FailoverConnection],
+    topic_router: router.Router,
+    governor: Optional[bandwidth.Governor] = None,
+    relay_lanes: Optional[lanes.Lanes] = None,
+    stamper: Optional[dedup.Stamper] = None,
 ):
-    def on_event(event: SubscriptionResponseMessage, local_topic: str):
+    """
+    Subscribe to every local topic to relay. Messages are published from one lane per priority, through
+    `relay_lanes` or default lanes started here, so the IPC callbacks never wait on the remote broker.
+    With a stamper, every message relayed carries an idempotency key for consumers to drop redeliveries by.
+    """
+    if relay_lanes is None:
+        relay_lanes = lanes.Lanes(lambda topic, payload: remote_client.publish(topic, payload, QoS.AT_LEAST_ONCE)[0])
+        relay_lanes.start()
+    in_flight.set_function(relay_lanes.in_flight)
+    subscriptions = topic_router.plan()
+    # Looked up once per pattern, so relaying a message never touches the registry lock
+    topic_metrics = {p: relay_metrics(p) for p in dict.fromkeys(subscriptions + [r.pattern for r in topic_router.routes])}
+
+    def on_event(event: SubscriptionResponseMessage, subscription: str):
+        topic_metrics[subscription]["in"].inc()
         try:
             message, local_topic = safe_get_message_and_topic(event)
-            remote_topic = topic_map[local_topic]
-
-            logging.debug(f"start relay {local_topic} -> {remote_topic} : {message}")
-            resp, _ = remote_client.publish(remote_topic, message, QoS.AT_LEAST_ONCE)
-            resp.result()
-            logging.info(f"relay {local_topic} -> {remote_topic}")
         except Exception as e:
-            logging.error(f"failed relay from {local_topic}")
-            logging.debug(e)
+            topic_metrics[subscription]["errors"].inc()
+            event_log.error("failed relay from %s", subscription)
+            event_log.debug("%s", e)
+            return
+        for route, remote_topic in topic_router.remote_topics(local_topic, subscription):
+            m = topic_metrics[route.pattern]
+            if governor is not None and not governor.admit(route, len(message)):
+                m["sampled"].inc()
+                continue
+            event_log.debug("start relay %s -> %s : %r", local_topic, remote_topic, message)
+            payload = message if stamper is None else stamper.stamp(message)
+            relay_lanes.submit(route.priority, remote_topic, payload, relayed(m, local_topic, remote_topic, len(payload)))
+
+    def relayed(m: Dict, local_topic: str, remote_topic: str, size: int) -> lanes.Done:
+        def done(error: Optional[BaseException], seconds: float):
+            if error is not None:
+                m["errors"].inc()
+                event_log.error("failed relay from %s", local_topic)
+                event_log.debug("%s", error)
+                return
+            m["publish_seconds"].observe(seconds)
+            if governor is not None:
+                governor.acked(size)
+            m["out"].inc()
+            m["bytes_out"].inc(size)
+            event_log.info("relay %s -> %s", local_topic, remote_topic)
+
+        return done
 
     def on_error(topic: str) -> bool:
         logging.error(f"error connecting to IPC client on topic {topic}")
         return False
 
-    for t in topic_map.keys():
-        logging.debug(f"to be relayed: {t}")
-        local_client.subscribe_to_topic(
-            topic=t,
-            on_stream_event=lambda e: on_event(e, t),
-            on_stream_error=lambda _: on_error(t),
+    operations = []
+    for s in subscriptions:
+        logging.debug(f"to be relayed: {s}")
+        # Bound as default arguments, so every callback keeps its own subscription
+        _, operation = local_client.subscribe_to_topic(
+            topic=s,
+            on_stream_event=lambda e, s=s: on_event(e, s),
+            on_stream_error=lambda _, s=s: on_error(s),
         )
+        operations.append(operation)
+    return operations
+
+
+def self_telemetry_publisher(local_client: GreengrassCoreIPCClientV2, topic: str):
+    def publish(points):
+        msg = PublishMessage(binary_message=BinaryMessage(message=json.dumps(points)))
+        local_client.publish_to_topic(topic=topic, publish_message=msg)
+
+    return publish
 
 
 if __name__ == "__main__":
     args = parse_args()
+    logutil.configure(json_format=args.log_format == "json")
     all_topics = json.loads(args.topics)
 
-    with open(args.hostname_path) as f:
-        hostname = f.read().strip()
-    with open(args.port_path) as f:
-        port = int(f.read().strip())
+    cache = discovery.DiscoveryCache(
+        args.discovery_cache_path,
+        discovery.cloud_discovery(
+            args.thing_name, args.broker_thing_name, args.cert_path, args.key_path, args.region, args.ca_path
+        ),
+        args.discovery_ttl,
+        args.discovery_grace,
+    )
+    cache.load()
 
-    topic_map = {x["From"]: x["To"] for x in all_topics}
+    topic_router = router.Router.from_topics(all_topics, args.thing_name)
     local_client = GreengrassCoreIPCClientV2()
+    runner = lifecycle.Lifecycle()
+    runner.on_shutdown(logutil.flush)
+    runner.on_shutdown(local_client.close)
     logging.info("attempting to connect to remote MQTT broker")
-    remote_client = remote_connection_with_retry(
-        hostname,
-        port,
+    remote_client = failover_connection(
+        cache,
         args.cert_path,
         args.key_path,
-        args.broker_cert_path,
         args.thing_name,
-    )
+        args.reconnect_min,
+        args.reconnect_max,
+        args.failover_after,
+    ).connect()
+    runner.on_shutdown(lambda: remote_client.disconnect().result(), "disconnect")
+    if args.discovery_ttl > 0:
+        cache.schedule(
+            runner.call_later,
+            lambda d: remote_client.update_endpoints(d.endpoints),
+            refresh_now=args.force_rediscovery,
+        )
+
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+    if args.self_telemetry_interval > 0:
+        reporter = metrics.TelemetryReporter(
+            self_telemetry_publisher(local_client, args.self_telemetry_topic),
+            component_name,
+            args.thing_name,
+            args.self_telemetry_interval,
+        ).start()
+        runner.on_shutdown(reporter.report)
+
+    profiler.ProfilerControl(component_name).listen_v2(local_client)
 
-    logging.debug(f"topic map: {topic_map}")
+    governor = bandwidth.Governor.from_config(args.bandwidth)
+    if governor is not None:
+        runner.every(governor.interval, governor.adjust)
+
+    relay_lanes = lanes.Lanes.from_config(
+        lambda topic, payload: remote_client.publish(topic, payload, QoS.AT_LEAST_ONCE)[0], args.lanes
+    ).start()
+    runner.on_shutdown(lambda: relay_lanes.stop(connection.DEFAULT_TIMEOUT), "lanes")
+
+    logging.debug(f"topics: {all_topics}")
     try:
-        relay_messages(local_client, remote_client, topic_map)
-        while True:
-            time.sleep(1)
+        stamper = dedup.Stamper(args.thing_name) if args.idempotency_keys else None
+        for operation in relay_messages(local_client, remote_client, topic_router, governor, relay_lanes, stamper):
+            runner.on_shutdown(operation.close)
     except Exception as e:
         logging.error(e)
-
-    remote_client.disconnect().result()
+        runner.shutdown()
+    runner.run()
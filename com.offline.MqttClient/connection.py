@@ -0,0 +1,421 @@
+import concurrent.futures
+import logging
+import os
+import queue
+import random
+import socket
+import ssl
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import awscrt.io
+import awscrt.mqtt
+
+import metrics
+from endpoints import Endpoint
+
+# Seconds between starting the connection attempts of a race, as in happy eyeballs (RFC 8305)
+DEFAULT_STAGGER = 0.25
+DEFAULT_TIMEOUT = 10
+# Most seconds between rounds of attempts once every endpoint has failed, and between the CRT's own reconnects
+MAX_RETRY_DELAY = 60
+MIN_RECONNECT_DELAY = 1
+# Seconds the CRT may spend reconnecting to the same endpoint before the relay moves to another one
+DEFAULT_FAILOVER_AFTER = 15
+KEEP_ALIVE = 30
+# Weight of a new latency measurement in an endpoint's average
+LATENCY_WEIGHT = 0.3
+
+failovers = metrics.REGISTRY.counter("relay_failovers_total", "Times the relay moved to another broker endpoint")
+connect_seconds = metrics.REGISTRY.histogram("relay_connect_seconds", "Time to connect to the remote broker")
+interruptions = metrics.REGISTRY.counter("relay_interruptions_total", "Times the remote connection was interrupted")
+reconnect_seconds = metrics.REGISTRY.histogram(
+    "relay_reconnect_seconds", "Time from an interruption until the relay was connected again"
+)
+uptime = metrics.REGISTRY.gauge("relay_connection_uptime_seconds", "Time since the remote connection was last established")
+
+
+def tls_context(ca: str, cert_path: str, key_path: str) -> ssl.SSLContext:
+    """A context for probing the broker with the client's own certificate, trusting only the broker's CA bundle."""
+    context = ssl.create_default_context(cadata=ca)
+    # Discovery may return addresses the broker's certificate does not name; the MQTT connection checks them
+    context.check_hostname = False
+    context.load_cert_chain(cert_path, key_path)
+    return context
+
+
+def probe(endpoint: Endpoint, context: ssl.SSLContext, timeout: float = DEFAULT_TIMEOUT) -> float:
+    """The time to open a TCP connection to an endpoint and complete a TLS handshake, in seconds."""
+    started = time.monotonic()
+    with socket.create_connection((endpoint.host, endpoint.port), timeout=timeout) as sock:
+        with context.wrap_socket(sock, server_hostname=endpoint.host):
+            return time.monotonic() - started
+
+
+class LatencyTable:
+    """The measured latency of every endpoint, averaged over measurements. Failed endpoints rank last."""
+
+    def __init__(self):
+        self.latencies: Dict[Endpoint, float] = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: Endpoint, latency: float):
+        with self._lock:
+            previous = self.latencies.get(endpoint)
+            if previous is None or previous == float("inf"):
+                self.latencies[endpoint] = latency
+            else:
+                self.latencies[endpoint] = previous + LATENCY_WEIGHT * (latency - previous)
+
+    def failed(self, endpoint: Endpoint):
+        with self._lock:
+            self.latencies[endpoint] = float("inf")
+
+    def ranked(self, endpoints: List[Endpoint]) -> List[Endpoint]:
+        """Endpoints by measured latency, then unmeasured ones and then failed ones, each in their given order."""
+        with self._lock:
+            order = {e: i for i, e in enumerate(endpoints)}
+
+            def key(e: Endpoint):
+                latency = self.latencies.get(e)
+                if latency is None:
+                    return (1, 0.0, order[e])
+                if latency == float("inf"):
+                    return (2, 0.0, order[e])
+                return (0, latency, order[e])
+
+            return sorted(endpoints, key=key)
+
+
+def race(
+    endpoints: List[Endpoint],
+    attempt: Callable[[Endpoint], float],
+    latencies: LatencyTable,
+    stagger: float = DEFAULT_STAGGER,
+    timeout: float = DEFAULT_TIMEOUT,
+) -> Optional[Endpoint]:
+    """
+    Start an attempt on each endpoint in turn, the next one after `stagger` seconds or as soon as the previous
+    one fails, and return the first endpoint to succeed, or None if all fail within the timeout. Attempts still
+    running keep recording their latency, so later failovers can rank them.
+    """
+    results: "queue.Queue[Tuple[Endpoint, Optional[float]]]" = queue.Queue()
+
+    def run(endpoint: Endpoint):
+        try:
+            latency = attempt(endpoint)
+        except Exception as e:
+            logging.info(f"could not reach {endpoint}: {e}")
+            latencies.failed(endpoint)
+            results.put((endpoint, None))
+            return
+        latencies.record(endpoint, latency)
+        results.put((endpoint, latency))
+
+    deadline = time.monotonic() + timeout
+    started = 0
+    finished = 0
+    next_start = time.monotonic()
+    while finished < len(endpoints):
+        now = time.monotonic()
+        if started < len(endpoints) and now >= next_start:
+            threading.Thread(target=run, args=(endpoints[started],), name="relay-race", daemon=True).start()
+            started += 1
+            next_start = now + stagger
+        wait = deadline - now
+        if started < len(endpoints):
+            wait = min(wait, next_start - now)
+        if deadline <= now:
+            return None
+        try:
+            endpoint, latency = results.get(timeout=max(wait, 0))
+        except queue.Empty:
+            continue
+        finished += 1
+        if latency is not None:
+            return endpoint
+        # A failed attempt starts the next one straight away
+        next_start = time.monotonic()
+    return None
+
+
+class ConnectionManager:
+    """
+    Builds connections to the remote broker from credentials loaded once: the certificate and key are read,
+    and the TLS contexts built, again only when their files change or discovery returns another CA bundle.
+    Every connection reconnects on its own through the CRT, with a backoff between `reconnect_min` and
+    `reconnect_max` seconds.
+    """
+
+    def __init__(
+        self,
+        cert_path: str,
+        key_path: str,
+        ca: Callable[[], str],
+        client_id: str,
+        reconnect_min: float = MIN_RECONNECT_DELAY,
+        reconnect_max: float = MAX_RETRY_DELAY,
+        keep_alive: int = KEEP_ALIVE,
+    ):
+        self.cert_path = cert_path
+        self.key_path = key_path
+        self.ca = ca
+        self.client_id = client_id
+        self.reconnect_min = reconnect_min
+        self.reconnect_max = reconnect_max
+        self.keep_alive = keep_alive
+        self._lock = threading.Lock()
+        self._version: Optional[Tuple] = None
+        self._client: Optional[awscrt.mqtt.Client] = None
+        self._probe_context: Optional[ssl.SSLContext] = None
+
+    def _reload(self):
+        """Rebuild the TLS contexts if the credentials or the CA changed since they were built."""
+        ca = self.ca()
+        version = (os.stat(self.cert_path).st_mtime_ns, os.stat(self.key_path).st_mtime_ns, ca)
+        with self._lock:
+            if version == self._version:
+                return
+            with open(self.cert_path, "rb") as f:
+                cert = f.read()
+            with open(self.key_path, "rb") as f:
+                key = f.read()
+            options = awscrt.io.TlsContextOptions.create_client_with_mtls(cert, key)
+            options.override_default_trust_store(ca.encode())
+            self._client = awscrt.mqtt.Client(
+                awscrt.io.ClientBootstrap.get_or_create_static_default(), awscrt.io.ClientTlsContext(options)
+            )
+            self._probe_context = tls_context(ca, self.cert_path, self.key_path)
+            if self._version is not None:
+                logging.info("reloaded the relay's credentials")
+            self._version = version
+
+    def probe(self, endpoint: Endpoint) -> float:
+        self._reload()
+        return probe(endpoint, self._probe_context)
+
+    def connect(self, endpoint: Endpoint, failover: "FailoverConnection") -> awscrt.mqtt.Connection:
+        """A connection to an endpoint whose interruptions and resumptions are reported to the failover."""
+        self._reload()
+
+        def on_conn_success(**_):
+            logging.info(f"connected to {endpoint} as {self.client_id}")
+
+        def on_conn_failure(**_):
+            logging.error(f"error: failed to connect to {endpoint} as {self.client_id}")
+
+        def on_conn_close(**_):
+            logging.error(f"closed connection to {endpoint} as {self.client_id}")
+
+        remote_client = awscrt.mqtt.Connection(
+            self._client,
+            endpoint.host,
+            endpoint.port,
+            self.client_id,
+            clean_session=False,
+            on_connection_interrupted=failover.on_interrupted,
+            on_connection_resumed=failover.on_resumed,
+            reconnect_min_timeout_secs=max(int(self.reconnect_min), 1),
+            reconnect_max_timeout_secs=max(int(self.reconnect_max), 1),
+            keep_alive_secs=self.keep_alive,
+            on_connection_success=on_conn_success,
+            on_connection_failure=on_conn_failure,
+            on_connection_closed=on_conn_close,
+        )
+        # this will raise an error if connection fails
+        remote_client.connect().result(failover.timeout)
+        return remote_client
+
+
+class FailoverConnection:
+    """
+    A connection to the remote broker that can use any of the endpoints discovery returned. It connects to
+    whichever endpoint answers a TLS handshake first. When the connection is interrupted the CRT reconnects
+    to the same endpoint, and only if that takes longer than `failover_after` does the relay move to the next
+    best endpoint by measured latency, without restarting the process.
+    """
+
+    def __init__(
+        self,
+        endpoints: List[Endpoint],
+        connect: Callable[[Endpoint, "FailoverConnection"], object],
+        attempt: Callable[[Endpoint], float],
+        stagger: float = DEFAULT_STAGGER,
+        timeout: float = DEFAULT_TIMEOUT,
+        failover_after: float = DEFAULT_FAILOVER_AFTER,
+        max_retry_delay: float = MAX_RETRY_DELAY,
+    ):
+        """
+        `connect` returns a connected awscrt.mqtt.Connection whose interruption calls on_interrupted, and
+        resumption on_resumed, or raises. `attempt` probes an endpoint, returning its latency, or raises.
+        """
+        self.endpoints = list(endpoints)
+        self.connect_endpoint = connect
+        self.attempt = attempt
+        self.stagger = stagger
+        self.timeout = timeout
+        self.failover_after = failover_after
+        self.max_retry_delay = max_retry_delay
+        self.latencies = LatencyTable()
+        self.endpoint: Optional[Endpoint] = None
+        self._connection = None
+        self._connected = threading.Condition()
+        self._closing = False
+        self._failing_over = False
+        self._connected_at: Optional[float] = None
+        self._interrupted_at: Optional[float] = None
+        self._failover_timer: Optional[threading.Timer] = None
+        uptime.set_function(self.uptime)
+
+    def uptime(self) -> float:
+        """Seconds the relay has been connected without interruption, 0 while it is not."""
+        connected_at = self._connected_at
+        if connected_at is None or self._interrupted_at is not None:
+            return 0
+        return time.monotonic() - connected_at
+
+    def _try_connect(self, avoid: Optional[Endpoint] = None) -> bool:
+        # The endpoint just failed over from is only tried again once every other endpoint has failed
+        others = [e for e in self.endpoints if e != avoid]
+        winner = race(self.latencies.ranked(others), self.attempt, self.latencies, self.stagger, self.timeout)
+        candidates = self.latencies.ranked(others)
+        if winner is not None:
+            candidates.remove(winner)
+            candidates.insert(0, winner)
+        if avoid is not None and avoid in self.endpoints:
+            candidates.append(avoid)
+        for endpoint in candidates:
+            if self._closing:
+                return False
+            started = time.monotonic()
+            try:
+                connection = self.connect_endpoint(endpoint, self)
+            except Exception as e:
+                logging.warning(f"could not connect to {endpoint}: {e}")
+                self.latencies.failed(endpoint)
+                continue
+            connect_seconds.observe(time.monotonic() - started)
+            with self._connected:
+                self._connection = connection
+                self.endpoint = endpoint
+                self._connected_at = time.monotonic()
+                if self._interrupted_at is not None:
+                    reconnect_seconds.observe(self._connected_at - self._interrupted_at)
+                    self._interrupted_at = None
+                self._connected.notify_all()
+            logging.info(f"relaying to {endpoint}")
+            return True
+        return False
+
+    def connect(self, avoid: Optional[Endpoint] = None) -> "FailoverConnection":
+        """
+        Connect to the best endpoint, retrying every endpoint until one accepts. Rounds are spaced by a capped
+        exponential backoff with full jitter, so relays that lost the same broker do not retry in lockstep.
+        """
+        delay = MIN_RECONNECT_DELAY
+        while not self._try_connect(avoid):
+            avoid = None
+            if self._closing:
+                break
+            wait = random.uniform(0, delay)
+            logging.info(f"could not connect to any endpoint: retrying in {wait:.1f}s")
+            time.sleep(wait)
+            delay = min(delay * 2, self.max_retry_delay)
+        return self
+
+    def update_endpoints(self, endpoints: List[Endpoint]):
+        """Use a new list of endpoints, moving off the current one if it is no longer listed."""
+        with self._connected:
+            self.endpoints = list(endpoints)
+            connection = self._connection
+            removed = self.endpoint is not None and self.endpoint not in self.endpoints
+        if removed and connection is not None:
+            logging.warning(f"{self.endpoint} is no longer a discovered endpoint")
+            self._start_failover(connection)
+
+    def on_interrupted(self, connection, error=None, **_):
+        """Give the CRT `failover_after` seconds to reconnect, then move to another endpoint."""
+        with self._connected:
+            if self._closing or connection is not self._connection or self._interrupted_at is not None:
+                return
+            self._interrupted_at = time.monotonic()
+            interruptions.inc()
+            if self.failover_after > 0:
+                self._failover_timer = threading.Timer(self.failover_after, self._start_failover, args=(connection,))
+                self._failover_timer.daemon = True
+                self._failover_timer.start()
+        logging.warning(f"connection to {self.endpoint} interrupted: {error}")
+        if self.failover_after <= 0:
+            self._start_failover(connection)
+
+    def on_resumed(self, connection, **_):
+        """The CRT reconnected to the same endpoint in time, so there is no failover."""
+        with self._connected:
+            if connection is not self._connection or self._interrupted_at is None:
+                return
+            reconnect_seconds.observe(time.monotonic() - self._interrupted_at)
+            self._interrupted_at = None
+            self._connected_at = time.monotonic()
+            if self._failover_timer is not None:
+                self._failover_timer.cancel()
+                self._failover_timer = None
+        logging.info(f"reconnected to {self.endpoint}")
+
+    def _start_failover(self, connection):
+        with self._connected:
+            if self._closing or connection is not self._connection or self._failing_over:
+                return
+            self._failing_over = True
+            self._connection = None
+            if self._interrupted_at is None:
+                self._interrupted_at = time.monotonic()
+            if self._failover_timer is not None:
+                self._failover_timer.cancel()
+                self._failover_timer = None
+        threading.Thread(
+            target=self._failover, args=(connection, self.endpoint), name="relay-failover", daemon=True
+        ).start()
+
+    def _failover(self, connection, endpoint: Optional[Endpoint]):
+        try:
+            # Stops the CRT's own reconnects to the endpoint that failed
+            connection.disconnect()
+        except Exception:
+            pass
+        if endpoint is not None:
+            self.latencies.failed(endpoint)
+        failovers.inc()
+        try:
+            self.connect(avoid=endpoint)
+        finally:
+            with self._connected:
+                self._failing_over = False
+
+    def current(self, timeout: Optional[float] = None):
+        """
+        The connection in use, waiting up to `timeout` for one while failing over. While the CRT reconnects
+        to the same endpoint this is still the interrupted connection, which queues what is published on it.
+        """
+        with self._connected:
+            if self._connection is None:
+                self._connected.wait_for(lambda: self._connection is not None or self._closing, timeout)
+            if self._connection is None:
+                raise ConnectionError("not connected to the remote broker")
+            return self._connection
+
+    def publish(self, topic: str, payload: bytes, qos):
+        return self.current(self.timeout).publish(topic, payload, qos)
+
+    def disconnect(self):
+        with self._connected:
+            self._closing = True
+            connection, self._connection = self._connection, None
+            if self._failover_timer is not None:
+                self._failover_timer.cancel()
+            self._connected.notify_all()
+        if connection is None:
+            done: concurrent.futures.Future = concurrent.futures.Future()
+            done.set_result(None)
+            return done
+        return connection.disconnect()
@@ -0,0 +1,126 @@
+import collections
+import itertools
+import threading
+import time
+from typing import Optional, Tuple
+
+import metrics
+
+# A stamped message starts with "#<source>:<sequence>\n". No JSON document starts with "#", so a consumer can tell
+# stamped messages from unstamped ones
+MARKER = b"#"
+SEPARATOR = b"\n"
+# Sequence numbers remembered per source, and sources remembered before the least recently seen is forgotten
+DEFAULT_WINDOW = 4096
+DEFAULT_MAX_SOURCES = 1024
+
+duplicates = metrics.REGISTRY.counter("dedup_duplicates_total", "Messages dropped as already seen")
+
+
+def _base36(n: int) -> str:
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    encoded = ""
+    while True:
+        n, r = divmod(n, 36)
+        encoded = digits[r] + encoded
+        if n == 0:
+            return encoded
+
+
+def stamp(source: str, sequence: int, payload: bytes) -> bytes:
+    return b"%s%s:%s%s%s" % (MARKER, source.encode(), _base36(sequence).encode(), SEPARATOR, payload)
+
+
+def parse(payload: bytes) -> Tuple[Optional[str], Optional[int], bytes]:
+    """The source, sequence number and original payload of a stamped message, or None, None and an unstamped one."""
+    if not payload.startswith(MARKER):
+        return None, None, payload
+    end = payload.find(SEPARATOR)
+    if end < 0:
+        return None, None, payload
+    source, colon, sequence = payload[1:end].rpartition(b":")
+    if not colon:
+        return None, None, payload
+    try:
+        return source.decode(), int(sequence, 36), payload[end + 1:]
+    except ValueError:
+        return None, None, payload
+
+
+class Stamper:
+    """
+    Stamps every message the relay sends with an idempotency key: its source and a sequence number. The source
+    includes when the process started, so sequence numbers never repeat under one source after a restart.
+    """
+
+    def __init__(self, thing_name: str, started: Optional[float] = None):
+        self.source = f"{thing_name}.{_base36(int(time.time() if started is None else started))}"
+        self._sequence = itertools.count()
+
+    def stamp(self, payload: bytes) -> bytes:
+        return stamp(self.source, next(self._sequence), payload)
+
+
+class SlidingWindow:
+    """
+    The sequence numbers seen from one source, as the highest one and a bitmap of the `size` before it, like
+    the anti-replay window of IPsec. Numbers older than the window are reported as seen, since they can no
+    longer be told apart from duplicates.
+    """
+
+    __slots__ = ("size", "top", "bitmap")
+
+    def __init__(self, size: int = DEFAULT_WINDOW):
+        self.size = size
+        self.top = -1
+        self.bitmap = 0
+
+    def seen(self, sequence: int) -> bool:
+        """Whether the sequence number was seen before, recording it if not."""
+        if sequence > self.top:
+            shift = sequence - self.top
+            self.bitmap = ((self.bitmap << shift) | 1) & ((1 << self.size) - 1) if shift < self.size else 1
+            self.top = sequence
+            return False
+        offset = self.top - sequence
+        if offset >= self.size:
+            return True
+        bit = 1 << offset
+        if self.bitmap & bit:
+            return True
+        self.bitmap |= bit
+        return False
+
+
+class Deduplicator:
+    """
+    Drops messages redelivered under QoS 1 by their idempotency key. Memory is bounded: a window of sequence
+    numbers per source, and the least recently seen sources are forgotten past `max_sources`.
+    """
+
+    def __init__(self, window: int = DEFAULT_WINDOW, max_sources: int = DEFAULT_MAX_SOURCES):
+        self.window = window
+        self.max_sources = max_sources
+        self._sources: "collections.OrderedDict[str, SlidingWindow]" = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def is_duplicate(self, source: str, sequence: int) -> bool:
+        with self._lock:
+            window = self._sources.get(source)
+            if window is None:
+                window = self._sources[source] = SlidingWindow(self.window)
+                if len(self._sources) > self.max_sources:
+                    self._sources.popitem(last=False)
+            else:
+                self._sources.move_to_end(source)
+            duplicate = window.seen(sequence)
+        if duplicate:
+            duplicates.inc()
+        return duplicate
+
+    def accept(self, payload: bytes) -> Optional[bytes]:
+        """The original payload of a message, or None if it is a duplicate. Unstamped messages always pass."""
+        source, sequence, body = parse(payload)
+        if source is not None and self.is_duplicate(source, sequence):
+            return None
+        return body
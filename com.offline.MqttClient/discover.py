@@ -1,7 +1,6 @@
-import os.path
 from argparse import ArgumentParser
-from awscrt import io
-from awsiot.greengrass_discovery import DiscoveryClient
+
+import discovery
 
 parser = ArgumentParser("Discover core device credentials")
 parser.add_argument(
@@ -25,72 +24,44 @@ parser.add_argument(
 )
 parser.add_argument("--ca_path", help="The path to the root CA file")
 parser.add_argument(
-    "--output_cert_path", required=True, help="The path to write the broker's CA to"
-)
-parser.add_argument(
-    "--output_ip_path", required=True, help="The path to write the broker's IP to"
+    "--output_cache_path",
+    required=True,
+    help="The path to cache the broker's endpoints and CA at, as JSON",
 )
 parser.add_argument(
-    "--output_port_path", required=True, help="The path to write the broker's port to"
+    "--ttl",
+    type=float,
+    default=discovery.DEFAULT_TTL,
+    help="Seconds before cached connectivity is refreshed",
 )
 parser.add_argument(
-    "--force_rediscovery",
-    type=bool,
-    required=True,
-    help="Whether discovery should happen if the files already exist",
+    "--grace",
+    type=float,
+    default=discovery.DEFAULT_GRACE,
+    help="Seconds past the TTL to keep using cached connectivity without discovering it first",
 )
 args = parser.parse_args()
 
 
-if not args.force_rediscovery:
-    if (
-        os.path.isfile(args.output_cert_path)
-        and os.path.isfile(args.output_ip_path)
-        and os.path.isfile(args.output_port_path)
-    ):
-        print("found existing connectivity information, exiting.")
-        exit(0)
-
-
-tls_options = io.TlsContextOptions.create_client_with_mtls_from_path(
-    args.thing_cert_path, args.thing_key_path
-)
-if args.ca_path is not None:
-    tls_options.override_default_trust_store_from_path(None, args.ca_path)
-tls_context = io.ClientTlsContext(tls_options)
-socket_options = io.SocketOptions()
-discovery_client = DiscoveryClient(
-    io.ClientBootstrap.get_or_create_static_default(),
-    socket_options,
-    tls_context,
-    args.region,
+# Only blocks on the cloud when there is no usable cache; the relay refreshes it in the background
+cache = discovery.DiscoveryCache(
+    args.output_cache_path,
+    discovery.cloud_discovery(
+        args.client_thing_name,
+        args.broker_thing_name,
+        args.thing_cert_path,
+        args.thing_key_path,
+        args.region,
+        args.ca_path,
+    ),
+    args.ttl,
+    args.grace,
 )
+try:
+    current = cache.load()
+except Exception as e:
+    raise SystemExit(f"error: {e}")
 
-discover_response = discovery_client.discover(args.client_thing_name).result()
-
-ip = None
-port = None
-ca = None
-for gg_group in discover_response.gg_groups:
-    if gg_group.gg_group_id.endswith(args.broker_thing_name):
-        c = gg_group.cores[0].connectivity[0]
-        ip = c.host_address
-        port = c.port
-        ca = gg_group.certificate_authorities[0]
-        break
-
-if ip is None or port is None or ca is None:
-    raise SystemExit(
-        f"error: could not retrieve connectivity info: {discover_response}"
-    )
-else:
-    with open(args.output_cert_path, "w") as f:
-        f.write(ca)
-    with open(args.output_ip_path, "w") as f:
-        f.write(ip)
-    with open(args.output_port_path, "w") as f:
-        f.write(str(port))
-
-    print(
-        f"wrote connectivity information to {args.output_cert_path}, {args.output_ip_path}, {args.output_port_path}"
-    )
+print(
+    f"using {len(current.endpoints)} endpoints discovered {current.age():.0f}s ago, cached at {args.output_cache_path}"
+)
@@ -0,0 +1,190 @@
+import concurrent.futures
+import json
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import endpoints
+import metrics
+from endpoints import Endpoint
+
+# Seconds before discovery is refreshed
+DEFAULT_TTL = 3600
+# Seconds past the TTL the cache is trusted while the cloud is unreachable
+DEFAULT_GRACE = 7 * 24 * 3600
+# Seconds to wait for the discovery API, so an unreachable cloud fails like any other refresh instead of hanging
+DEFAULT_TIMEOUT = 30
+# Seconds before retrying a failed refresh, doubled on each failure up to the TTL
+MIN_RETRY_DELAY = 30
+
+refreshes = metrics.REGISTRY.counter("discovery_refreshes_total", "Discovery calls that returned connectivity")
+refresh_failures = metrics.REGISTRY.counter("discovery_failures_total", "Discovery calls that failed")
+cache_age = metrics.REGISTRY.gauge("discovery_cache_age_seconds", "Age of the connectivity the relay is using")
+
+
+class Discovery(NamedTuple):
+    endpoints: List[Endpoint]
+    cas: List[str]
+    # Wall clock time of the discovery call, since the cache outlives the process
+    discovered_at: float
+
+    @property
+    def ca(self) -> str:
+        """Every CA of the broker's group, as one bundle."""
+        return "\n".join(self.cas)
+
+    def age(self, now: Optional[float] = None) -> float:
+        return max((time.time() if now is None else now) - self.discovered_at, 0)
+
+    def to_json(self) -> Dict:
+        return {
+            "Endpoints": endpoints.to_json(self.endpoints),
+            "CertificateAuthorities": self.cas,
+            "DiscoveredAt": self.discovered_at,
+        }
+
+    @classmethod
+    def from_json(cls, document: Dict) -> "Discovery":
+        return cls(
+            endpoints.from_json(document["Endpoints"]),
+            list(document["CertificateAuthorities"]),
+            float(document["DiscoveredAt"]),
+        )
+
+
+def read_cache(path: str) -> Optional[Discovery]:
+    """The cached discovery, or None if there is none or it cannot be read."""
+    try:
+        with open(path) as f:
+            return Discovery.from_json(json.load(f))
+    except FileNotFoundError:
+        return None
+    except (ValueError, KeyError, TypeError) as e:
+        logging.warning(f"ignoring unreadable discovery cache {path}: {e}")
+        return None
+
+
+def write_cache(path: str, discovery: Discovery):
+    endpoints.write_file(path, json.dumps(discovery.to_json()))
+
+
+def cloud_discovery(
+    client_thing_name: str,
+    broker_thing_name: str,
+    cert_path: str,
+    key_path: str,
+    region: str,
+    ca_path: Optional[str] = None,
+    timeout: float = DEFAULT_TIMEOUT,
+) -> Callable[[], Discovery]:
+    """A function calling the Greengrass discovery API for the broker's connectivity, within `timeout` seconds."""
+    from awscrt import io
+    from awsiot.greengrass_discovery import DiscoveryClient
+
+    def discover() -> Discovery:
+        tls_options = io.TlsContextOptions.create_client_with_mtls_from_path(cert_path, key_path)
+        if ca_path is not None:
+            tls_options.override_default_trust_store_from_path(None, ca_path)
+        discovery_client = DiscoveryClient(
+            io.ClientBootstrap.get_or_create_static_default(),
+            io.SocketOptions(),
+            io.ClientTlsContext(tls_options),
+            region,
+        )
+        try:
+            discover_response = discovery_client.discover(client_thing_name).result(timeout)
+        except concurrent.futures.TimeoutError:
+            raise TimeoutError(f"discovery did not answer in {timeout}s") from None
+        remote_endpoints, cas = endpoints.from_discovery(discover_response, broker_thing_name)
+        if not remote_endpoints or not cas:
+            raise ValueError(f"could not retrieve connectivity info: {discover_response}")
+        return Discovery(remote_endpoints, cas, time.time())
+
+    return discover
+
+
+class DiscoveryCache:
+    """
+    Connectivity from a cache file, refreshed in the background once it is older than the TTL. Refreshes that
+    fail keep the cached connectivity in use; past the grace period that is logged as an error, but still
+    preferred to having none.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        discover: Callable[[], Discovery],
+        ttl: float = DEFAULT_TTL,
+        grace: float = DEFAULT_GRACE,
+    ):
+        self.path = path
+        self.discover = discover
+        self.ttl = ttl
+        self.grace = grace
+        self.current: Optional[Discovery] = None
+        self._retry_delay = MIN_RETRY_DELAY
+        self._lock = threading.Lock()
+        cache_age.set_function(lambda: self.current.age() if self.current is not None else 0)
+
+    def expired(self) -> bool:
+        return self.current is None or self.current.age() > self.ttl + self.grace
+
+    def load(self) -> Discovery:
+        """
+        The cached connectivity, discovering it first only if there is none or the cache is past its grace
+        period. An expired cache is still used when discovery fails.
+        """
+        self.current = read_cache(self.path)
+        if self.expired():
+            try:
+                self.refresh()
+            except Exception as e:
+                if self.current is None:
+                    raise
+                logging.error(f"using discovery from {self.current.age():.0f}s ago, could not refresh it: {e}")
+        return self.current
+
+    def refresh(self) -> bool:
+        """Call discovery and cache the result. Returns whether the connectivity changed."""
+        with self._lock:
+            try:
+                discovery = self.discover()
+            except Exception:
+                refresh_failures.inc()
+                raise
+            refreshes.inc()
+            write_cache(self.path, discovery)
+            previous, self.current = self.current, discovery
+            self._retry_delay = MIN_RETRY_DELAY
+        return previous is None or (previous.endpoints, previous.cas) != (discovery.endpoints, discovery.cas)
+
+    def next_refresh(self) -> float:
+        """Seconds until the cache is older than the TTL."""
+        if self.current is None:
+            return 0
+        return max(self.ttl - self.current.age(), 0)
+
+    def schedule(
+        self,
+        call_later: Callable[[float, Callable[[], None]], None],
+        on_change: Callable[[Discovery], None],
+        refresh_now: bool = False,
+    ):
+        """Keep the cache fresh with `call_later`, calling `on_change` with connectivity that changed."""
+
+        def refresh():
+            try:
+                changed = self.refresh()
+            except Exception as e:
+                delay, self._retry_delay = self._retry_delay, min(self._retry_delay * 2, max(self.ttl, MIN_RETRY_DELAY))
+                level = logging.ERROR if self.expired() else logging.WARNING
+                logging.log(level, f"could not refresh discovery, retrying in {delay}s: {e}")
+                call_later(delay, refresh)
+                return
+            if changed:
+                logging.info(f"discovered {len(self.current.endpoints)} broker endpoints")
+                on_change(self.current)
+            call_later(self.next_refresh(), refresh)
+
+        call_later(0 if refresh_now else self.next_refresh(), refresh)
@@ -0,0 +1,49 @@
+import os
+from typing import Dict, List, NamedTuple, Tuple
+
+
+class Endpoint(NamedTuple):
+    host: str
+    port: int
+    # The thing ARN of the core device the endpoint belongs to
+    core: str = ""
+
+    def __str__(self) -> str:
+        return f"{self.host}:{self.port}"
+
+
+def from_discovery(discover_response, broker_thing_name: str) -> Tuple[List[Endpoint], List[str]]:
+    """
+    Every endpoint of every core in the broker's groups, in the order discovery returned them, and the
+    certificate authorities of those groups.
+    """
+    endpoints: List[Endpoint] = []
+    cas: List[str] = []
+    for gg_group in discover_response.gg_groups:
+        if not gg_group.gg_group_id.endswith(broker_thing_name):
+            continue
+        for core in gg_group.cores or []:
+            for c in core.connectivity or []:
+                endpoint = Endpoint(c.host_address, int(c.port), core.thing_arn or "")
+                if endpoint not in endpoints:
+                    endpoints.append(endpoint)
+        for ca in gg_group.certificate_authorities or []:
+            if ca not in cas:
+                cas.append(ca)
+    return endpoints, cas
+
+
+def to_json(endpoints: List[Endpoint]) -> List[Dict]:
+    return [e._asdict() for e in endpoints]
+
+
+def from_json(entries: List[Dict]) -> List[Endpoint]:
+    return [Endpoint(e["host"], int(e["port"]), e.get("core", "")) for e in entries]
+
+
+def write_file(path: str, content: str):
+    """Write a file atomically, so a reader never sees it half written."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
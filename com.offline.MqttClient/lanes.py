@@ -0,0 +1,182 @@
+import collections
+import json
+import logging
+import threading
+import time
+from typing import Callable, Deque, Dict, List, NamedTuple, Optional, Union
+
+import metrics
+from router import HIGH, LOW, NORMAL, PRIORITIES
+
+STRICT = "strict"
+WEIGHTED = "weighted"
+SCHEDULERS = (STRICT, WEIGHTED)
+
+# Per class: messages published and not yet acknowledged, messages waiting, and the share of turns when weighted
+DEFAULT_CLASSES = {
+    HIGH: {"InFlight": 8, "QueueSize": 1000, "Weight": 8},
+    NORMAL: {"InFlight": 4, "QueueSize": 1000, "Weight": 2},
+    LOW: {"InFlight": 1, "QueueSize": 1000, "Weight": 1},
+}
+
+# Called once a message is acknowledged, with the error if it failed and the seconds since it was published
+Done = Callable[[Optional[BaseException], float], None]
+
+
+class _Message(NamedTuple):
+    topic: str
+    payload: bytes
+    done: Done
+    queued_at: float
+
+
+class _Lane:
+    def __init__(self, name: str, in_flight: int, queue_size: int, weight: float):
+        if in_flight < 1 or queue_size < 1 or weight <= 0:
+            raise ValueError(f"the InFlight, QueueSize and Weight of lane {name} must be positive")
+        self.name = name
+        self.window = in_flight
+        self.queue: Deque[_Message] = collections.deque(maxlen=queue_size)
+        self.weight = float(weight)
+        self.in_flight = 0
+        # The lane's standing in smooth weighted round robin
+        self.current = 0.0
+        self.wait_seconds = metrics.REGISTRY.histogram(
+            "relay_lane_wait_seconds", "Time a message waited in its lane before being published", lane=name
+        )
+        self.dropped = metrics.REGISTRY.counter(
+            "relay_lane_dropped_total", "Messages dropped because their lane was full", lane=name
+        )
+        metrics.REGISTRY.gauge("relay_lane_queued", "Messages waiting in the lane", lane=name).set_function(
+            lambda: len(self.queue)
+        )
+
+    @property
+    def ready(self) -> bool:
+        return bool(self.queue) and self.in_flight < self.window
+
+
+class Lanes:
+    """
+    Relays messages through one queue and in-flight window per priority class, so a backlog of bulk telemetry
+    cannot hold up an alarm: an alarm waits at most for the messages of its own lane, and a lower lane only ever
+    has its own small window of publishes ahead of it on the link. A dispatcher thread publishes from the lanes
+    that have room in their window, either strictly in priority order or in proportion to their weights. A full
+    lane drops its oldest message.
+    """
+
+    def __init__(
+        self,
+        publish: Callable[[str, bytes], object],
+        classes: Optional[Dict[str, Dict]] = None,
+        scheduler: str = STRICT,
+    ):
+        """`publish` sends a message and returns a future completed on its acknowledgement."""
+        if scheduler not in SCHEDULERS:
+            raise ValueError(f"unknown scheduler {scheduler}, expected one of {', '.join(SCHEDULERS)}")
+        self.publish = publish
+        self.scheduler = scheduler
+        classes = classes or {}
+        unknown = set(classes) - set(PRIORITIES)
+        if unknown:
+            raise ValueError(f"unknown lanes {', '.join(sorted(unknown))}, expected {', '.join(PRIORITIES)}")
+        self.lanes: List[_Lane] = []
+        for name in PRIORITIES:
+            c = {**DEFAULT_CLASSES[name], **classes.get(name, {})}
+            self.lanes.append(_Lane(name, int(c["InFlight"]), int(c["QueueSize"]), c["Weight"]))
+        self._by_name = {lane.name: lane for lane in self.lanes}
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_config(cls, publish: Callable[[str, bytes], object], config: Union[str, Dict, None]) -> "Lanes":
+        """
+        Lanes for the Lanes configuration, {"Scheduler": "strict" or "weighted", "Classes": {"high": {"InFlight":
+        n, "QueueSize": n, "Weight": n}, "normal": ..., "low": ...}}, where every setting has a default.
+        """
+        if isinstance(config, str):
+            config = json.loads(config) if config.strip() else {}
+        config = config or {}
+        return cls(publish, config.get("Classes"), config.get("Scheduler", STRICT))
+
+    def start(self) -> "Lanes":
+        self._thread = threading.Thread(target=self._run, name="relay-lanes", daemon=True)
+        self._thread.start()
+        return self
+
+    def in_flight(self) -> int:
+        return sum(lane.in_flight for lane in self.lanes)
+
+    def submit(self, priority: str, topic: str, payload: bytes, done: Done):
+        lane = self._by_name[priority]
+        with self._condition:
+            if len(lane.queue) == lane.queue.maxlen:
+                lane.dropped.inc()
+            lane.queue.append(_Message(topic, payload, done, time.monotonic()))
+            self._condition.notify_all()
+
+    def _pick(self) -> Optional[_Lane]:
+        ready = [lane for lane in self.lanes if lane.ready]
+        if not ready:
+            return None
+        if self.scheduler == STRICT:
+            return ready[0]
+        # Smooth weighted round robin: every lane gains its weight and the one furthest ahead goes next
+        total = 0.0
+        for lane in ready:
+            lane.current += lane.weight
+            total += lane.weight
+        chosen = max(ready, key=lambda lane: lane.current)
+        chosen.current -= total
+        return chosen
+
+    def _run(self):
+        while True:
+            with self._condition:
+                lane = self._pick()
+                while lane is None and not self._stopped:
+                    self._condition.wait()
+                    lane = self._pick()
+                if lane is None:
+                    return
+                message = lane.queue.popleft()
+                lane.in_flight += 1
+            started = time.monotonic()
+            lane.wait_seconds.observe(started - message.queued_at)
+            try:
+                future = self.publish(message.topic, message.payload)
+            except Exception as e:
+                self._complete(lane, message, e, started)
+                continue
+            # Bound as default arguments, since the loop moves on to the next message before this completes
+            future.add_done_callback(
+                lambda f, lane=lane, message=message, started=started: self._complete(
+                    lane, message, f.exception(), started
+                )
+            )
+
+    def _complete(self, lane: _Lane, message: _Message, error: Optional[BaseException], started: float):
+        try:
+            message.done(error, time.monotonic() - started)
+        except Exception:
+            logging.error("relay completion failed", exc_info=True)
+        # Only released after `done`, so a drained relay has accounted for every message
+        with self._condition:
+            lane.in_flight -= 1
+            self._condition.notify_all()
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued message was acknowledged. Returns whether they were in time."""
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: all(not lane.queue and lane.in_flight == 0 for lane in self.lanes), timeout
+            )
+
+    def stop(self, timeout: Optional[float] = None) -> bool:
+        """Publish what is queued, waiting up to `timeout` for it, then stop the dispatcher."""
+        drained = self.drain(timeout)
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        return drained
@@ -0,0 +1,211 @@
+import string
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+SINGLE = "+"
+MULTI = "#"
+
+# How a route is treated when the uplink is short of bandwidth: high always passes, normal is served before low
+HIGH = "high"
+NORMAL = "normal"
+LOW = "low"
+PRIORITIES = (HIGH, NORMAL, LOW)
+
+
+def compile_template(
+    template: str, thing_name: str = "", pattern: Optional[str] = None
+) -> Callable[[Sequence[str], str], str]:
+    """
+    Compile a remote topic template into a function of the local topic's segments and the local topic.
+    {thing_name} is the relay's thing name, {0}, {1}, ... are segments of the local topic and {topic} is all of it,
+    so "devices/{thing_name}/{1}" relays "telemetry/cpu" to "devices/<thing name>/cpu". Given the local `pattern`,
+    segments beyond the levels every matching topic has are rejected.
+    """
+    parts: List[Tuple[str, Optional[str]]] = list(
+        (literal, field) for literal, field, _, _ in string.Formatter().parse(template)
+    )
+    if all(field is None for _, field in parts):
+        return lambda segments, topic: template
+
+    def render(segments: Sequence[str], topic: str) -> str:
+        rendered = []
+        for literal, field in parts:
+            rendered.append(literal)
+            if field is None:
+                continue
+            if field == "thing_name":
+                rendered.append(thing_name)
+            elif field == "topic":
+                rendered.append(topic)
+            else:
+                rendered.append(segments[int(field)])
+        return "".join(rendered)
+
+    # "a/#" also matches "a", so # adds no level every topic has
+    levels = None
+    if pattern is not None:
+        pattern_segments = pattern.split("/")
+        levels = len(pattern_segments) - (pattern_segments[-1] == MULTI)
+    for _, field in parts:
+        if field is None or field in ("thing_name", "topic"):
+            continue
+        if not field.isdigit():
+            raise ValueError(f"unknown field {{{field}}} in remote topic {template}")
+        if levels is not None and int(field) >= levels:
+            raise ValueError(
+                f"{{{field}}} in remote topic {template} of route {pattern} is beyond the {levels} levels it matches"
+            )
+    return render
+
+
+class Route:
+    def __init__(self, pattern: str, template: str, thing_name: str = "", priority: str = NORMAL, weight: float = 1):
+        if priority not in PRIORITIES:
+            raise ValueError(f"unknown priority {priority} for {pattern}, expected one of {', '.join(PRIORITIES)}")
+        if weight <= 0:
+            raise ValueError(f"the weight of {pattern} must be positive")
+        self.pattern = pattern
+        self.template = template
+        self.priority = priority
+        # Its share of the bandwidth left to routes of the same priority
+        self.weight = float(weight)
+        self.render = compile_template(template, thing_name, pattern)
+        # The local pattern subscribed to for this route, set by Router.plan()
+        self.subscription: Optional[str] = None
+
+    def remote_topic(self, segments: Sequence[str], topic: str) -> str:
+        return self.render(segments, topic)
+
+
+class _Node:
+    __slots__ = ("children", "routes")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.routes: List[Route] = []
+
+
+class Router:
+    """
+    Maps local topics to remote ones through a trie of the local topic patterns, which may use the MQTT
+    wildcards + and #. Matching a topic walks one level per segment, whatever the number of routes.
+    """
+
+    def __init__(self, thing_name: str = ""):
+        self.thing_name = thing_name
+        self.routes: List[Route] = []
+        self._root = _Node()
+
+    @classmethod
+    def from_topics(cls, topics: List[Dict[str, str]], thing_name: str = "") -> "Router":
+        """
+        A router for the Topics configuration, a list of {"From": local pattern, "To": remote template}, each
+        optionally with a "Priority" and a "Weight" for sharing the uplink's bandwidth.
+        """
+        router = cls(thing_name)
+        for t in topics:
+            router.add(t["From"], t["To"], t.get("Priority", NORMAL), t.get("Weight", 1))
+        return router
+
+    def add(self, pattern: str, template: str, priority: str = NORMAL, weight: float = 1) -> Route:
+        segments = pattern.split("/")
+        for i, segment in enumerate(segments):
+            if (MULTI in segment and (segment != MULTI or i != len(segments) - 1)) or (
+                SINGLE in segment and segment != SINGLE
+            ):
+                raise ValueError(f"invalid topic pattern {pattern}")
+        route = Route(pattern, template, self.thing_name, priority, weight)
+        node = self._root
+        for segment in segments:
+            node = node.children.setdefault(segment, _Node())
+        node.routes.append(route)
+        self.routes.append(route)
+        return route
+
+    def match(self, topic: str) -> Tuple[List[str], List[Route]]:
+        """The segments of the topic and every route whose pattern matches it."""
+        segments = topic.split("/")
+        matched: List[Route] = []
+        # Topics starting with $ are only matched by patterns that start with the same literal segment
+        nodes = [self._root]
+        for depth, segment in enumerate(segments):
+            next_nodes = []
+            for node in nodes:
+                multi = node.children.get(MULTI)
+                if multi is not None and not (depth == 0 and segment.startswith("$")):
+                    matched.extend(multi.routes)
+                child = node.children.get(segment)
+                if child is not None:
+                    next_nodes.append(child)
+                single = node.children.get(SINGLE)
+                if single is not None and not (depth == 0 and segment.startswith("$")):
+                    next_nodes.append(single)
+            nodes = next_nodes
+            if not nodes:
+                return segments, matched
+        for node in nodes:
+            matched.extend(node.routes)
+            # "a/#" also matches "a"
+            multi = node.children.get(MULTI)
+            if multi is not None:
+                matched.extend(multi.routes)
+        return segments, matched
+
+    def remote_topics(self, topic: str, subscription: Optional[str] = None) -> List[Tuple[Route, str]]:
+        """
+        The routes a local topic is relayed by and the remote topic of each, without duplicate remote topics.
+        With a subscription, only the routes it was planned for, since a topic may arrive on several subscriptions.
+        """
+        segments, routes = self.match(topic)
+        relayed: List[Tuple[Route, str]] = []
+        seen = set()
+        for route in routes:
+            if subscription is not None and route.subscription != subscription:
+                continue
+            remote = route.remote_topic(segments, topic)
+            if remote not in seen:
+                seen.add(remote)
+                relayed.append((route, remote))
+        return relayed
+
+    def _covering(self, segments: List[str]) -> List[str]:
+        """
+        The patterns that match every topic the given pattern matches, including itself. Matching a parent level
+        through "#" is not considered, so a pattern is only ever covered by a more general one.
+        """
+        found: List[str] = []
+        stack = [(self._root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            if depth == len(segments):
+                found.extend(r.pattern for r in node.routes)
+                continue
+            wildcards_match = not (depth == 0 and segments[0].startswith("$"))
+            multi = node.children.get(MULTI)
+            if multi is not None and wildcards_match:
+                found.extend(r.pattern for r in multi.routes)
+            segment = segments[depth]
+            if segment == MULTI:
+                # Only a "#" covers a "#"
+                continue
+            single = node.children.get(SINGLE)
+            if single is not None and wildcards_match:
+                stack.append((single, depth + 1))
+            if segment != SINGLE:
+                child = node.children.get(segment)
+                if child is not None:
+                    stack.append((child, depth + 1))
+        return found
+
+    def plan(self) -> List[str]:
+        """
+        The fewest local patterns to subscribe to so every route receives its messages. A pattern matched in full
+        by a more general one, such as "a/b" by "a/+" or "a/#", is left out, and its routes are relayed from the
+        messages of the more general subscription. Sets the subscription of every route.
+        """
+        patterns = list(dict.fromkeys(r.pattern for r in self.routes))
+        covering = {p: self._covering(p.split("/")) for p in patterns}
+        subscriptions = [p for p in patterns if all(c == p for c in covering[p])]
+        kept = set(subscriptions)
+        for route in self.routes:
+            route.subscription = next(c for c in [route.pattern] + covering[route.pattern] if c in kept)
+        return subscriptions
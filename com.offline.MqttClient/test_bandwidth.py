@@ -0,0 +1,72 @@
+import bandwidth
+import pytest
+from router import Route
+
+
+def route(priority="normal", weight=1):
+    return Route("t", "r", priority=priority, weight=weight)
+
+
+def offer(governor, r, count, size, start=0.0, spacing=1.0):
+    """Offer `count` messages on a route, one every `spacing` seconds, returning how many passed."""
+    return sum(governor.admit(r, size, now=start + i * spacing) for i in range(count))
+
+
+class TestFairShares:
+    def test_small_demands_are_met_and_the_rest_split_by_weight(self):
+        assert bandwidth.fair_shares(100, [10, 100, 100], [1, 1, 3]) == pytest.approx([10, 22.5, 67.5])
+
+    def test_everything_fits(self):
+        assert bandwidth.fair_shares(100, [10, 20, 0], [1, 1, 1]) == [10, 20, 0]
+
+
+class TestGovernor:
+    def test_disabled_without_a_budget(self):
+        assert bandwidth.Governor.from_config("{}") is None
+        assert bandwidth.Governor.from_config({"BytesPerInterval": 0}) is None
+        assert bandwidth.Governor.from_config('{"BytesPerInterval": 100, "IntervalSeconds": 10}').interval == 10
+
+    def test_high_priority_always_passes(self):
+        governor = bandwidth.Governor(100, interval=60)
+        alarms = route("high")
+        assert offer(governor, alarms, 50, 100) == 50
+
+    def test_downsamples_a_route_over_its_share_evenly(self):
+        governor = bandwidth.Governor(1000, interval=60)
+        telemetry = route()
+        passed = [governor.admit(telemetry, 100, now=i) for i in range(120)]
+        # The first interval's budget passes at once, then one message in six fits the refill rate
+        assert sum(passed[:10]) == 10
+        assert 8 <= sum(passed[60:]) <= 11
+
+    def test_normal_is_served_before_low(self):
+        governor = bandwidth.Governor(6000, interval=60)
+        normal, low = route("normal"), route("low")
+        for r in (normal, low):
+            offer(governor, r, 60, 100)
+        governor.adjust()
+        passed_normal = offer(governor, normal, 60, 100, start=60)
+        passed_low = offer(governor, low, 60, 100, start=60)
+        assert passed_normal > passed_low
+        assert passed_normal + passed_low <= 62
+
+    def test_weights_split_a_priority(self):
+        governor = bandwidth.Governor(4000, interval=60)
+        heavy, light = route(weight=3), route(weight=1)
+        for r in (heavy, light):
+            offer(governor, r, 60, 100)
+        governor.adjust()
+        assert offer(governor, heavy, 60, 100, 120) == pytest.approx(3 * offer(governor, light, 60, 100, 120), abs=3)
+
+    def test_budget_follows_acknowledged_throughput(self):
+        governor = bandwidth.Governor(10000, interval=60)
+        governor.admit(route(), 5000, now=0)
+        governor.acked(1000)
+        governor.adjust()
+        assert governor.usable == 1000
+
+        governor.adjust()
+        assert governor.usable == 1250
+        for _ in range(20):
+            governor.adjust()
+        assert governor.usable == 10000
@@ -1,5 +1,10 @@
+import concurrent.futures
+
 import client
+import dedup
+import lanes
 import pytest
+import router
 
 from awsiot.greengrasscoreipc.model import (
     JsonMessage,
@@ -8,31 +13,6 @@ from awsiot.greengrasscoreipc.model import (
 )
 
 
-class TestConnectWithRetry:
-    @pytest.fixture
-    def mock_conn(self, mocker):
-        return mocker.patch("client.remote_connection")
-
-    @pytest.fixture
-    def mock_sleep(self, mocker):
-        mocker.patch("time.sleep")
-
-    def test_retries_correct_number_of_times(self, mock_conn, mock_sleep):
-        mock_conn.return_value = None
-
-        with pytest.raises(ConnectionError):
-            client.remote_connection_with_retry("end", 0, "", "", "", "", 10)
-        assert mock_conn.call_count == 10
-
-    def test_returns_without_retry_when_conn_made(self, mock_conn):
-        mock_conn.return_value = "conn"
-
-        assert (
-            client.remote_connection_with_retry("end", 0, "", "", "", "", 10) == "conn"
-        )
-        mock_conn.assert_called_once()
-
-
 class TestSafeGetMessageAndTopic:
     def test_binary_with_msg_and_with_ctxt(self):
         msg = client.SubscriptionResponseMessage(
@@ -93,3 +73,94 @@ class TestSafeGetMessageAndTopic:
         )
         with pytest.raises(ValueError):
             client.safe_get_message_and_topic(msg)
+
+
+def message(topic, payload=b"hi"):
+    return client.SubscriptionResponseMessage(
+        binary_message=BinaryMessage(message=payload, context=MessageContext(topic=topic))
+    )
+
+
+class TestRelayMessages:
+    @pytest.fixture
+    def local_client(self, mocker):
+        local_client = mocker.Mock()
+        local_client.subscribe_to_topic.return_value = (None, mocker.Mock())
+        return local_client
+
+    @pytest.fixture
+    def remote_client(self, mocker):
+        def publish(topic, payload, qos):
+            acknowledged = concurrent.futures.Future()
+            acknowledged.set_result({"packet_id": 1})
+            return acknowledged, 1
+
+        return mocker.Mock(publish=mocker.Mock(side_effect=publish))
+
+    def callbacks(self, local_client):
+        return {c.kwargs["topic"]: c.kwargs["on_stream_event"] for c in local_client.subscribe_to_topic.call_args_list}
+
+    def test_each_subscription_relays_its_own_routes(self, local_client, remote_client):
+        topic_router = router.Router.from_topics([{"From": "a/+", "To": "r/{1}"}, {"From": "b", "To": "s"}])
+        relay_lanes = lanes.Lanes(lambda t, p: remote_client.publish(t, p, client.QoS.AT_LEAST_ONCE)[0]).start()
+
+        client.relay_messages(local_client, remote_client, topic_router, relay_lanes=relay_lanes)
+        self.callbacks(local_client)["a/+"](message("a/x"))
+
+        assert relay_lanes.stop(5)
+        remote_client.publish.assert_called_once_with("r/x", b"hi", client.QoS.AT_LEAST_ONCE)
+
+    def test_messages_over_the_budget_are_not_relayed(self, mocker, local_client, remote_client):
+        topic_router = router.Router.from_topics([{"From": "a", "To": "r"}])
+        governor = mocker.Mock()
+        governor.admit.side_effect = [True, False]
+        relay_lanes = lanes.Lanes(lambda t, p: remote_client.publish(t, p, client.QoS.AT_LEAST_ONCE)[0]).start()
+
+        client.relay_messages(local_client, remote_client, topic_router, governor, relay_lanes)
+        for _ in range(2):
+            self.callbacks(local_client)["a"](message("a"))
+
+        assert relay_lanes.stop(5)
+        remote_client.publish.assert_called_once()
+        governor.acked.assert_called_once_with(2)
+
+    def test_routes_are_queued_by_priority(self, mocker, local_client, remote_client):
+        topic_router = router.Router.from_topics(
+            [{"From": "alarms", "To": "r/alarms", "Priority": "high"}, {"From": "bulk", "To": "r/bulk", "Priority": "low"}]
+        )
+        relay_lanes = mocker.Mock()
+
+        client.relay_messages(local_client, remote_client, topic_router, relay_lanes=relay_lanes)
+        self.callbacks(local_client)["alarms"](message("alarms"))
+        self.callbacks(local_client)["bulk"](message("bulk"))
+
+        assert [c[0][:3] for c in relay_lanes.submit.call_args_list] == [
+            ("high", "r/alarms", b"hi"),
+            ("low", "r/bulk", b"hi"),
+        ]
+
+    def test_stamps_relayed_messages(self, local_client, remote_client):
+        topic_router = router.Router.from_topics([{"From": "a", "To": "r"}])
+        relay_lanes = lanes.Lanes(lambda t, p: remote_client.publish(t, p, client.QoS.AT_LEAST_ONCE)[0]).start()
+
+        stamper = dedup.Stamper("thing")
+        client.relay_messages(local_client, remote_client, topic_router, relay_lanes=relay_lanes, stamper=stamper)
+        for _ in range(2):
+            self.callbacks(local_client)["a"](message("a"))
+
+        assert relay_lanes.stop(5)
+        payloads = [c[0][1] for c in remote_client.publish.call_args_list]
+        assert [dedup.parse(p)[1:] for p in payloads] == [(0, b"hi"), (1, b"hi")]
+
+
+class TestParseArgs:
+    REQUIRED = [
+        "--topics", "[]", "--discovery_cache_path", "cache.json", "--broker_thing_name", "broker",
+        "--region", "eu-west-1", "--cert_path", "cert", "--key_path", "key", "--thing_name", "thing",
+    ]
+
+    def test_the_discovery_ca_is_optional(self, mocker):
+        mocker.patch("sys.argv", ["client.py"] + self.REQUIRED)
+        assert client.parse_args().ca_path is None
+        mocker.patch("sys.argv", ["client.py"] + self.REQUIRED + ["--ca_path", "ca.pem"])
+        assert client.parse_args().ca_path == "ca.pem"
@@ -0,0 +1,188 @@
+import os
+import threading
+import time
+
+import connection
+import pytest
+from endpoints import Endpoint
+
+a = Endpoint("10.0.0.1", 8883)
+b = Endpoint("10.0.0.2", 8883)
+c = Endpoint("10.0.0.3", 8883)
+
+
+def attempt_with(delays):
+    """An attempt that takes the given seconds per endpoint, or fails for None."""
+
+    def attempt(endpoint):
+        delay = delays[endpoint]
+        if delay is None:
+            raise OSError("unreachable")
+        time.sleep(delay)
+        return delay
+
+    return attempt
+
+
+class TestRace:
+    def test_fastest_endpoint_wins_even_if_started_later(self):
+        latencies = connection.LatencyTable()
+        winner = connection.race([a, b], attempt_with({a: 1, b: 0.01}), latencies, stagger=0.05, timeout=5)
+        assert winner == b
+
+    def test_failure_starts_the_next_attempt_straight_away(self):
+        latencies = connection.LatencyTable()
+        started = time.monotonic()
+        winner = connection.race([a, b], attempt_with({a: None, b: 0}), latencies, stagger=10, timeout=5)
+        assert winner == b
+        assert time.monotonic() - started < 1
+        assert latencies.ranked([a, b, c]) == [b, c, a]
+
+    def test_all_failing(self):
+        assert connection.race([a, b], attempt_with({a: None, b: None}), connection.LatencyTable(), 0, 1) is None
+
+
+class TestLatencyTable:
+    def test_ranks_measured_then_unmeasured_then_failed(self):
+        latencies = connection.LatencyTable()
+        latencies.record(c, 0.5)
+        latencies.record(b, 0.1)
+        latencies.failed(a)
+        assert latencies.ranked([a, b, c, Endpoint("10.0.0.4", 8883)]) == [b, c, Endpoint("10.0.0.4", 8883), a]
+
+    def test_averages_measurements(self):
+        latencies = connection.LatencyTable()
+        latencies.record(a, 1.0)
+        latencies.record(a, 0.0)
+        assert latencies.latencies[a] == pytest.approx(1 - connection.LATENCY_WEIGHT)
+
+
+class FakeConnection:
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.published = []
+        self.disconnected = False
+
+    def publish(self, topic, payload, qos):
+        self.published.append(topic)
+        return None, 1
+
+    def disconnect(self):
+        self.disconnected = True
+
+
+class TestFailoverConnection:
+    def test_fails_over_to_the_next_endpoint_when_interrupted(self):
+        connected = []
+        failed_over = threading.Event()
+
+        def connect(endpoint, failover):
+            connected.append(FakeConnection(endpoint))
+            if len(connected) == 2:
+                failed_over.set()
+            return connected[-1]
+
+        remote = connection.FailoverConnection(
+            [a, b], connect, attempt_with({a: 0, b: 0.01}), stagger=0, failover_after=0
+        ).connect()
+        assert remote.endpoint == a
+        remote.on_interrupted(connected[0], error="reset")
+
+        assert failed_over.wait(5)
+        remote.publish("t", b"", 1)
+        assert connected[0].disconnected
+        assert remote.endpoint == b and connected[1].published == ["t"]
+
+    def test_publish_waits_for_a_connection(self):
+        remote = connection.FailoverConnection([a], lambda e, f: FakeConnection(e), attempt_with({a: 0}), timeout=0.01)
+        with pytest.raises(ConnectionError):
+            remote.publish("t", b"", 1)
+
+    def test_disconnect_stops_using_the_connection(self):
+        remote = connection.FailoverConnection([a], lambda e, f: FakeConnection(e), attempt_with({a: 0})).connect()
+        remote.disconnect()
+        with pytest.raises(ConnectionError):
+            remote.current(0)
+
+    def test_moves_off_an_endpoint_discovery_no_longer_lists(self):
+        connected = []
+        moved = threading.Event()
+
+        def connect(endpoint, failover):
+            connected.append(FakeConnection(endpoint))
+            if endpoint == b:
+                moved.set()
+            return connected[-1]
+
+        remote = connection.FailoverConnection([a], connect, attempt_with({a: 0, b: 0})).connect()
+        remote.update_endpoints([a, c])
+        assert remote.endpoint == a and not connected[0].disconnected
+
+        remote.update_endpoints([b])
+        assert moved.wait(5)
+        assert connected[0].disconnected
+
+    def test_stays_on_an_endpoint_that_resumes_in_time(self):
+        connected = []
+
+        def connect(endpoint, failover):
+            connected.append(FakeConnection(endpoint))
+            return connected[-1]
+
+        remote = connection.FailoverConnection([a, b], connect, attempt_with({a: 0, b: 0.01}), failover_after=0.2)
+        remote.connect()
+        remote.on_interrupted(connected[0], error="reset")
+        assert remote.uptime() == 0
+        # Publishing while the CRT reconnects queues on the interrupted connection
+        remote.publish("t", b"", 1)
+        remote.on_resumed(connected[0])
+        time.sleep(0.3)
+
+        assert len(connected) == 1 and not connected[0].disconnected
+        assert connected[0].published == ["t"]
+        assert remote.uptime() > 0
+
+    def test_fails_over_once_reconnecting_takes_too_long(self):
+        connected = []
+        failed_over = threading.Event()
+
+        def connect(endpoint, failover):
+            connected.append(FakeConnection(endpoint))
+            if len(connected) == 2:
+                failed_over.set()
+            return connected[-1]
+
+        remote = connection.FailoverConnection([a, b], connect, attempt_with({a: 0, b: 0.01}), failover_after=0.05)
+        remote.connect()
+        remote.on_interrupted(connected[0], error="reset")
+        assert failed_over.wait(5)
+        assert connected[0].disconnected and connected[1].endpoint == b
+
+
+class TestConnectionManager:
+    def test_reloads_credentials_only_when_they_change(self, mocker, tmp_path):
+        options = mocker.patch("connection.awscrt.io.TlsContextOptions")
+        mocker.patch("connection.awscrt.io.ClientTlsContext")
+        mocker.patch("connection.awscrt.mqtt.Client")
+        mocker.patch("connection.tls_context")
+        mocker.patch("connection.probe", return_value=0.1)
+        cert = tmp_path / "cert.pem"
+        key = tmp_path / "key.pem"
+        cert.write_text("cert")
+        key.write_text("key")
+        ca = ["ca"]
+        manager = connection.ConnectionManager(str(cert), str(key), lambda: ca[0], "thing")
+
+        manager.probe(a)
+        manager.probe(b)
+        assert options.create_client_with_mtls.call_count == 1
+
+        ca[0] = "new ca"
+        manager.probe(a)
+        assert options.create_client_with_mtls.call_count == 2
+
+        cert.write_text("rotated")
+        os.utime(cert, ns=(0, 1))
+        manager.probe(a)
+        assert options.create_client_with_mtls.call_count == 3
+        assert options.create_client_with_mtls.call_args[0] == (b"rotated", b"key")
@@ -0,0 +1,51 @@
+import dedup
+import pytest
+
+
+class TestStamp:
+    def test_round_trip(self):
+        stamped = dedup.stamp("thing.abc", 12345, b'[{"n": "cpu"}]')
+        assert stamped == b'#thing.abc:9ix\n[{"n": "cpu"}]'
+        assert dedup.parse(stamped) == ("thing.abc", 12345, b'[{"n": "cpu"}]')
+
+    @pytest.mark.parametrize("payload", [b'{"a": 1}', b"#no newline", b"#nocolon\nx", b"#src:zz!\nx"])
+    def test_unstamped_payloads_pass_unchanged(self, payload):
+        assert dedup.parse(payload) == (None, None, payload)
+
+    def test_stamper_numbers_messages_per_process(self):
+        stamper = dedup.Stamper("thing", started=36)
+        assert [dedup.parse(stamper.stamp(b"x"))[:2] for _ in range(2)] == [("thing.10", 0), ("thing.10", 1)]
+
+
+class TestSlidingWindow:
+    def test_reordered_messages_pass_and_duplicates_do_not(self):
+        window = dedup.SlidingWindow(8)
+        assert [window.seen(s) for s in (0, 2, 1, 2, 0, 3)] == [False, False, False, True, True, False]
+
+    def test_messages_older_than_the_window_count_as_seen(self):
+        window = dedup.SlidingWindow(8)
+        window.seen(0)
+        window.seen(20)
+        assert window.seen(12) and not window.seen(13)
+
+    def test_memory_is_bounded_by_the_window(self):
+        window = dedup.SlidingWindow(64)
+        for s in range(0, 100000, 7):
+            window.seen(s)
+        assert window.bitmap.bit_length() <= 64
+
+
+class TestDeduplicator:
+    def test_drops_redelivered_messages(self):
+        deduplicator = dedup.Deduplicator()
+        stamper = dedup.Stamper("thing")
+        first, second = stamper.stamp(b"a"), stamper.stamp(b"b")
+        assert [deduplicator.accept(m) for m in (first, second, first)] == [b"a", b"b", None]
+        assert deduplicator.accept(b"unstamped") == deduplicator.accept(b"unstamped") == b"unstamped"
+
+    def test_forgets_the_least_recently_seen_source(self):
+        deduplicator = dedup.Deduplicator(max_sources=2)
+        for source in ("a", "b", "a", "c"):
+            deduplicator.is_duplicate(source, 0)
+        assert deduplicator.is_duplicate("a", 0)
+        assert not deduplicator.is_duplicate("b", 0)
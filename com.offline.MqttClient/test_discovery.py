@@ -0,0 +1,95 @@
+import concurrent.futures
+
+import discovery
+import pytest
+from endpoints import Endpoint
+
+a = Endpoint("10.0.0.1", 8883)
+b = Endpoint("10.0.0.2", 8883)
+
+
+class FakeCloud:
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def cached(tmp_path, age, endpoints=(a,)):
+    path = str(tmp_path / "discovery.json")
+    discovery.write_cache(path, discovery.Discovery(list(endpoints), ["ca"], discovery.time.time() - age))
+    return path
+
+
+class TestDiscoveryCache:
+    def test_starts_from_the_cache_without_calling_the_cloud(self, tmp_path):
+        cloud = FakeCloud()
+        cache = discovery.DiscoveryCache(cached(tmp_path, age=5000), cloud, ttl=3600, grace=3600)
+        assert cache.load().endpoints == [a]
+        assert cloud.calls == 0
+
+    def test_discovers_when_there_is_no_cache(self, tmp_path):
+        path = str(tmp_path / "discovery.json")
+        cloud = FakeCloud(discovery.Discovery([a, b], ["ca"], 1000.0))
+        cache = discovery.DiscoveryCache(path, cloud)
+        assert cache.load().endpoints == [a, b]
+        assert discovery.read_cache(path) == cache.current
+        assert not (tmp_path / "discovery.json.tmp").exists()
+
+    def test_keeps_an_expired_cache_when_the_cloud_is_unreachable(self, tmp_path):
+        cloud = FakeCloud(ConnectionError("offline"))
+        cache = discovery.DiscoveryCache(cached(tmp_path, age=10000), cloud, ttl=3600, grace=3600)
+        assert cache.load().endpoints == [a]
+        assert cloud.calls == 1
+
+    def test_fails_without_a_cache_when_the_cloud_is_unreachable(self, tmp_path):
+        cache = discovery.DiscoveryCache(str(tmp_path / "missing.json"), FakeCloud(ConnectionError("offline")))
+        with pytest.raises(ConnectionError):
+            cache.load()
+
+    def test_ignores_an_unreadable_cache(self, tmp_path):
+        path = tmp_path / "discovery.json"
+        path.write_text("{")
+        assert discovery.read_cache(str(path)) is None
+
+    def test_a_discovery_that_does_not_answer_times_out_like_a_failure(self, tmp_path, mocker):
+        mocker.patch("awscrt.io.TlsContextOptions.create_client_with_mtls_from_path")
+        mocker.patch("awscrt.io.ClientTlsContext")
+        client = mocker.patch("awsiot.greengrass_discovery.DiscoveryClient").return_value
+        client.discover.return_value = concurrent.futures.Future()
+        cloud = discovery.cloud_discovery("client", "broker", "cert", "key", "us-east-1", timeout=0.01)
+        with pytest.raises(TimeoutError):
+            cloud()
+        cache = discovery.DiscoveryCache(cached(tmp_path, age=10000), cloud, ttl=3600, grace=3600)
+        assert cache.load().endpoints == [a]
+
+
+class TestSchedule:
+    def test_refreshes_when_due_and_reports_changes(self, tmp_path):
+        cloud = FakeCloud(
+            discovery.Discovery([a], ["ca"], discovery.time.time()),
+            ConnectionError("offline"),
+            discovery.Discovery([b], ["ca"], discovery.time.time()),
+        )
+        cache = discovery.DiscoveryCache(cached(tmp_path, age=3000), cloud, ttl=3600)
+        cache.load()
+        scheduled = []
+        changes = []
+        cache.schedule(lambda delay, callback: scheduled.append((delay, callback)), changes.append)
+        assert scheduled[-1][0] == pytest.approx(600, abs=5)
+
+        # The same connectivity, refreshed
+        scheduled.pop()[1]()
+        assert changes == [] and scheduled[-1][0] == pytest.approx(3600, abs=5)
+        # A failure retries sooner than the TTL
+        scheduled.pop()[1]()
+        assert scheduled[-1][0] == discovery.MIN_RETRY_DELAY
+        scheduled.pop()[1]()
+        assert [c.endpoints for c in changes] == [[b]]
+        assert discovery.read_cache(cache.path).endpoints == [b]
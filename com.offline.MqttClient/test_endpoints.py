@@ -0,0 +1,45 @@
+import endpoints
+from awsiot.greengrass_discovery import DiscoverResponse
+
+
+def discover_response():
+    return DiscoverResponse.from_payload(
+        {
+            "GGGroups": [
+                {
+                    "GGGroupId": "greengrassV2-coreDevice-other",
+                    "Cores": [{"thingArn": "other", "Connectivity": [{"HostAddress": "10.0.0.9", "PortNumber": 8883}]}],
+                    "CAs": ["other-ca"],
+                },
+                {
+                    "GGGroupId": "greengrassV2-coreDevice-broker",
+                    "Cores": [
+                        {
+                            "thingArn": "core-a",
+                            "Connectivity": [
+                                {"HostAddress": "10.0.0.1", "PortNumber": 8883},
+                                {"HostAddress": "fd00::1", "PortNumber": 8883},
+                            ],
+                        },
+                        {"thingArn": "core-b", "Connectivity": [{"HostAddress": "10.0.0.2", "PortNumber": 8883}]},
+                    ],
+                    "CAs": ["broker-ca"],
+                },
+            ]
+        }
+    )
+
+
+class TestEndpoints:
+    def test_keeps_every_core_and_connectivity_entry(self):
+        remote_endpoints, cas = endpoints.from_discovery(discover_response(), "broker")
+        assert remote_endpoints == [
+            endpoints.Endpoint("10.0.0.1", 8883, "core-a"),
+            endpoints.Endpoint("fd00::1", 8883, "core-a"),
+            endpoints.Endpoint("10.0.0.2", 8883, "core-b"),
+        ]
+        assert cas == ["broker-ca"]
+
+    def test_round_trips_through_json(self):
+        remote_endpoints, _ = endpoints.from_discovery(discover_response(), "broker")
+        assert endpoints.from_json(endpoints.to_json(remote_endpoints)) == remote_endpoints
@@ -0,0 +1,114 @@
+import concurrent.futures
+import threading
+
+import lanes
+import pytest
+
+
+class ManualLink:
+    """A remote broker whose acknowledgements are released by the test."""
+
+    def __init__(self):
+        self.published = []
+        self.pending = []
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+
+    def publish(self, topic, payload):
+        future = concurrent.futures.Future()
+        with self.changed:
+            self.published.append(topic)
+            self.pending.append(future)
+            self.changed.notify_all()
+        return future
+
+    def wait_for(self, count):
+        with self.changed:
+            assert self.changed.wait_for(lambda: len(self.published) >= count, 5)
+
+    def ack_all(self):
+        with self.lock:
+            pending, self.pending = self.pending, []
+        for future in pending:
+            future.set_result(None)
+
+
+def record(results, name):
+    return lambda error, seconds: results.append((name, error))
+
+
+class TestLanes:
+    def test_a_full_window_holds_back_its_lane_only(self):
+        link = ManualLink()
+        relay_lanes = lanes.Lanes(link.publish, {"low": {"InFlight": 1}}).start()
+        results = []
+        for i in range(3):
+            relay_lanes.submit("low", f"bulk{i}", b"", record(results, f"bulk{i}"))
+        link.wait_for(1)
+        relay_lanes.submit("high", "alarm", b"", record(results, "alarm"))
+        link.wait_for(2)
+        assert link.published == ["bulk0", "alarm"]
+
+        while len(results) < 4:
+            link.ack_all()
+            relay_lanes.drain(0.05)
+        assert relay_lanes.stop(5)
+        assert link.published == ["bulk0", "alarm", "bulk1", "bulk2"]
+        assert sorted(name for name, error in results if error is None) == ["alarm", "bulk0", "bulk1", "bulk2"]
+
+    def test_strict_priority_serves_higher_lanes_first(self):
+        link = ManualLink()
+        relay_lanes = lanes.Lanes(link.publish)
+        for priority in ("low", "normal", "high"):
+            relay_lanes.submit(priority, priority, b"", record([], priority))
+        relay_lanes.start()
+        link.wait_for(3)
+        assert link.published == ["high", "normal", "low"]
+        link.ack_all()
+        assert relay_lanes.stop(5)
+
+    def test_weighted_scheduler_shares_turns_by_weight(self):
+        link = ManualLink()
+        relay_lanes = lanes.Lanes(
+            link.publish,
+            {name: {"InFlight": 100, "Weight": weight} for name, weight in (("high", 3), ("normal", 1), ("low", 1))},
+            lanes.WEIGHTED,
+        )
+        for i in range(10):
+            for priority in ("high", "normal", "low"):
+                relay_lanes.submit(priority, priority, b"", record([], priority))
+        relay_lanes.start()
+        link.wait_for(10)
+        assert link.published[:10].count("high") == 6
+        link.ack_all()
+        relay_lanes.drain(1)
+        link.ack_all()
+        assert relay_lanes.stop(5)
+
+    def test_failed_publishes_report_their_error(self):
+        results = []
+
+        def publish(topic, payload):
+            raise ConnectionError("not connected")
+
+        relay_lanes = lanes.Lanes(publish).start()
+        relay_lanes.submit("normal", "t", b"", record(results, "t"))
+        assert relay_lanes.stop(5)
+        assert isinstance(results[0][1], ConnectionError)
+
+    def test_a_full_lane_drops_its_oldest_message(self):
+        link = ManualLink()
+        relay_lanes = lanes.Lanes(link.publish, {"normal": {"QueueSize": 2}})
+        for i in range(3):
+            relay_lanes.submit("normal", f"t{i}", b"", record([], i))
+        relay_lanes.start()
+        link.wait_for(2)
+        assert link.published == ["t1", "t2"]
+        link.ack_all()
+        assert relay_lanes.stop(5)
+
+    def test_invalid_configuration(self):
+        with pytest.raises(ValueError):
+            lanes.Lanes.from_config(None, '{"Scheduler": "fifo"}')
+        with pytest.raises(ValueError):
+            lanes.Lanes.from_config(None, {"Classes": {"urgent": {}}})
@@ -0,0 +1,84 @@
+import re
+
+import pytest
+import router
+
+
+def remote_topics(topic_router, topic, subscription=None):
+    return sorted(t for _, t in topic_router.remote_topics(topic, subscription))
+
+
+class TestTemplates:
+    def test_substitutes_segments_thing_name_and_topic(self):
+        render = router.compile_template("devices/{thing_name}/{1}/{topic}", "thing")
+        assert render(["telemetry", "cpu"], "telemetry/cpu") == "devices/thing/cpu/telemetry/cpu"
+
+    def test_literal_template(self):
+        assert router.compile_template("remote")(["a"], "a") == "remote"
+
+    def test_unknown_field(self):
+        with pytest.raises(ValueError):
+            router.compile_template("devices/{device}")
+
+    @pytest.mark.parametrize("pattern", ["a/+", "a/+/#", "a/b/#"])
+    def test_segments_beyond_the_pattern_are_rejected(self, pattern):
+        assert router.compile_template("remote/{1}", pattern=pattern)(["a", "b"], "a/b") == "remote/b"
+        with pytest.raises(ValueError, match=re.escape(pattern)):
+            router.Route(pattern, "remote/{3}")
+
+
+class TestRouter:
+    @pytest.fixture
+    def topic_router(self):
+        return router.Router.from_topics(
+            [
+                {"From": "a/b", "To": "exact"},
+                {"From": "a/+", "To": "single/{1}"},
+                {"From": "a/#", "To": "multi/{topic}"},
+                {"From": "c/+/d", "To": "middle/{1}"},
+                {"From": "$local/x", "To": "dollar"},
+            ],
+            "thing",
+        )
+
+    def test_matches_wildcards(self, topic_router):
+        assert remote_topics(topic_router, "a/b") == ["exact", "multi/a/b", "single/b"]
+        assert remote_topics(topic_router, "a/b/c") == ["multi/a/b/c"]
+        assert remote_topics(topic_router, "c/e/d") == ["middle/e"]
+        assert remote_topics(topic_router, "c/e") == []
+
+    def test_dollar_topics_only_match_literal_patterns(self):
+        topic_router = router.Router.from_topics([{"From": "#", "To": "all"}, {"From": "+/x", "To": "x"}])
+        assert remote_topics(topic_router, "$local/x") == []
+        assert remote_topics(topic_router, "local/x") == ["all", "x"]
+
+    def test_plan_subscribes_to_the_fewest_patterns(self, topic_router):
+        assert topic_router.plan() == ["a/#", "c/+/d", "$local/x"]
+        assert {r.pattern: r.subscription for r in topic_router.routes} == {
+            "a/b": "a/#",
+            "a/+": "a/#",
+            "a/#": "a/#",
+            "c/+/d": "c/+/d",
+            "$local/x": "$local/x",
+        }
+
+    def test_overlapping_subscriptions_relay_each_route_once(self):
+        topic_router = router.Router.from_topics([{"From": "a/+", "To": "first"}, {"From": "+/b", "To": "second"}])
+        assert topic_router.plan() == ["a/+", "+/b"]
+        assert remote_topics(topic_router, "a/b", "a/+") == ["first"]
+        assert remote_topics(topic_router, "a/b", "+/b") == ["second"]
+
+    def test_duplicate_remote_topics_are_relayed_once(self):
+        topic_router = router.Router.from_topics([{"From": "a/+", "To": "r"}, {"From": "a/#", "To": "r"}])
+        assert remote_topics(topic_router, "a/b") == ["r"]
+
+    @pytest.mark.parametrize("pattern", ["a/#/b", "a/b#", "a+/b"])
+    def test_invalid_patterns(self, pattern):
+        with pytest.raises(ValueError):
+            router.Router().add(pattern, "r")
+
+    def test_priority_and_weight(self):
+        topic_router = router.Router.from_topics([{"From": "alarms", "To": "r", "Priority": "high"}, {"From": "a", "To": "s"}])
+        assert [(r.priority, r.weight) for r in topic_router.routes] == [("high", 1), ("normal", 1)]
+        with pytest.raises(ValueError):
+            router.Router().add("a", "r", priority="urgent")
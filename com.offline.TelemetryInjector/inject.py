@@ -1,11 +1,18 @@
 import os
-import sys
 import json
 import logging
+import threading
 import time
-from typing import Dict, List
+from argparse import ArgumentParser
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
 
 import health
+import lifecycle
+import logutil
+import metrics
+import profiler
+import routes
 from awsiot.greengrasscoreipc.clientv2 import GreengrassCoreIPCClientV2
 from awsiot.greengrasscoreipc.model import (
     BinaryMessage,
@@ -18,10 +25,67 @@ logging.basicConfig(level=logging.INFO)
 
 
 telemetry_topic = "$local/greengrass/telemetry"
+component_name = "com.offline.TelemetryInjector"
+
+# Logs once per telemetry message, so it is rate limited rather than written at the telemetry rate
+event_log = logutil.rate_limited("inject.events", per_second=1, burst=5)
+
+messages_in = metrics.REGISTRY.counter("injector_messages_in_total", "Telemetry messages received")
+messages_out = metrics.REGISTRY.counter("injector_messages_out_total", "Injected telemetry messages published")
+errors = metrics.REGISTRY.counter("injector_errors_total", "Telemetry messages that could not be injected")
+in_flight = metrics.REGISTRY.gauge("injector_in_flight", "Telemetry messages being injected")
+cli_seconds = metrics.REGISTRY.histogram("injector_cli_seconds", "Time to read the component states")
+encode_seconds = metrics.REGISTRY.histogram("injector_encode_seconds", "Time to encode the injected telemetry")
+publish_seconds = metrics.REGISTRY.histogram("injector_publish_seconds", "Time to publish the injected telemetry")
+queue_wait_seconds = metrics.REGISTRY.histogram(
+    "injector_queue_wait_seconds", "Time telemetry waited in the queue to be injected"
+)
+queue_depth = metrics.REGISTRY.gauge("injector_queue_depth", "Telemetry messages waiting to be injected")
+merged = metrics.REGISTRY.counter("injector_merged_total", "Telemetry messages injected together with another")
+dropped = metrics.REGISTRY.counter("injector_dropped_total", "Telemetry messages dropped because the queue was full")
+
+DROP = "drop"
+MERGE = "merge"
+# Messages merged into one queued batch before the oldest waiting messages are dropped instead, so a stalled worker
+# cannot grow the queue without bound
+DEFAULT_MAX_MERGED = 256
+
+
+def parse_args():
+    parser = ArgumentParser(description="Inject component states into the Greengrass telemetry")
+    parser.add_argument("injected_topic", help="The topic to publish the injected telemetry on")
+    parser.add_argument("--metrics_port", type=int, default=0, help="Serve Prometheus metrics on this port")
+    parser.add_argument(
+        "--self_telemetry_interval",
+        type=float,
+        default=0,
+        help="Seconds between publishing this component's metrics as telemetry, 0 to disable",
+    )
+    parser.add_argument("--log_format", choices=["text", "json"], default="text")
+    parser.add_argument("--queue_size", type=int, default=8, help="Telemetry messages that can wait to be injected")
+    parser.add_argument(
+        "--overflow",
+        choices=[DROP, MERGE],
+        default=MERGE,
+        help="When the queue is full, drop the oldest message or merge the new one into the newest",
+    )
+    parser.add_argument(
+        "--max_merged",
+        type=int,
+        default=DEFAULT_MAX_MERGED,
+        help="Messages merged into the newest before the oldest is dropped",
+    )
+    parser.add_argument(
+        "--routes",
+        default="",
+        help='More topics to publish projections of the telemetry on, e.g. [{"Topic": "t", "Projection": "status"}]',
+    )
+    return parser.parse_args()
 
 
 def inject_state_to_telemetry(telemetry_data: List[Dict], thing_name: str):
-    component_states = health.get_all_components_states()
+    with cli_seconds.time():
+        component_states = health.get_all_components_states()
     for c in component_states:
         telemetry_data.append(
             {
@@ -44,38 +108,172 @@ def inject_and_send_telemetry(
     ipc_client: GreengrassCoreIPCClientV2,
     telemetry_data: List[Dict[str, str]],
     thing_name: str,
-    injected_topic: str,
+    injected_routes: List[routes.Route],
 ):
     new_telemetry = inject_state_to_telemetry(telemetry_data, thing_name)
-    msg = PublishMessage(
-        binary_message=BinaryMessage(message=json.dumps(new_telemetry))
-    )
-    logging.info(f"publishing updated telemetry on topic {injected_topic}")
-    logging.debug(new_telemetry)
-    ipc_client.publish_to_topic(topic=injected_topic, publish_message=msg)
+    for route in injected_routes:
+        selected = route.select(new_telemetry)
+        if not selected and not route.passes_everything:
+            # Consumers of a projection have nothing to do with an empty one
+            continue
+        with encode_seconds.time():
+            msg = PublishMessage(
+                binary_message=BinaryMessage(message=json.dumps(selected))
+            )
+        event_log.info("publishing updated telemetry on topic %s", route.topic)
+        event_log.debug("%s", selected)
+        with publish_seconds.time():
+            ipc_client.publish_to_topic(topic=route.topic, publish_message=msg)
+        messages_out.inc()
 
 
-def relay_telemetry(
-    ipc_client: GreengrassCoreIPCClientV2, thing_name: str, injected_topic: str
-):
+class InjectionQueue:
+    """
+    Hands telemetry messages from the IPC callback to a worker thread, which decodes and injects them. All the
+    messages waiting when the worker becomes free are injected as one, so a burst costs one greengrass-cli call
+    and one publish per route instead of one per message.
+    """
+
+    def __init__(
+        self,
+        inject: Callable[[List[Dict]], None],
+        max_pending: int = 8,
+        overflow: str = MERGE,
+        max_merged: int = DEFAULT_MAX_MERGED,
+    ):
+        self.inject = inject
+        self.max_pending = max(max_pending, 1)
+        self.overflow = overflow
+        self.max_merged = max(max_merged, 1)
+        # (when the first message was queued, the messages); merged messages share an entry
+        self._pending: Deque[Tuple[float, List[bytes]]] = deque()
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="injector", daemon=True)
+        queue_depth.set_function(lambda: len(self._pending))
+
+    def start(self) -> "InjectionQueue":
+        self._thread.start()
+        return self
+
+    def submit(self, message: bytes) -> bool:
+        """Queue a message, returning False if it was dropped."""
+        with self._condition:
+            if self._stopped:
+                dropped.inc()
+                return False
+            if len(self._pending) >= self.max_pending:
+                if self.overflow == MERGE and len(self._pending[-1][1]) < self.max_merged:
+                    self._pending[-1][1].append(message)
+                    return True
+                _, oldest = self._pending.popleft()
+                dropped.inc(len(oldest))
+            self._pending.append((time.monotonic(), [message]))
+            self._condition.notify()
+            return True
+
+    def _take(self) -> Optional[List[Tuple[float, List[bytes]]]]:
+        with self._condition:
+            while not self._pending and not self._stopped:
+                self._condition.wait()
+            if not self._pending:
+                return None
+            batch = list(self._pending)
+            self._pending.clear()
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take()
+            if batch is None:
+                return
+            now = time.monotonic()
+            telemetry_data: List[Dict] = []
+            messages = 0
+            for queued, payloads in batch:
+                queue_wait_seconds.observe(now - queued)
+                for payload in payloads:
+                    messages += 1
+                    try:
+                        telemetry_data.extend(json.loads(payload.decode()))
+                    except ValueError as e:
+                        errors.inc()
+                        event_log.error("invalid telemetry message: %s", e)
+            if messages > 1:
+                merged.inc(messages)
+            in_flight.inc()
+            try:
+                self.inject(telemetry_data)
+            except Exception:
+                errors.inc()
+                event_log.error("failed to inject telemetry", exc_info=True)
+            finally:
+                in_flight.dec()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop taking messages, and inject those already queued before returning."""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+
+def relay_telemetry(ipc_client: GreengrassCoreIPCClientV2, injection_queue: InjectionQueue):
     def on_tel_event(e: SubscriptionResponseMessage):
+        messages_in.inc()
         if e.binary_message and e.binary_message.message:
-            telemetry_data = json.loads(e.binary_message.message.decode())
-            inject_and_send_telemetry(
-                ipc_client, telemetry_data, thing_name, injected_topic
-            )
+            # Decoding and injecting happen on the worker, so the IPC callback returns straight away
+            injection_queue.submit(e.binary_message.message)
         else:
-            logging.error(f"message cannot be None: {e}")
+            errors.inc()
+            event_log.error("message cannot be None: %s", e)
 
     logging.info(f"listening for telemetry on topic {telemetry_topic}")
-    ipc_client.subscribe_to_topic(topic=telemetry_topic, on_stream_event=on_tel_event)
+    _, operation = ipc_client.subscribe_to_topic(topic=telemetry_topic, on_stream_event=on_tel_event)
+    return operation
+
+
+def self_telemetry_publisher(ipc_client: GreengrassCoreIPCClientV2, topic: str):
+    def publish(points: List[Dict]):
+        msg = PublishMessage(binary_message=BinaryMessage(message=json.dumps(points)))
+        ipc_client.publish_to_topic(topic=topic, publish_message=msg)
+
+    return publish
 
 
 if __name__ == "__main__":
-    injected_telemetry_topic = sys.argv[1]
+    args = parse_args()
+    logutil.configure(json_format=args.log_format == "json")
     thing_name = os.environ["AWS_IOT_THING_NAME"]
+    ipc_client = GreengrassCoreIPCClientV2()
+    runner = lifecycle.Lifecycle()
+    runner.on_shutdown(logutil.flush)
+    runner.on_shutdown(ipc_client.close)
+
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+    if args.self_telemetry_interval > 0:
+        reporter = metrics.TelemetryReporter(
+            self_telemetry_publisher(ipc_client, args.injected_topic),
+            component_name,
+            thing_name,
+            args.self_telemetry_interval,
+        ).start()
+        # A last report, once no more telemetry is being received
+        runner.on_shutdown(reporter.report)
 
-    relay_telemetry(GreengrassCoreIPCClientV2(), thing_name, injected_telemetry_topic)
+    profiler.ProfilerControl(component_name).listen_v2(ipc_client)
+    injected_routes = routes.parse_routes(args.injected_topic, args.routes)
+    injection_queue = InjectionQueue(
+        lambda telemetry_data: inject_and_send_telemetry(ipc_client, telemetry_data, thing_name, injected_routes),
+        args.queue_size,
+        args.overflow,
+        args.max_merged,
+    ).start()
+    # Stopped after the subscription is closed, so what was already received is still injected
+    runner.on_shutdown(injection_queue.stop)
+    operation = relay_telemetry(ipc_client, injection_queue)
+    runner.on_shutdown(operation.close)
 
-    while True:
-        time.sleep(3)
+    runner.run()
@@ -0,0 +1,159 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+# Attributes every LogRecord has; anything else on a record came from `extra` and is kept in JSON output
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with any `extra` fields of the record as keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets at most `burst` records through per call site at once, refilled at `per_second`. The next record let
+    through from a call site reports how many were suppressed in between.
+    """
+
+    def __init__(self, per_second: float = 1.0, burst: int = 10):
+        super().__init__()
+        self.per_second = per_second
+        self.burst = burst
+        # (pathname, lineno) -> [tokens, last refill, suppressed]
+        self._sites: Dict[Tuple[str, int], list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        now = time.monotonic()
+        key = (record.pathname, record.lineno)
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None:
+                site = self._sites[key] = [float(self.burst), now, 0]
+            site[0] = min(self.burst, site[0] + (now - site[1]) * self.per_second)
+            site[1] = now
+            if site[0] < 1:
+                site[2] += 1
+                return False
+            site[0] -= 1
+            suppressed, site[2] = site[2], 0
+        if suppressed:
+            _annotate(record, "suppressed", suppressed)
+        return True
+
+
+class SampleFilter(logging.Filter):
+    """Lets through the first and then every `every`-th record of each call site."""
+
+    def __init__(self, every: int = 100):
+        super().__init__()
+        self.every = every
+        self._counts: Dict[Tuple[str, int], int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.pathname, record.lineno)
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+        if count % self.every:
+            return False
+        if count:
+            _annotate(record, "sampled", self.every)
+        return True
+
+
+def _annotate(record: logging.LogRecord, key: str, value: int):
+    # Kept as a field for JSON output and appended to the message for text output
+    setattr(record, key, value)
+    record.msg = f"{record.getMessage()} ({key} {value})"
+    record.args = None
+
+
+def _with_filter(name: str, log_filter: logging.Filter) -> logging.Logger:
+    logger = logging.getLogger(name)
+    if not any(type(f) is type(log_filter) for f in logger.filters):
+        logger.addFilter(log_filter)
+    return logger
+
+
+def rate_limited(name: str, per_second: float = 1.0, burst: int = 10) -> logging.Logger:
+    """A logger for hot paths that lets through at most `per_second` records per call site after a burst."""
+    return _with_filter(name, RateLimitFilter(per_second, burst))
+
+
+def sampled(name: str, every: int = 100) -> logging.Logger:
+    """A logger for hot paths that lets through one in `every` records per call site."""
+    return _with_filter(name, SampleFilter(every))
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # QueueHandler would format the message here, on the logging thread; the listener formats it instead.
+        # Arguments are therefore rendered when written, so loggers must not be handed objects that change later.
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+def configure(level: int = logging.INFO, json_format: bool = False, queue_size: int = 10000) -> None:
+    """
+    Route all logging through a bounded queue to a background thread that formats and writes to stdout, so
+    the calling thread never blocks on formatting or I/O. Records are dropped if the queue is full.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter() if json_format else logging.Formatter(TEXT_FORMAT))
+    log_queue = queue.Queue(maxsize=queue_size)
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(_DroppingQueueHandler(log_queue))
+    root.setLevel(level)
+    _listener.start()
+
+
+def flush() -> None:
+    """Write out everything queued and stop the background thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(flush)
@@ -0,0 +1,220 @@
+import collections
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Dict, Optional
+
+DEFAULT_INTERVAL_MS = 10
+DEFAULT_DURATION = 30
+# A forgotten profile must not keep sampling forever
+MAX_DURATION = 600
+
+CONFIGURATION_KEY = "Profiler"
+
+
+def control_topic(component_name: str) -> str:
+    return f"greengrass/profiler/{component_name}"
+
+
+def collapse(thread_name: str, frame) -> str:
+    """One stack in the collapsed format flamegraph.pl and speedscope read, outermost frame first."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    names.append(thread_name)
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+    """
+    Samples the stacks of every other thread at a fixed interval for a bounded time from a daemon thread,
+    then writes the counts as a collapsed stack file.
+    """
+
+    def __init__(
+        self,
+        output_dir: str,
+        prefix: str,
+        interval_ms: float = DEFAULT_INTERVAL_MS,
+        duration: float = DEFAULT_DURATION,
+    ):
+        self.output_dir = output_dir
+        self.prefix = prefix
+        self.interval = interval_ms / 1000
+        self.duration = min(duration, MAX_DURATION)
+        self.counts: Dict[str, int] = collections.Counter()
+        self.samples = 0
+        self.path: Optional[str] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self) -> "StackSampler":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """End sampling early; the profile is still written."""
+        self._stop.set()
+
+    def join(self, timeout: Optional[float] = None):
+        self._thread.join(timeout)
+
+    @property
+    def running(self) -> bool:
+        return self._thread.is_alive()
+
+    @property
+    def stopping(self) -> bool:
+        return self._stop.is_set()
+
+    def sample(self):
+        own = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident != own:
+                self.counts[collapse(names.get(ident, str(ident)), frame)] += 1
+        self.samples += 1
+
+    def _run(self):
+        deadline = time.monotonic() + self.duration
+        while time.monotonic() < deadline:
+            self.sample()
+            if self._stop.wait(self.interval):
+                break
+        try:
+            self.path = self.write()
+            logging.info(f"wrote {self.samples} profile samples to {self.path}")
+        except OSError as e:
+            logging.error(f"could not write profile: {e}")
+
+    def write(self) -> str:
+        path = os.path.join(self.output_dir, f"{self.prefix}-{time.strftime('%Y%m%dT%H%M%S')}.collapsed")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            for stack, count in sorted(self.counts.items()):
+                f.write(f"{stack} {count}\n")
+        os.replace(tmp_path, path)
+        return path
+
+
+class ProfilerControl:
+    """
+    Starts and stops a StackSampler on request, from a control message such as
+    {"action": "start", "durationSeconds": 30, "intervalMs": 10} or from the component's Profiler configuration.
+    """
+
+    def __init__(self, component_name: str, output_dir: str = "."):
+        # Greengrass starts components in their work directory, so profiles land there by default
+        self.component_name = component_name
+        self.output_dir = output_dir
+        self.sampler: Optional[StackSampler] = None
+        self._lock = threading.Lock()
+
+    def start(self, duration: float = DEFAULT_DURATION, interval_ms: float = DEFAULT_INTERVAL_MS) -> bool:
+        with self._lock:
+            if self.sampler is not None and self.sampler.running:
+                return False
+            logging.info(f"profiling for {duration}s every {interval_ms}ms")
+            self.sampler = StackSampler(self.output_dir, self.component_name, interval_ms, duration).start()
+            return True
+
+    def stop(self) -> bool:
+        with self._lock:
+            if self.sampler is None or not self.sampler.running or self.sampler.stopping:
+                return False
+            self.sampler.stop()
+            return True
+
+    def handle(self, request: Dict) -> bool:
+        action = request.get("action")
+        if action == "start":
+            return self.start(
+                float(request.get("durationSeconds", DEFAULT_DURATION)),
+                float(request.get("intervalMs", DEFAULT_INTERVAL_MS)),
+            )
+        if action == "stop":
+            return self.stop()
+        logging.warning(f"unknown profiler action: {action}")
+        return False
+
+    def apply_configuration(self, configuration: Optional[Dict]) -> bool:
+        """Start when Enabled is true and stop when it is false, from the Profiler configuration of the component."""
+        configuration = configuration or {}
+        enabled = str(configuration.get("Enabled", "false")).lower() == "true"
+        if enabled:
+            return self.start(
+                float(configuration.get("DurationSeconds", DEFAULT_DURATION)),
+                float(configuration.get("IntervalMs", DEFAULT_INTERVAL_MS)),
+            )
+        return self.stop()
+
+    def _on_control(self, event):
+        try:
+            if event.json_message is not None:
+                request = event.json_message.message
+            else:
+                request = json.loads(event.binary_message.message)
+            self.handle(request)
+        except Exception as e:
+            logging.error(f"invalid profiler request: {e}")
+
+    def _reload(self, get_configuration):
+        try:
+            self.apply_configuration(get_configuration())
+        except Exception as e:
+            logging.error(f"could not read the profiler configuration: {e}")
+
+    def listen_v2(self, ipc_client):
+        """
+        Listen for control messages on the control topic and for Profiler configuration updates, with a
+        GreengrassCoreIPCClientV2. Configuration updates reach a running component, so no restart is needed.
+        """
+
+        def get_configuration():
+            return ipc_client.get_configuration(key_path=[CONFIGURATION_KEY]).value
+
+        ipc_client.subscribe_to_topic(topic=control_topic(self.component_name), on_stream_event=self._on_control)
+        ipc_client.subscribe_to_configuration_update(
+            key_path=[CONFIGURATION_KEY], on_stream_event=lambda _: self._reload(get_configuration)
+        )
+        # The profiler may already be enabled in the configuration the component started with
+        self._reload(get_configuration)
+
+    def listen_v1(self, ipc_client, timeout: float = 10):
+        """The same as listen_v2, with a client from awsiot.greengrasscoreipc.connect()."""
+        import awsiot.greengrasscoreipc.client as client
+        from awsiot.greengrasscoreipc.model import (
+            GetConfigurationRequest,
+            SubscribeToConfigurationUpdateRequest,
+            SubscribeToTopicRequest,
+        )
+
+        control = self
+
+        def get_configuration():
+            operation = ipc_client.new_get_configuration()
+            operation.activate(GetConfigurationRequest(key_path=[CONFIGURATION_KEY]))
+            return operation.get_response().result(timeout).value
+
+        class ControlHandler(client.SubscribeToTopicStreamHandler):
+            def on_stream_event(self, event):
+                control._on_control(event)
+
+        class ConfigurationHandler(client.SubscribeToConfigurationUpdateStreamHandler):
+            def on_stream_event(self, event):
+                # The client delivers the GetConfiguration response on the thread running this callback, so the
+                # reload waits for it from a thread of its own
+                threading.Thread(
+                    target=control._reload, args=(get_configuration,), name="profiler-configuration", daemon=True
+                ).start()
+
+        operation = ipc_client.new_subscribe_to_topic(ControlHandler())
+        operation.activate(SubscribeToTopicRequest(topic=control_topic(self.component_name))).result(timeout)
+        operation = ipc_client.new_subscribe_to_configuration_update(ConfigurationHandler())
+        operation.activate(SubscribeToConfigurationUpdateRequest(key_path=[CONFIGURATION_KEY])).result(timeout)
+        self._reload(get_configuration)
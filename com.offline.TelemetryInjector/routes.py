@@ -0,0 +1,98 @@
+import fnmatch
+import json
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+FULL = "full"
+STATUS = "status"
+FILTERED = "filtered"
+
+STATUS_NAMESPACE = "ComponentStatus"
+# What the alarm needs from a status point, including which device it came from; units and aggregation are the
+# same in every one
+STATUS_FIELDS = ("NS", "N", "V", "TS", "thing_name")
+
+# Names seen on a device are few, but a misbehaving sender must not grow the cache without bound
+MAX_CACHE_SIZE = 10000
+
+
+def _compile(patterns: Optional[Sequence[str]]) -> Optional["re.Pattern"]:
+    if not patterns:
+        return None
+    return re.compile("|".join(f"(?:{fnmatch.translate(p)})" for p in patterns))
+
+
+class Route:
+    """
+    One topic the injected telemetry is published on, and which of its points, with which fields, go there.
+    Points are matched on "NS/N" with shell-style patterns, e.g. "SystemMetrics/*".
+    """
+
+    def __init__(
+        self,
+        topic: str,
+        include: Optional[Sequence[str]] = None,
+        exclude: Optional[Sequence[str]] = None,
+        fields: Optional[Sequence[str]] = None,
+    ):
+        self.topic = topic
+        self.include = _compile(include)
+        self.exclude = _compile(exclude)
+        self.fields = tuple(fields) if fields else None
+        self._decisions: Dict[Tuple[str, str], bool] = {}
+
+    @classmethod
+    def full(cls, topic: str) -> "Route":
+        return cls(topic)
+
+    @classmethod
+    def status(cls, topic: str) -> "Route":
+        return cls(topic, include=[f"{STATUS_NAMESPACE}/*"], fields=STATUS_FIELDS)
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "Route":
+        projection = config.get("Projection", FULL)
+        if projection == FULL:
+            return cls.full(config["Topic"])
+        if projection == STATUS:
+            return cls.status(config["Topic"])
+        if projection == FILTERED:
+            return cls(config["Topic"], config.get("Include"), config.get("Exclude"), config.get("Fields"))
+        raise ValueError(f"unknown projection {projection} for route {config['Topic']}")
+
+    @property
+    def passes_everything(self) -> bool:
+        return self.include is None and self.exclude is None and self.fields is None
+
+    def matches(self, namespace: str, name: str) -> bool:
+        key = (namespace, name)
+        decision = self._decisions.get(key)
+        if decision is None:
+            path = f"{namespace}/{name}"
+            decision = (self.include is None or bool(self.include.match(path))) and not (
+                self.exclude is not None and self.exclude.match(path)
+            )
+            if len(self._decisions) >= MAX_CACHE_SIZE:
+                self._decisions.clear()
+            self._decisions[key] = decision
+        return decision
+
+    def select(self, points: List[Dict]) -> List[Dict]:
+        """The points of a telemetry message this route publishes, projected to its fields."""
+        if self.passes_everything:
+            return points
+        selected = [p for p in points if self.matches(p["NS"], p["N"])]
+        if self.fields is not None:
+            selected = [{k: p[k] for k in self.fields if k in p} for p in selected]
+        return selected
+
+
+def parse_routes(injected_topic: str, config: str = "") -> List[Route]:
+    """
+    The full route on injected_topic, followed by those of the Routes configuration, a JSON list such as
+    [{"Topic": "injected/greengrass/status", "Projection": "status"}].
+    """
+    routes = [Route.full(injected_topic)]
+    if config and config.strip():
+        routes.extend(Route.from_config(c) for c in json.loads(config))
+    return routes
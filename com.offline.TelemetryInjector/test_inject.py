@@ -1,5 +1,8 @@
+import json
+
 import inject
 import pytest
+import routes
 
 
 class TestInjectState:
@@ -25,3 +28,99 @@ class TestInjectState:
 
         injected = inject.inject_state_to_telemetry([], "thing-name-0")
         assert len(injected) == len(mock_component_states())
+
+
+class TestInjectMetrics:
+    def test_counts_published_messages(self, mocker):
+        mocker.patch("health.get_all_components_states", return_value=[])
+        ipc_client = mocker.Mock()
+        before = inject.messages_out.value
+
+        inject.inject_and_send_telemetry(ipc_client, [], "thing", [routes.Route.full("topic")])
+        assert inject.messages_out.value == before + 1
+        assert inject.publish_seconds.count > 0
+
+
+class TestInjectRoutes:
+    def test_publishes_a_projection_per_route(self, mocker):
+        mocker.patch("health.get_all_components_states", return_value=[{"name": "a", "state": "BROKEN"}])
+        ipc_client = mocker.Mock()
+        telemetry = [{"NS": "SystemMetrics", "N": "CpuUsage", "U": "Percent", "A": "Average", "V": 1.5, "TS": 1}]
+
+        inject.inject_and_send_telemetry(
+            ipc_client,
+            telemetry,
+            "thing",
+            routes.parse_routes("full", '[{"Topic": "status", "Projection": "status"}]'),
+        )
+
+        published = {
+            c.kwargs["topic"]: json.loads(c.kwargs["publish_message"].binary_message.message)
+            for c in ipc_client.publish_to_topic.call_args_list
+        }
+        assert len(published["full"]) == 2
+        assert published["status"] == [
+            {"NS": "ComponentStatus", "N": "a", "V": "BROKEN", "TS": published["full"][1]["TS"], "thing_name": "thing"}
+        ]
+
+
+class TestInjectionQueue:
+    def test_waiting_messages_are_injected_together(self, mocker):
+        inject_batch = mocker.Mock()
+        queue = inject.InjectionQueue(inject_batch, max_pending=8)
+        for i in range(3):
+            assert queue.submit(json.dumps([{"N": str(i)}]).encode())
+
+        queue.start().stop(timeout=5)
+
+        inject_batch.assert_called_once_with([{"N": "0"}, {"N": "1"}, {"N": "2"}])
+
+    def test_merges_into_the_newest_message_when_full(self, mocker):
+        inject_batch = mocker.Mock()
+        queue = inject.InjectionQueue(inject_batch, max_pending=1, overflow=inject.MERGE)
+        before = inject.dropped.value
+        for i in range(3):
+            queue.submit(json.dumps([{"N": str(i)}]).encode())
+
+        queue.start().stop(timeout=5)
+
+        inject_batch.assert_called_once_with([{"N": "0"}, {"N": "1"}, {"N": "2"}])
+        assert inject.dropped.value == before
+
+    def test_drops_the_oldest_messages_once_the_merged_batch_is_full(self, mocker):
+        inject_batch = mocker.Mock()
+        queue = inject.InjectionQueue(inject_batch, max_pending=2, overflow=inject.MERGE, max_merged=2)
+        before = inject.dropped.value
+        for i in range(5):
+            queue.submit(json.dumps([{"N": str(i)}]).encode())
+
+        queue.start().stop(timeout=5)
+
+        # 0 waits alone, 1 and 2 merge; 3 drops 0 and starts a batch that 4 merges into
+        inject_batch.assert_called_once_with([{"N": "1"}, {"N": "2"}, {"N": "3"}, {"N": "4"}])
+        assert inject.dropped.value == before + 1
+
+    def test_drops_the_oldest_message_when_full(self, mocker):
+        inject_batch = mocker.Mock()
+        queue = inject.InjectionQueue(inject_batch, max_pending=2, overflow=inject.DROP)
+        before = inject.dropped.value
+        for i in range(3):
+            queue.submit(json.dumps([{"N": str(i)}]).encode())
+
+        queue.start().stop(timeout=5)
+
+        inject_batch.assert_called_once_with([{"N": "1"}, {"N": "2"}])
+        assert inject.dropped.value == before + 1
+
+    def test_invalid_messages_are_skipped(self, mocker):
+        inject_batch = mocker.Mock()
+        queue = inject.InjectionQueue(inject_batch)
+        before = inject.errors.value
+        queue.submit(b"not json")
+        queue.submit(b'[{"N": "a"}]')
+
+        queue.start().stop(timeout=5)
+
+        inject_batch.assert_called_once_with([{"N": "a"}])
+        assert inject.errors.value == before + 1
+        assert not queue.submit(b"[]")
@@ -0,0 +1,73 @@
+import os
+import signal
+import threading
+
+import lifecycle
+import pytest
+
+
+@pytest.fixture
+def restore_signals():
+    handlers = {s: signal.getsignal(s) for s in (signal.SIGTERM, signal.SIGINT)}
+    yield
+    for s, handler in handlers.items():
+        signal.signal(s, handler)
+
+
+class TestScheduler:
+    def test_runs_due_callbacks_in_order(self):
+        scheduler = lifecycle.Scheduler()
+        calls = []
+        done = threading.Event()
+        scheduler.call_later(0.02, lambda: (calls.append("second"), done.set()))
+        scheduler.call_later(0.01, lambda: calls.append("first"))
+        assert done.wait(5)
+        scheduler.stop()
+        assert calls == ["first", "second"]
+
+    def test_every_repeats_and_survives_failures(self):
+        scheduler = lifecycle.Scheduler()
+        calls = []
+        done = threading.Event()
+
+        def tick():
+            calls.append(1)
+            if len(calls) == 3:
+                done.set()
+            raise RuntimeError("task failed")
+
+        scheduler.every(0.01, tick, run_now=True)
+        assert done.wait(5)
+        scheduler.stop()
+
+
+class TestLifecycle:
+    def test_sigterm_runs_hooks_in_reverse(self, restore_signals):
+        runner = lifecycle.Lifecycle()
+        calls = []
+        runner.on_shutdown(lambda: calls.append("first added"))
+        runner.on_shutdown(lambda: calls.append("last added"))
+        threading.Timer(0.05, os.kill, (os.getpid(), signal.SIGTERM)).start()
+
+        assert runner.run(timeout=5)
+        assert calls == ["last added", "first added"]
+
+    def test_failing_hook_does_not_stop_others(self, restore_signals):
+        runner = lifecycle.Lifecycle()
+        calls = []
+        runner.on_shutdown(lambda: calls.append("ran"))
+
+        def fail():
+            raise RuntimeError("close failed")
+
+        runner.on_shutdown(fail, "fail")
+        runner.shutdown()
+        assert runner.run()
+        assert calls == ["ran"]
+
+    def test_timeout_without_shutdown(self, restore_signals):
+        runner = lifecycle.Lifecycle()
+        ticks = threading.Event()
+        runner.every(0.01, ticks.set)
+        assert not runner.run(timeout=0.1)
+        assert ticks.is_set()
@@ -0,0 +1,88 @@
+import json
+import logging
+
+import logutil
+import pytest
+
+
+def record(msg="hello %s", args=("world",), lineno=1, **extra):
+    r = logging.LogRecord("test", logging.INFO, "file.py", lineno, msg, args, None)
+    for key, value in extra.items():
+        setattr(r, key, value)
+    return r
+
+
+class TestRateLimitFilter:
+    def test_suppresses_after_burst_and_reports_count(self, mocker):
+        now = mocker.patch("time.monotonic", return_value=100.0)
+        f = logutil.RateLimitFilter(per_second=1, burst=2)
+        assert [f.filter(record()) for _ in range(4)] == [True, True, False, False]
+
+        now.return_value = 101.0
+        passed = record()
+        assert f.filter(passed)
+        assert passed.suppressed == 2
+        assert passed.getMessage() == "hello world (suppressed 2)"
+
+    def test_call_sites_are_limited_separately(self):
+        f = logutil.RateLimitFilter(per_second=0.001, burst=1)
+        assert f.filter(record(lineno=1))
+        assert not f.filter(record(lineno=1))
+        assert f.filter(record(lineno=2))
+
+
+class TestSampleFilter:
+    def test_passes_every_nth(self):
+        f = logutil.SampleFilter(every=3)
+        results = [f.filter(record()) for _ in range(7)]
+        assert results == [True, False, False, True, False, False, True]
+
+
+class TestJsonFormatter:
+    def test_includes_extra_fields_and_exceptions(self):
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            import sys
+
+            r = record(topic="t")
+            r.exc_info = sys.exc_info()
+        entry = json.loads(logutil.JsonFormatter().format(r))
+        assert entry["message"] == "hello world"
+        assert entry["topic"] == "t"
+        assert entry["level"] == "INFO"
+        assert "ValueError: boom" in entry["exception"]
+
+
+class TestConfigure:
+    @pytest.fixture(autouse=True)
+    def restore_root(self):
+        root = logging.getLogger()
+        handlers, level = list(root.handlers), root.level
+        yield
+        logutil.flush()
+        root.handlers = handlers
+        root.setLevel(level)
+
+    def test_logs_through_queue_as_json(self, capsys):
+        logutil.configure(json_format=True)
+        logging.getLogger("configured").info("queued %d", 1)
+        logutil.flush()
+        entry = json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+        assert entry["message"] == "queued 1"
+        assert entry["logger"] == "configured"
+
+    def test_full_queue_drops_records(self, capsys):
+        logutil.configure(queue_size=1)
+        logutil._listener.stop()
+        logging.getLogger("configured").info("first")
+        logging.getLogger("configured").info("dropped")
+        logutil._listener.start()
+        logutil.flush()
+        out = capsys.readouterr().out
+        assert "first" in out and "dropped" not in out
+
+    def test_rate_limited_logger_gets_one_filter(self):
+        logger = logutil.rate_limited("limited")
+        assert logutil.rate_limited("limited") is logger
+        assert len(logger.filters) == 1
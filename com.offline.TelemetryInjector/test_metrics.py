@@ -0,0 +1,87 @@
+import urllib.request
+
+import metrics
+import pytest
+
+
+@pytest.fixture
+def registry():
+    return metrics.Registry()
+
+
+class TestMetrics:
+    def test_counter_and_gauge(self, registry):
+        c = registry.counter("messages_total", "Messages")
+        c.inc()
+        c.inc(2)
+        g = registry.gauge("depth", "Depth")
+        g.set(5)
+        g.dec()
+        assert c.value == 3
+        assert g.value == 4
+
+        g.set_function(lambda: 7)
+        assert g.value == 7
+
+    def test_registry_returns_existing_metric(self, registry):
+        assert registry.counter("a", "A", topic="t") is registry.counter("a", "A", topic="t")
+        assert registry.counter("a", "A", topic="t") is not registry.counter("a", "A", topic="u")
+        with pytest.raises(ValueError):
+            registry.gauge("a", "A", topic="t")
+
+    def test_histogram_buckets(self, registry):
+        h = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+        for v in (0.05, 0.1, 0.5, 3):
+            h.observe(v)
+        samples = {(name, extra): value for name, extra, value in h.samples()}
+        assert samples[("latency_seconds_bucket", (("le", "0.1"),))] == 2
+        assert samples[("latency_seconds_bucket", (("le", "1.0"),))] == 3
+        assert samples[("latency_seconds_bucket", (("le", "+Inf"),))] == 4
+        assert samples[("latency_seconds_count", ())] == 4
+        assert h.sum == pytest.approx(3.65)
+
+    def test_histogram_timer(self, registry):
+        h = registry.histogram("op_seconds", "Op")
+        with h.time():
+            pass
+        assert h.count == 1
+
+    def test_render_prometheus(self, registry):
+        registry.counter("relayed_total", "Relayed messages", topic='a"b').inc()
+        registry.counter("relayed_total", "Relayed messages", topic="c").inc(2)
+        text = registry.render_prometheus()
+        assert text.count("# TYPE relayed_total counter") == 1
+        assert 'relayed_total{topic="a\\"b"} 1' in text
+        assert 'relayed_total{topic="c"} 2' in text
+
+    def test_to_telemetry(self, registry):
+        registry.counter("relayed_total", "Relayed", topic="t").inc()
+        registry.histogram("write_seconds", "Writes").observe(0.5)
+        points = {p["N"]: p for p in registry.to_telemetry("ns", "thing", ts_ms=1000)}
+        assert set(points) == {"relayed_total.t", "write_seconds_count", "write_seconds_sum"}
+        assert points["relayed_total.t"]["V"] == 1.0
+        assert points["write_seconds_sum"]["thing_name"] == "thing"
+        assert all(p["NS"] == "ns" and p["TS"] == 1000 for p in points.values())
+
+    def test_serve(self, registry):
+        registry.counter("served_total", "Served").inc()
+        server = metrics.serve(0, registry)
+        try:
+            url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+            body = urllib.request.urlopen(url, timeout=5).read().decode()
+            assert "served_total 1" in body
+        finally:
+            server.shutdown()
+
+    def test_reporter_publishes_points(self, registry):
+        registry.counter("reported_total", "Reported").inc()
+        published = []
+        reporter = metrics.TelemetryReporter(published.append, "ns", "thing", registry=registry)
+        reporter.report()
+        assert published[0][0]["N"] == "reported_total"
+
+    def test_reporter_survives_publish_errors(self, registry):
+        def fail(_):
+            raise RuntimeError("ipc closed")
+
+        metrics.TelemetryReporter(fail, "ns", "thing", registry=registry).report()
@@ -0,0 +1,89 @@
+import json
+import threading
+
+import profiler
+import pytest
+from awsiot.greengrasscoreipc.model import (
+    BinaryMessage,
+    JsonMessage,
+    SubscriptionResponseMessage,
+)
+
+
+def busy(stop: threading.Event):
+    while not stop.is_set():
+        stop.wait(0.001)
+
+
+class TestStackSampler:
+    def test_samples_other_threads_and_writes_collapsed_stacks(self, tmp_path):
+        stop = threading.Event()
+        worker = threading.Thread(target=busy, args=(stop,), name="worker")
+        worker.start()
+        try:
+            sampler = profiler.StackSampler(str(tmp_path), "test", interval_ms=1, duration=0.05).start()
+            sampler.join(5)
+        finally:
+            stop.set()
+            worker.join()
+
+        assert sampler.samples > 0
+        lines = open(sampler.path).read().splitlines()
+        worker_stacks = [line for line in lines if line.startswith("worker;")]
+        assert any("test_profiler.py:busy" in line for line in worker_stacks)
+        assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+        assert not any("profiler.py:_run" in line for line in lines)
+
+    def test_duration_is_bounded(self, tmp_path):
+        assert profiler.StackSampler(str(tmp_path), "test", duration=10 ** 6).duration == profiler.MAX_DURATION
+
+
+class TestProfilerControl:
+    @pytest.fixture
+    def control(self, tmp_path):
+        control = profiler.ProfilerControl("com.test", str(tmp_path))
+        yield control
+        control.stop()
+
+    def test_start_once_and_stop(self, control):
+        assert control.handle({"action": "start", "durationSeconds": 10, "intervalMs": 1})
+        assert not control.handle({"action": "start"})
+        assert control.handle({"action": "stop"})
+        control.sampler.join(5)
+        assert control.sampler.path.endswith(".collapsed")
+        assert not control.handle({"action": "unknown"})
+
+    def test_apply_configuration(self, control):
+        assert control.apply_configuration({"Enabled": True, "DurationSeconds": 10})
+        assert control.apply_configuration({"Enabled": "false"})
+        assert not control.apply_configuration(None)
+
+    def test_listen_v2_subscribes_and_applies_configuration(self, control, mocker):
+        ipc_client = mocker.Mock()
+        ipc_client.get_configuration.return_value.value = {"Enabled": False}
+        control.listen_v2(ipc_client)
+
+        ipc_client.subscribe_to_topic.assert_called_once()
+        assert ipc_client.subscribe_to_topic.call_args.kwargs["topic"] == "greengrass/profiler/com.test"
+        ipc_client.get_configuration.assert_called_once_with(key_path=["Profiler"])
+
+        on_control = ipc_client.subscribe_to_topic.call_args.kwargs["on_stream_event"]
+        on_control(SubscriptionResponseMessage(json_message=JsonMessage(message={"action": "start"})))
+        assert control.sampler.running
+        on_control(SubscriptionResponseMessage(
+            binary_message=BinaryMessage(message=json.dumps({"action": "stop"}).encode())
+        ))
+        control.sampler.join(5)
+        assert not control.sampler.running
+
+        ipc_client.get_configuration.return_value.value = {"Enabled": True}
+        ipc_client.subscribe_to_configuration_update.call_args.kwargs["on_stream_event"](None)
+        assert control.sampler.running
+
+    def test_bad_requests_are_logged(self, control, mocker):
+        ipc_client = mocker.Mock()
+        ipc_client.get_configuration.side_effect = RuntimeError("not authorized")
+        control.listen_v2(ipc_client)
+        on_control = ipc_client.subscribe_to_topic.call_args.kwargs["on_stream_event"]
+        on_control(SubscriptionResponseMessage(binary_message=BinaryMessage(message=b"not json")))
+        assert control.sampler is None
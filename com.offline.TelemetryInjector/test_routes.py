@@ -0,0 +1,38 @@
+import pytest
+import routes
+
+telemetry = [
+    {"NS": "SystemMetrics", "N": "CpuUsage", "U": "Percent", "A": "Average", "V": 1.5, "TS": 1, "thing_name": "t"},
+    {"NS": "SystemMetrics", "N": "TotalNumberOfFDs", "U": "Count", "A": "Count", "V": 7, "TS": 1, "thing_name": "t"},
+    {"NS": "ComponentStatus", "N": "a", "U": "None", "A": "None", "V": "RUNNING", "TS": 1, "thing_name": "t"},
+]
+
+
+class TestRoute:
+    def test_full_route_publishes_the_message_as_is(self):
+        assert routes.Route.full("t").select(telemetry) is telemetry
+
+    def test_status_route_is_compact(self):
+        assert routes.Route.status("t").select(telemetry) == [
+            {"NS": "ComponentStatus", "N": "a", "V": "RUNNING", "TS": 1, "thing_name": "t"}
+        ]
+
+    def test_filtered_route(self):
+        route = routes.Route.from_config(
+            {"Topic": "t", "Projection": "filtered", "Include": ["SystemMetrics/*"], "Exclude": ["*/TotalNumberOfFDs"]}
+        )
+        assert route.select(telemetry) == telemetry[:1]
+
+    def test_unknown_projection(self):
+        with pytest.raises(ValueError):
+            routes.Route.from_config({"Topic": "t", "Projection": "sampled"})
+
+
+class TestParseRoutes:
+    def test_full_route_comes_first(self):
+        parsed = routes.parse_routes("full", '[{"Topic": "status", "Projection": "status"}]')
+        assert [r.topic for r in parsed] == ["full", "status"]
+        assert parsed[0].passes_everything
+
+    def test_no_configured_routes(self):
+        assert [r.topic for r in routes.parse_routes("full", "")] == ["full"]